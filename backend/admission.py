@@ -0,0 +1,162 @@
+"""
+Admission control and backpressure for the analysis routes
+Each route gets a concurrency limit and a bounded wait queue. Requests that
+would overflow the queue are rejected immediately with 429, and requests that
+wait longer than the queue timeout get 503; both carry Retry-After.
+
+Configuration:
+- ADMISSION_CONTROL=0 disables admission control
+- ADMISSION_LIMITS: inline JSON or a path to a JSON file overriding the defaults, e.g.
+  {"/speech-to-text": {"max_concurrency": 2, "max_queue": 4, "queue_timeout": 60}}
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+import metrics
+
+DEFAULT_LIMITS = {
+    "/speech-to-text": {"max_concurrency": 4, "max_queue": 8, "queue_timeout": 60.0},
+    "/image-analysis": {"max_concurrency": 8, "max_queue": 16, "queue_timeout": 30.0},
+    "/image-analysis/binary": {"max_concurrency": 8, "max_queue": 16, "queue_timeout": 30.0},
+    "/text-analysis": {"max_concurrency": 16, "max_queue": 32, "queue_timeout": 15.0},
+}
+
+IN_FLIGHT = metrics.gauge('admission_in_flight', 'Requests currently being processed per route')
+QUEUE_DEPTH = metrics.gauge('admission_queue_depth', 'Requests waiting for a slot per route')
+CONCURRENCY_LIMIT = metrics.gauge('admission_concurrency_limit', 'Configured concurrency limit per route')
+REJECTIONS = metrics.counter('admission_rejections_total', 'Requests shed by admission control')
+QUEUE_WAIT = metrics.histogram('admission_queue_wait_seconds', 'Time admitted requests spent queued')
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of admitted."""
+    def __init__(self, message, status_code, reason, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteAdmission:
+    """Concurrency limit with a bounded FIFO wait queue for one route."""
+    def __init__(self, route, max_concurrency, max_queue, queue_timeout):
+        self.route = route
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters = deque()
+        # Moving average of service time, used to estimate Retry-After
+        self.service_time = 1.0
+        CONCURRENCY_LIMIT.set(max_concurrency, route=route)
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up for a new request."""
+        backlog = len(self.waiters) + 1
+        return max(1, math.ceil(self.service_time * backlog / self.max_concurrency))
+
+    def _update_gauges(self):
+        IN_FLIGHT.set(self.active, route=self.route)
+        QUEUE_DEPTH.set(len(self.waiters), route=self.route)
+
+    async def acquire(self):
+        """Takes a slot, waiting in the queue if needed. Raises AdmissionRejected."""
+        if self.active < self.max_concurrency and not self.waiters:
+            self.active += 1
+            self._update_gauges()
+            return 0.0
+
+        if len(self.waiters) >= self.max_queue:
+            raise AdmissionRejected(f"Too many requests queued for {self.route}, retry later",
+                                    status_code=429, reason='queue_full', retry_after=self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._update_gauges()
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected(f"Timed out waiting for capacity on {self.route}, retry later",
+                                    status_code=503, reason='queue_timeout', retry_after=self.retry_after())
+        except BaseException:
+            # Cancelled after a slot was handed over: pass the slot on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self._update_gauges()
+        return time.perf_counter() - queued_at
+
+    def release(self, service_time=None):
+        """Frees a slot, handing it straight to the next queued request if there is one."""
+        if service_time is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * service_time
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter, so active stays the same
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+
+def load_limits():
+    """Merges ADMISSION_LIMITS (inline JSON or file path) over the default limits."""
+    limits = {route: dict(limit) for route, limit in DEFAULT_LIMITS.items()}
+    raw = os.getenv('ADMISSION_LIMITS', '').strip()
+    if raw:
+        if raw.startswith('{'):
+            overrides = json.loads(raw)
+        else:
+            with open(raw, 'r', encoding='utf-8') as f:
+                overrides = json.load(f)
+        for route, limit in overrides.items():
+            limits.setdefault(route, dict(DEFAULT_LIMITS.get(route, {}))).update(limit)
+    return limits
+
+
+def install(app):
+    """Adds admission control in front of the configured routes."""
+    if os.getenv('ADMISSION_CONTROL', '1').lower() in ('0', 'false', 'no'):
+        return
+
+    routes = {
+        route: RouteAdmission(
+            route,
+            max_concurrency=int(limit.get('max_concurrency', 8)),
+            max_queue=int(limit.get('max_queue', 16)),
+            queue_timeout=float(limit.get('queue_timeout', 30.0))
+        )
+        for route, limit in load_limits().items()
+    }
+
+    @app.middleware("http")
+    async def admit_request(request, call_next):
+        admission = routes.get(request.url.path)
+        if admission is None or request.method != 'POST':
+            return await call_next(request)
+
+        try:
+            waited = await admission.acquire()
+        except AdmissionRejected as e:
+            REJECTIONS.inc(route=admission.route, reason=e.reason)
+            return JSONResponse(status_code=e.status_code, content={"success": False, "error": str(e)},
+                                headers={'Retry-After': str(e.retry_after)})
+
+        QUEUE_WAIT.observe(waited, route=admission.route)
+        started = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            admission.release(time.perf_counter() - started)
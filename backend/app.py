@@ -2,23 +2,51 @@
 FastAPI Application for Video Speech-to-Text Processing
 Accepts base64-encoded video files and returns transcribed text
 """
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-import base64
-import tempfile
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import contextvars
 import os
 from datetime import datetime
+from typing import Optional
 from speech_to_text import MP4ToTextPipeline
 from text_checker import process_text_content  
-from image_checker import process_base64_image_and_get_analysis
+from image_checker import process_base64_image_and_get_analysis, process_image_bytes_and_get_analysis, detect_image_format
+import profiling
+import memory_guard
+import admission
+import metrics
+import json_backend
+from single_flight import SingleFlight, content_key
+from aws_clients import get_startup_mode, prewarm_clients
+import media_offload
+import job_store
+import transcribe_events
+import retention
+import video_analysis
+import progress
+import compression
+import usage
+import tiers
+import cancellation
+import idempotency
+import scheduler
 import uvicorn
 
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered through json_backend (orjson when available)"""
+    def render(self, content):
+        return json_backend.dumps(content)
+
 # Create FastAPI instance
 app = FastAPI(
     title="Video Speech-to-Text API",
     description="API for converting video files to text using AWS Transcribe",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware to allow frontend connections
@@ -30,21 +58,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in CPU profiling (no-op unless PROFILING_ENABLED=1)
+profiling.install(app)
+
+# Idempotency-Key: retries attach to the running request or get its stored response.
+# Inside admission and the memory budget, so the body is buffered only for admitted requests
+idempotency.install(app, ["/speech-to-text", "/text-analysis", "/image-analysis", "/image-analysis/binary"])
+
+# Memory high-water marks and per-worker memory budget for the analysis routes
+memory_guard.install(app, ["/speech-to-text", "/text-analysis", "/image-analysis", "/image-analysis/binary"])
+
+# Per-request token, Transcribe and S3 usage with cost estimates
+usage.install(app, ["/speech-to-text", "/text-analysis", "/image-analysis", "/image-analysis/binary"])
+
+# Priority class (X-Priority) and tenant for scheduling the upstream AWS calls
+scheduler.install(app, ["/speech-to-text", "/text-analysis", "/image-analysis", "/image-analysis/binary"])
+
+# WebSocket progress events for /speech-to-text jobs
+progress.install(app)
+
+# Request deadlines (X-Request-Timeout) and cancelling work when the client disconnects
+cancellation.install(app, ["/speech-to-text", "/text-analysis", "/image-analysis", "/image-analysis/binary"])
+
+# Per-route concurrency limits and bounded queues; outside the pipeline layers so it sheds load first
+admission.install(app)
+
+# gzip/zstd request bodies and responses; outermost. Bodies decode as they are read, so shed ones never do
+compression.install(app)
+
 # Request models
 class SpeechToTextRequest(BaseModel):
     video_base64: str
     language_code: str = None  # Optional language code (e.g., 'en-US', 'es-ES')
     filename: str = "video.mp4"  # Optional filename
     use_bedrock: bool = False  # Whether to process with Bedrock flow
+    job_id: str = None  # Optional client-chosen id, to fetch the result from /jobs/{id} if the connection drops
+    wait: bool = True  # False: return the job id as soon as transcription has started
+    multimodal: bool = False  # Also describe sampled keyframes with Nova and include them in the Bedrock analysis
+    include_usage: bool = False  # Return the tokens, audio seconds and estimated cost of the request
+    tier: str = None  # Latency tier: fast, balanced or thorough (default LATENCY_TIER)
 
 class TextAnalysisRequest(BaseModel):
     text_content: str
     country: str = "Malaysia"  # Country context for analysis
+    include_usage: bool = False  # Return the tokens and estimated cost of the request
+    tier: str = None  # Latency tier: fast, balanced or thorough (default LATENCY_TIER)
 
 class ImageAnalysisRequest(BaseModel):
     image_base64: str
     image_format: str  # jpeg, png, webp, gif
     country: str = "Malaysia"  # Country context for analysis
+    include_usage: bool = False  # Return the tokens and estimated cost of the request
+    tier: str = None  # Latency tier: fast, balanced or thorough (default LATENCY_TIER)
 
 class BedrockResult(BaseModel):
     success: bool
@@ -57,14 +122,31 @@ class SpeechToTextResponse(BaseModel):
     success: bool
     text: str = None
     language_info: str = None
-    bedrock_analysis: dict = None  # Bedrock analysis result
+    bedrock_analysis: Optional[dict] = None  # Bedrock analysis result
     error: str = None
+    job_id: str = None
+    state: str = None
+    keyframes: Optional[list] = None  # Keyframe descriptions for multimodal requests
+    usage: Optional[dict] = None  # Usage and estimated cost, when include_usage is set
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    state: str  # uploading, transcribing, analyzing, completed, failed
+    filename: Optional[str] = None
+    use_bedrock: bool = False
+    job_name: Optional[str] = None
+    video_key: Optional[str] = None
+    result: Optional[dict] = None  # text, language_info, bedrock_analysis and usage once completed
+    error: Optional[str] = None
+    created_at: str = None
+    updated_at: str = None
 
 class TextAnalysisResponse(BaseModel):
     success: bool
     analysis_result: dict = None
     error: str = None
     processing_time: float = None
+    usage: Optional[dict] = None  # Usage and estimated cost, when include_usage is set
 
 class ImageAnalysisResponse(BaseModel):
     success: bool
@@ -72,6 +154,113 @@ class ImageAnalysisResponse(BaseModel):
     image_description: str = None
     error: str = None
     processing_time: float = None
+    usage: Optional[dict] = None  # Usage and estimated cost, when include_usage is set
+
+# Concurrent identical analyses share one upstream call
+text_analysis_flights = SingleFlight("/text-analysis")
+image_analysis_flights = SingleFlight("/image-analysis")
+
+def _resolve_tier(tier):
+    """Returns the name of the requested (or default) latency tier; 400 for an unknown one."""
+    try:
+        return tiers.get(tier)['name']
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def _usage_summary(include_usage):
+    recorder = usage.current()
+    return recorder.summary() if include_usage and recorder else None
+
+async def run_blocking(func, *args):
+    """
+    Runs blocking pipeline work in the threadpool so the event loop keeps
+    serving other requests while AWS calls are in flight
+    """
+    context = contextvars.copy_context()
+
+    def call():
+        with profiling.track_thread():
+            return func(*args)
+
+    return await run_in_threadpool(context.run, call)
+
+async def run_collection(func, *args):
+    """
+    Runs a background job collection on job_store's executor rather than the
+    threadpool: it holds its thread for the whole Transcribe wait
+    """
+    def call():
+        with profiling.track_thread():
+            return func(*args)
+
+    return await asyncio.wrap_future(job_store.submit(call))
+
+@app.on_event("startup")
+async def warm_up():
+    """With STARTUP_MODE=prewarm, create AWS clients before the first request arrives"""
+    if get_startup_mode() == "prewarm":
+        await run_in_threadpool(prewarm_clients)
+
+# Jobs collected in the background (wait=False requests and jobs resumed on startup)
+background_jobs = set()
+
+def spawn_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+@app.on_event("startup")
+async def start_transcribe_events():
+    """Consume Transcribe completion events when TRANSCRIBE_EVENTS_QUEUE_URL is set"""
+    transcribe_events.start()
+
+@app.on_event("startup")
+async def resume_jobs():
+    """Collect speech-to-text jobs left unfinished by a previous worker"""
+    if not job_store.resume_enabled():
+        return
+    store = await run_in_threadpool(job_store.get_store)
+    # Caps this worker's resumed collections, leaving collection threads for new wait=false jobs
+    slots = asyncio.Semaphore(job_store.resume_concurrency())
+    for job_id in await run_in_threadpool(store.unfinished):
+        spawn_background(_resume_job(job_id, slots))
+
+async def _resume_job(job_id, slots):
+    """Waits (without holding a thread) for another worker's lease to run out, then collects the job"""
+    while True:
+        delay = await run_blocking(job_store.lease_wait, job_id)
+        if delay is None:
+            return
+        if not delay:
+            break
+        await asyncio.sleep(delay)
+    async with slots:
+        await run_collection(job_store.resume_job, job_id)
+
+@app.on_event("shutdown")
+async def stop_media_workers():
+    """Stop the media worker processes, if they were started"""
+    media_offload.shutdown()
+
+@app.on_event("shutdown")
+async def stop_job_collection():
+    """Stop the background collection threads; unfinished jobs resume on the next start"""
+    job_store.shutdown()
+
+@app.on_event("shutdown")
+async def stop_transcribe_events():
+    """Stop the Transcribe completion-event consumer, if it was started"""
+    transcribe_events.stop()
+
+@app.on_event("startup")
+async def start_retention():
+    """Periodic bucket retention sweeps when RETENTION_ENABLED=1"""
+    retention.start()
+
+@app.on_event("shutdown")
+async def stop_retention():
+    retention.stop()
 
 @app.get("/")
 async def root():
@@ -84,7 +273,11 @@ async def root():
             "/speech-to-text", 
             "/text-analysis", 
             "/image-analysis",
-            "/health"
+            "/image-analysis/binary",
+            "/jobs/{job_id}",
+            "/ws/progress",
+            "/health",
+            "/metrics"
         ]
     }
 
@@ -98,6 +291,60 @@ async def testing():
         "version": "1.0.0"
     }
 
+def _submit_video_request(request: SpeechToTextRequest, job_id):
+    """
+    Blocking submit half of /speech-to-text: record the job, decode the video,
+    upload it and start transcription. Multimodal requests also sample
+    keyframes (during the upload) and start describing them.
+    Returns tuple: (pipeline, visual_analysis or None), for collecting the job in the same request
+    """
+    with progress.job_scope(job_id):
+        return _submit_video(request, job_id)
+
+def _submit_video(request: SpeechToTextRequest, job_id):
+    cancellation.plan(["upload", "transcription"] + (["flow"] if request.use_bedrock else []))
+    store = job_store.get_store()
+    store.create(job_id, request.filename, request.language_code, request.use_bedrock, request.multimodal)
+    # Initialize the pipeline
+    pipeline = MP4ToTextPipeline(tier=request.tier)
+    temp_file_path = None
+    extraction = None
+    try:
+        # Decode base64 video and save to temp file (in a media worker process for large uploads)
+        temp_file_path, _ = media_offload.decode_base64_to_file(request.video_base64, suffix='.mp4', prefix='video_')
+        if request.multimodal:
+            extraction = video_analysis.submit(video_analysis.extract_keyframes, temp_file_path)
+        video_key, video_timestamp, job_name = pipeline.submit_video(temp_file_path, request.language_code)
+        store.update(job_id, state='transcribing', video_key=video_key,
+                     video_timestamp=video_timestamp, job_name=job_name)
+        progress.emit("state", state="transcribing")
+        visual = None
+        if extraction:
+            frames, frame_logs, _ = extraction.result()
+            visual = video_analysis.VisualAnalysis(frames, frame_logs, tier=request.tier)
+        return pipeline, visual
+    except Exception as e:
+        if extraction:
+            video_analysis.discard_frames(extraction.result()[0])
+        job_store.finish(store, job_id, error=str(e))
+        raise
+    finally:
+        # Clean up temp file
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.unlink(temp_file_path)
+            except Exception:
+                pass
+
+def _process_video_request(request: SpeechToTextRequest, job_id):
+    """
+    Blocking part of /speech-to-text: submit the video, then wait for the
+    transcript, the keyframe descriptions and the optional Bedrock analysis.
+    Returns tuple: (text, language_info, bedrock_result, success)
+    """
+    pipeline, visual = _submit_video_request(request, job_id)
+    return job_store.collect_job(job_id, pipeline, visual=visual)
+
 @app.post("/speech-to-text", response_model=SpeechToTextResponse)
 async def speech_to_text(request: SpeechToTextRequest):
     """
@@ -109,41 +356,35 @@ async def speech_to_text(request: SpeechToTextRequest):
     - language_code: Optional language code (if not provided, auto-detection will be used)
     - filename: Optional filename for the video
     - use_bedrock: Whether to process the transcript with Bedrock flow (default: False)
+    - job_id: Optional id for the job; the result stays available at /jobs/{job_id}
+    - wait: Set to false to return once transcription has started and poll /jobs/{job_id}
+    - multimodal: Also analyse keyframes sampled from the video, alongside the transcript
+    - include_usage: Return the tokens, audio seconds and estimated cost of the request
+    - tier: Latency tier (fast, balanced, thorough): model, token budget and flow alias
     """
     start_time = datetime.now()
+    job_id = request.job_id or job_store.new_job_id()
+    request.tier = _resolve_tier(request.tier)
+    
+    if request.job_id and await run_blocking(job_store.get_store().get, job_id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job {job_id} already exists")
+    if request.job_id:
+        # The client can fetch the result from /jobs/{job_id}, so a dropped connection does not cancel the job
+        cancellation.keep_on_disconnect()
     
     try:
-        # Initialize the pipeline
-        pipeline = MP4ToTextPipeline()
-        temp_file_path = None
-        try:
-            # Decode base64 video and save to temp file
-            video_data = request.video_base64
-            if video_data.startswith('data:'):
-                video_data = video_data.split(',')[1]
-            decoded_video = base64.b64decode(video_data)
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4', prefix='video_') as temp_file:
-                temp_file.write(decoded_video)
-                temp_file_path = temp_file.name
-            # If Bedrock processing is requested, use process_video_with_bedrock
-            if request.use_bedrock:
-                text, language_info, bedrock_result, success = pipeline.process_video_with_bedrock(
-                    temp_file_path,
-                    request.language_code
-                )
-            else:
-                text, language_info, success = pipeline.process_video_detailed(
-                    temp_file_path,
-                    request.language_code
-                )
-                bedrock_result = None
-        finally:
-            # Clean up temp file
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except Exception:
-                    pass
+        if not request.wait:
+            pipeline, visual = await run_blocking(_submit_video_request, request, job_id)
+            # Collection outlives this request: no cancellation and no deadline
+            with cancellation.detached():
+                spawn_background(run_collection(job_store.collect_job, job_id, pipeline, None, visual))
+            return SpeechToTextResponse(success=True, job_id=job_id, state="transcribing")
+        
+        text, language_info, bedrock_result, success = await run_blocking(_process_video_request, request, job_id)
+        keyframes = None
+        if request.multimodal and success:
+            job = await run_blocking(job_store.get_store().get, job_id)
+            keyframes = job["visual_findings"]
         processing_time = (datetime.now() - start_time).total_seconds()
         if not success:
             return SpeechToTextResponse(
@@ -152,37 +393,99 @@ async def speech_to_text(request: SpeechToTextRequest):
                 language_info="",
                 bedrock_analysis=None,
                 error="Transcription or Bedrock analysis failed",
-                processing_time=processing_time
+                job_id=job_id,
+                state="failed",
+                processing_time=processing_time,
+                usage=_usage_summary(request.include_usage)
             )
         response = SpeechToTextResponse(
             success=True,
             text=text,
             language_info=language_info,
             bedrock_analysis=bedrock_result,
-            processing_time=processing_time
+            job_id=job_id,
+            state="completed",
+            keyframes=keyframes,
+            processing_time=processing_time,
+            usage=_usage_summary(request.include_usage)
         )
         return response
-        result, _, success = process_text_content(request.text_content)
+    except Exception as e:
+        processing_time = (datetime.now() - start_time).total_seconds()
+        return SpeechToTextResponse(
+            success=False,
+            error=str(e),
+            job_id=job_id,
+            state="failed",
+            processing_time=processing_time,
+            usage=_usage_summary(request.include_usage)
+        )
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """
+    State and, once completed, the result of a /speech-to-text job.
+    Jobs are stored durably, so this also works after a restart.
+    """
+    job = await run_blocking(job_store.get_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return JobStatusResponse(
+        job_id=job["id"],
+        state=job["state"],
+        filename=job["filename"],
+        use_bedrock=job["use_bedrock"],
+        job_name=job["job_name"],
+        video_key=job["video_key"],
+        result=job["result"],
+        error=job["error"],
+        created_at=datetime.fromtimestamp(job["created_at"]).isoformat(),
+        updated_at=datetime.fromtimestamp(job["updated_at"]).isoformat()
+    )
+
+@app.post("/text-analysis", response_model=TextAnalysisResponse)
+async def analyze_text(request: TextAnalysisRequest):
+    """
+    Analyze text content using AWS Bedrock flow for cultural analysis
+    
+    Parameters:
+    - text_content: The text to analyze
+    - country: Country context for analysis (default: Malaysia)
+    - include_usage: Return the tokens and estimated cost of the request
+    - tier: Latency tier (fast, balanced, thorough): flow alias
+    """
+    start_time = datetime.now()
+    tier = _resolve_tier(request.tier)
+    
+    try:
+        key = await content_key("/text-analysis", request.country, tier, request.text_content)
+        (result, _, success), _ = await text_analysis_flights.do(
+            key,
+            lambda: run_blocking(process_text_content, request.text_content, request.country, tier)
+        )
         processing_time = (datetime.now() - start_time).total_seconds()
         if success:
             return TextAnalysisResponse(
                 success=True,
                 analysis_result=result if result is not None else {},
-                processing_time=processing_time
+                processing_time=processing_time,
+                usage=_usage_summary(request.include_usage)
             )
         else:
             return TextAnalysisResponse(
                 success=False,
                 analysis_result=result if isinstance(result, dict) else {},
                 error=str(result),
-                processing_time=processing_time
+                processing_time=processing_time,
+                usage=_usage_summary(request.include_usage)
             )
     except Exception as e:
         processing_time = (datetime.now() - start_time).total_seconds()
         return TextAnalysisResponse(
             success=False,
             error=str(e),
-            processing_time=processing_time
+            processing_time=processing_time,
+            usage=_usage_summary(request.include_usage)
         )
 
 @app.post("/image-analysis", response_model=ImageAnalysisResponse) 
@@ -194,14 +497,25 @@ async def analyze_image(request: ImageAnalysisRequest):
     - image_base64: Base64-encoded image data
     - image_format: Image format (jpeg, png, webp, gif)
     - country: Country context for analysis (default: Malaysia)
+    - include_usage: Return the tokens and estimated cost of the request
+    - tier: Latency tier (fast, balanced, thorough): model, token budget, prompt and flow alias
     """
     start_time = datetime.now()
+    tier = _resolve_tier(request.tier)
     
     try:
-        # Process image with Nova Pro and Bedrock flow
-        result, _, success = process_base64_image_and_get_analysis(
-            request.image_base64,
-            request.image_format
+        # Process image with Nova and Bedrock flow
+        key = await content_key("/image-analysis", request.country, request.image_format, tier,
+                                request.image_base64)
+        (result, _, success), _ = await image_analysis_flights.do(
+            key,
+            lambda: run_blocking(
+                process_base64_image_and_get_analysis,
+                request.image_base64,
+                request.image_format,
+                request.country,
+                tier
+            )
         )
         
         processing_time = (datetime.now() - start_time).total_seconds()
@@ -211,7 +525,8 @@ async def analyze_image(request: ImageAnalysisRequest):
                 success=True,
                 analysis_result=result if result is not None else {},
                 image_description=result.get("image_description", "") if isinstance(result, dict) else "",
-                processing_time=processing_time
+                processing_time=processing_time,
+                usage=_usage_summary(request.include_usage)
             )
         else:
             return ImageAnalysisResponse(
@@ -219,7 +534,8 @@ async def analyze_image(request: ImageAnalysisRequest):
                 analysis_result=result if result is not None else {},
                 image_description=result.get("image_description") if isinstance(result, dict) and result.get("image_description") is not None else "",
                 error=str(result),
-                processing_time=processing_time
+                processing_time=processing_time,
+                usage=_usage_summary(request.include_usage)
             )
             
     except Exception as e:
@@ -227,7 +543,91 @@ async def analyze_image(request: ImageAnalysisRequest):
         return ImageAnalysisResponse(
             success=False,
             error=str(e),
-            processing_time=processing_time
+            processing_time=processing_time,
+            usage=_usage_summary(request.include_usage)
+        )
+
+IMAGE_FORMATS = ("jpeg", "png", "webp", "gif")
+
+@app.post("/image-analysis/binary", response_model=ImageAnalysisResponse)
+async def analyze_image_binary(request: Request, image_format: str = None, country: str = "Malaysia",
+                               include_usage: bool = False, tier: str = None):
+    """
+    Analyze a raw image upload using Amazon Nova Pro and AWS Bedrock flow.
+    The image bytes are passed to Bedrock as-is, never base64-encoded or
+    embedded in a JSON document by this service.
+
+    Body, either:
+    - the image bytes (Content-Type: application/octet-stream or image/*)
+    - multipart/form-data with an "image" file field (and optional image_format / country fields)
+
+    Parameters:
+    - image_format: Image format (jpeg, png, webp, gif); detected from the bytes if omitted
+    - country: Country context for analysis (default: Malaysia)
+    - include_usage: Return the tokens and estimated cost of the request
+    - tier: Latency tier (fast, balanced, thorough): model, token budget, prompt and flow alias
+    """
+    start_time = datetime.now()
+    tier = _resolve_tier(tier)
+
+    content_type = request.headers.get("content-type", "").lower()
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        try:
+            upload = form.get("image")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail="Multipart body needs an 'image' file field")
+            image_bytes = await upload.read()
+            image_format = form.get("image_format") or image_format
+            country = form.get("country") or country
+        finally:
+            await form.close()
+    else:
+        image_bytes = await request.body()
+        if image_format is None and content_type.startswith("image/"):
+            image_format = content_type[len("image/"):].split(";")[0].strip()
+
+    if not image_bytes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty image body")
+    image_format = (image_format or detect_image_format(image_bytes) or "").lower()
+    image_format = "jpeg" if image_format == "jpg" else image_format
+    if image_format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"Unsupported image format; expected one of {', '.join(IMAGE_FORMATS)}")
+
+    try:
+        key = await content_key("/image-analysis/binary", country, image_format, tier, image_bytes)
+        (result, _, success), _ = await image_analysis_flights.do(
+            key,
+            lambda: run_blocking(process_image_bytes_and_get_analysis, image_bytes, image_format, country, tier)
+        )
+
+        processing_time = (datetime.now() - start_time).total_seconds()
+
+        if success:
+            return ImageAnalysisResponse(
+                success=True,
+                analysis_result=result if result is not None else {},
+                image_description=result.get("image_description", "") if isinstance(result, dict) else "",
+                processing_time=processing_time,
+                usage=_usage_summary(include_usage)
+            )
+        return ImageAnalysisResponse(
+            success=False,
+            analysis_result={},
+            error="Image analysis failed",
+            processing_time=processing_time,
+            usage=_usage_summary(include_usage)
+        )
+
+    except Exception as e:
+        processing_time = (datetime.now() - start_time).total_seconds()
+        return ImageAnalysisResponse(
+            success=False,
+            error=str(e),
+            processing_time=processing_time,
+            usage=_usage_summary(include_usage)
         )
 
 @app.get("/health")
@@ -247,6 +647,11 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics in the Prometheus text format"""
+    return metrics.render()
+
 if __name__ == "__main__":
     # Run the application
     uvicorn.run(
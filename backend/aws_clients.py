@@ -0,0 +1,123 @@
+"""
+AWS Client Factory
+Single place where the pipelines get their AWS clients, so the backend can be
+switched between real AWS and the local emulator through configuration, and
+every call goes through the shared resilience layer.
+
+boto3 is imported on first use and clients are cached per service and region
+(boto3 clients are thread-safe), so importing the app stays cheap and only the
+first call to each service pays for client creation. STARTUP_MODE=prewarm
+moves that cost to application startup instead (see prewarm_clients).
+"""
+import os
+import threading
+
+import resilience
+import scheduler
+
+# Services used by the pipelines, created up front in prewarm mode
+PIPELINE_SERVICES = ['s3', 'transcribe', 'bedrock-runtime', 'bedrock-agent-runtime']
+
+# Services the pipelines create with an explicit region_name (cached separately)
+REGIONAL_SERVICES = ['bedrock-runtime', 'bedrock-agent-runtime']
+
+_clients = {}
+_clients_lock = threading.Lock()
+_environment_loaded = False
+
+
+def load_environment():
+    """Loads .env once per process (every pipeline module calls this on import)."""
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    _environment_loaded = True
+
+
+def get_backend(backend=None):
+    """Returns the configured AWS backend name: 'aws' or 'emulator'."""
+    return (backend or os.getenv('AWS_BACKEND', 'aws')).lower()
+
+
+def get_startup_mode():
+    """Returns STARTUP_MODE: 'lazy' (default) or 'prewarm'."""
+    return os.getenv('STARTUP_MODE', 'lazy').lower()
+
+
+def _create_boto3_client(service_name, region_name, single_attempt):
+    # Deferred: importing boto3 costs more than the rest of the app together
+    import boto3
+    from botocore.config import Config
+
+    kwargs = {}
+    if single_attempt:
+        # The resilience layer owns retries, so botocore makes a single attempt per call
+        kwargs['config'] = Config(retries={'mode': 'standard', 'total_max_attempts': 1})
+    if region_name:
+        kwargs['region_name'] = region_name
+    return boto3.client(service_name, **kwargs)
+
+
+def get_client(service_name, region_name=None, backend=None):
+    """
+    Returns a client for the given AWS service.
+    With AWS_BACKEND=emulator (or backend='emulator') the in-process
+    emulator from aws_emulator is returned instead of a boto3 client.
+    Unless AWS_RESILIENCE=0, the client is wrapped with rate limiting,
+    adaptive retries and a circuit breaker shared per service. Unless
+    SCHEDULER=0, model, flow and transcription calls are also queued by
+    priority class and tenant (see scheduler).
+    """
+    wrap = resilience.is_enabled()
+
+    if get_backend(backend) == 'emulator':
+        from aws_emulator import get_emulator
+        client = get_emulator().client(service_name)
+    else:
+        key = (service_name, region_name, wrap)
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _create_boto3_client(service_name, region_name, wrap)
+                _clients[key] = client
+
+    if wrap:
+        client = resilience.wrap_client(client, service_name)
+    # Outside the resilience layer: a scheduled call holds its slot through rate limiting and retries
+    return scheduler.wrap_client(client, service_name) if scheduler.is_enabled() else client
+
+
+def prewarm_clients(connect=None):
+    """
+    Creates the pipeline clients ahead of the first request. With connect=True
+    (or STARTUP_PREWARM_CONNECTIONS=1) it also makes one cheap read-only call to
+    S3 and Transcribe so TLS connections are already open in the pool.
+    Returns: list of log messages
+    """
+    load_environment()
+    logs = []
+    region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
+    for service_name in PIPELINE_SERVICES:
+        # Same arguments the pipelines use, so they hit the cached clients
+        if service_name != 'bedrock-runtime':
+            get_client(service_name)
+        if service_name in REGIONAL_SERVICES:
+            get_client(service_name, region_name=region)
+        logs.append(f"Client ready: {service_name}")
+
+    if connect is None:
+        connect = os.getenv('STARTUP_PREWARM_CONNECTIONS', '').lower() in ('1', 'true', 'yes')
+    if connect and get_backend() != 'emulator':
+        warmups = [
+            ('s3', lambda client: client.head_bucket(Bucket=os.getenv('S3_BUCKET_NAME', 'video-bucket-ken'))),
+            ('transcribe', lambda client: client.list_transcription_jobs(MaxResults=1)),
+        ]
+        for service_name, call in warmups:
+            try:
+                call(get_client(service_name))
+                logs.append(f"Connection warmed: {service_name}")
+            except Exception as e:
+                logs.append(f"Connection warm-up failed for {service_name}: {str(e)}")
+    return logs
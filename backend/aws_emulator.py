@@ -0,0 +1,934 @@
+"""
+Local AWS Emulator for capacity planning
+In-process fake of every AWS operation the backend uses:
+- bedrock-agent-runtime: invoke_flow (event stream)
+- bedrock-runtime: invoke_model
+- bedrock: batch inference jobs (create/get/stop_model_invocation_job)
+- transcribe: start/get transcription job lifecycle
+- s3: upload_file, put_object, get_object, list_objects_v2, delete_object(s)
+- sqs: send/receive/delete messages, for Transcribe job state-change events
+
+Every operation supports a configurable latency distribution plus error and
+throttle injection, and Transcribe jobs complete after a configurable time.
+With transcribe.events_queue set, finished jobs also publish an EventBridge
+"Transcribe Job State Change" event to that emulated SQS queue.
+"capacity" throttles calls beyond a sustained rate, like a real service quota,
+so retry storms can be reproduced.
+
+Enable with AWS_BACKEND=emulator. Configure with AWS_EMULATOR_CONFIG, either
+inline JSON or a path to a JSON file, e.g.
+{
+  "seed": 42,
+  "time_scale": 1.0,
+  "latency": {
+    "default": {"distribution": "constant", "seconds": 0.01},
+    "bedrock-runtime.invoke_model": {"distribution": "lognormal", "median": 2.5, "sigma": 0.4},
+    "bedrock-agent-runtime.invoke_flow": {"distribution": "uniform", "low": 3, "high": 8}
+  },
+  "errors": {
+    "bedrock-runtime": {"throttle_rate": 0.1},
+    "s3.get_object": {"error_rate": 0.01}
+  },
+  "capacity": {
+    "bedrock-runtime.invoke_model": {"rate": 5, "burst": 10}
+  },
+  "transcribe": {
+    "queue_seconds": {"distribution": "exponential", "mean": 20},
+    "job_seconds": {"distribution": "uniform", "low": 30, "high": 90},
+    "failure_rate": 0.0,
+    "events_queue": "transcribe-events",
+    "event_delay": {"distribution": "uniform", "low": 0.5, "high": 2}
+  },
+  "flow": {"trace_events": 2, "event_interval": {"distribution": "constant", "seconds": 0.2}},
+  "batch": {
+    "queue_seconds": {"distribution": "uniform", "low": 60, "high": 600},
+    "record_seconds": 0.05,
+    "record_error_rate": 0.001
+  }
+}
+"""
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:  # allows running the emulator without botocore installed
+    class ClientError(Exception):
+        """Mirrors botocore.exceptions.ClientError closely enough for our callers."""
+        def __init__(self, error_response, operation_name):
+            self.response = error_response
+            self.operation_name = operation_name
+            error = error_response.get('Error', {})
+            super().__init__(
+                f"An error occurred ({error.get('Code', 'Unknown')}) when calling the "
+                f"{operation_name} operation: {error.get('Message', 'Unknown')}"
+            )
+
+
+# Error codes returned for injected throttles, matching what each service sends
+THROTTLE_CODES = {
+    's3': ('SlowDown', 503),
+    'transcribe': ('LimitExceededException', 400),
+    'bedrock-runtime': ('ThrottlingException', 429),
+    'bedrock-agent-runtime': ('ThrottlingException', 429),
+    'bedrock': ('ThrottlingException', 429),
+    'sqs': ('RequestThrottled', 403),
+}
+
+ERROR_CODES = {
+    's3': ('InternalError', 500),
+    'transcribe': ('InternalFailureException', 500),
+    'bedrock-runtime': ('InternalServerException', 500),
+    'bedrock-agent-runtime': ('InternalServerException', 500),
+    'bedrock': ('InternalServerException', 500),
+    'sqs': ('InternalError', 500),
+}
+
+DEFAULT_CONFIG = {
+    "seed": None,
+    "time_scale": 1.0,
+    "latency": {
+        "default": {"distribution": "constant", "seconds": 0.0}
+    },
+    "errors": {},
+    "capacity": {},
+    "transcribe": {
+        "queue_seconds": {"distribution": "constant", "seconds": 0.0},
+        "job_seconds": {"distribution": "constant", "seconds": 1.0},
+        "failure_rate": 0.0,
+        "transcript": "This is an emulated transcript of the uploaded video.",
+        "language_code": "en-US",
+        "language_score": 0.97,
+        # SQS queue name receiving job state-change events (None = no events)
+        "events_queue": None,
+        # EventBridge -> SQS delivery lag after the job finishes
+        "event_delay": {"distribution": "constant", "seconds": 0.0}
+    },
+    "bedrock": {
+        "description": "An emulated description of the submitted image.",
+        "output_tokens": 120
+    },
+    "flow": {
+        "trace_events": 1,
+        "event_interval": {"distribution": "constant", "seconds": 0.0},
+        "output": None
+    },
+    "batch": {
+        # Submitted/Validating/Scheduled time before records start running
+        "queue_seconds": {"distribution": "constant", "seconds": 1.0},
+        # Processing time per record once the job is running
+        "record_seconds": 0.01,
+        "record_error_rate": 0.0,
+        # Bedrock rejects smaller jobs
+        "min_records": 100
+    }
+}
+
+
+def load_config():
+    """Loads emulator configuration from AWS_EMULATOR_CONFIG (inline JSON or file path)."""
+    raw = os.getenv('AWS_EMULATOR_CONFIG', '').strip()
+    if not raw:
+        return {}
+    if raw.startswith('{'):
+        return json.loads(raw)
+    with open(raw, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _merge(base, override):
+    """Recursively merges override into a copy of base."""
+    merged = dict(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class LatencyModel:
+    """
+    Samples latencies and injects failures for emulated operations.
+    Settings are looked up as 'service.operation', then 'service', then 'default'.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.time_scale = float(config.get('time_scale', 1.0))
+        self.random = random.Random(config.get('seed'))
+        self.lock = threading.Lock()
+        # Server-side token buckets for "capacity": key -> (tokens, last_refill)
+        self.capacity = {}
+
+    def _lookup(self, section, service, operation):
+        table = self.config.get(section, {})
+        for key in (f"{service}.{operation}", service, 'default'):
+            if key in table:
+                return table[key]
+        return None
+
+    def sample(self, spec):
+        """Draws one value in seconds from a distribution spec."""
+        if not spec:
+            return 0.0
+        if isinstance(spec, (int, float)):
+            return float(spec) * self.time_scale
+
+        distribution = spec.get('distribution', 'constant')
+        with self.lock:
+            if distribution == 'constant':
+                value = spec.get('seconds', 0.0)
+            elif distribution == 'uniform':
+                value = self.random.uniform(spec.get('low', 0.0), spec.get('high', 0.0))
+            elif distribution == 'normal':
+                value = self.random.gauss(spec.get('mean', 0.0), spec.get('stddev', 0.0))
+            elif distribution == 'lognormal':
+                value = self.random.lognormvariate(math.log(spec.get('median', 1.0)), spec.get('sigma', 0.0))
+            elif distribution == 'exponential':
+                mean = spec.get('mean', 0.0)
+                value = self.random.expovariate(1.0 / mean) if mean > 0 else 0.0
+            else:
+                raise ValueError(f"Unsupported latency distribution: {distribution}")
+        return max(0.0, float(value)) * self.time_scale
+
+    def chance(self, rate):
+        """Returns True with the given probability."""
+        if not rate:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+    def delay(self, service, operation):
+        """Sleeps for the configured latency of an operation."""
+        seconds = self.sample(self._lookup('latency', service, operation))
+        if seconds:
+            time.sleep(seconds)
+        return seconds
+
+    def over_capacity(self, service, operation):
+        """Consumes a token from the operation's capacity bucket; True if none is left."""
+        for key in (f"{service}.{operation}", service):
+            if key in self.config.get('capacity', {}):
+                break
+        else:
+            return False
+
+        spec = self.config['capacity'][key]
+        rate = float(spec.get('rate', 1.0)) / self.time_scale if self.time_scale else float('inf')
+        burst = float(spec.get('burst', spec.get('rate', 1.0)))
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.capacity.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens < 1:
+                self.capacity[key] = (tokens, now)
+                return True
+            self.capacity[key] = (tokens - 1, now)
+        return False
+
+    def maybe_fail(self, service, operation):
+        """Raises an injected throttle or error for an operation, if configured."""
+        errors = self._lookup('errors', service, operation) or {}
+        if self.over_capacity(service, operation) or self.chance(errors.get('throttle_rate')):
+            code, status = THROTTLE_CODES.get(service, ('ThrottlingException', 429))
+            raise _client_error(code, "Rate exceeded (injected by emulator)", operation, status)
+        if self.chance(errors.get('error_rate')):
+            code, status = ERROR_CODES.get(service, ('InternalServerException', 500))
+            raise _client_error(code, "Internal error (injected by emulator)", operation, status)
+
+    def call(self, service, operation):
+        """Applies latency, then failure injection, for one emulated call."""
+        self.delay(service, operation)
+        self.maybe_fail(service, operation)
+
+
+def _client_error(code, message, operation, status=400):
+    return ClientError(
+        {
+            'Error': {'Code': code, 'Message': message},
+            'ResponseMetadata': {'HTTPStatusCode': status}
+        },
+        _operation_name(operation)
+    )
+
+
+def _operation_name(operation):
+    """Converts 'invoke_model' to 'InvokeModel' like botocore does."""
+    return ''.join(part.capitalize() for part in operation.split('_'))
+
+
+class StreamingBody:
+    """Minimal stand-in for botocore.response.StreamingBody."""
+    def __init__(self, data):
+        self._raw = io.BytesIO(data)
+        self._content_length = len(data)
+
+    def read(self, amt=None):
+        return self._raw.read() if amt is None else self._raw.read(amt)
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self._raw.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._raw.close()
+
+
+class EmulatedS3:
+    """In-memory S3 supporting the object operations the pipelines use."""
+    service = 's3'
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.latency = emulator.latency
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, name):
+        with self.lock:
+            return self.buckets.setdefault(name, {})
+
+    def store(self, bucket, key, data):
+        """Writes an object without latency or failure injection (used by other emulated services)."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        objects = self._bucket(bucket)
+        with self.lock:
+            objects[key] = {
+                'data': bytes(data),
+                'last_modified': datetime.now(timezone.utc),
+                'etag': f'"{uuid.uuid4().hex}"'
+            }
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        self.latency.call(self.service, 'upload_file')
+        # Read in parts like a multipart upload; an exception from Callback aborts it, storing nothing
+        part_size = getattr(Config, 'multipart_chunksize', None) or 8 * 1024 * 1024
+        parts = []
+        with open(Filename, 'rb') as f:
+            for part in iter(lambda: f.read(part_size), b''):
+                parts.append(part)
+                if Callback:
+                    Callback(len(part))
+        self.store(Bucket, Key, b''.join(parts))
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self.latency.call(self.service, 'put_object')
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        self.store(Bucket, Key, Body)
+        return {'ETag': self._bucket(Bucket)[Key]['etag']}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.latency.call(self.service, 'get_object')
+        obj = self._bucket(Bucket).get(Key)
+        if obj is None:
+            raise _client_error('NoSuchKey', 'The specified key does not exist.', 'get_object', 404)
+        return {
+            'Body': StreamingBody(obj['data']),
+            'ContentLength': len(obj['data']),
+            'LastModified': obj['last_modified'],
+            'ETag': obj['etag']
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.latency.call(self.service, 'delete_object')
+        objects = self._bucket(Bucket)
+        with self.lock:
+            objects.pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self.latency.call(self.service, 'delete_objects')
+        keys = [item['Key'] for item in Delete.get('Objects', [])]
+        if len(keys) > 1000:
+            raise _client_error('MalformedXML', 'At most 1000 keys can be deleted per request.', 'delete_objects')
+        objects = self._bucket(Bucket)
+        with self.lock:
+            for key in keys:
+                objects.pop(key, None)
+        # Deleting a missing key succeeds in S3 as well
+        return {} if Delete.get('Quiet') else {'Deleted': [{'Key': key} for key in keys]}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, **kwargs):
+        self.latency.call(self.service, 'list_objects_v2')
+        objects = self._bucket(Bucket)
+        with self.lock:
+            keys = sorted(key for key in objects if key.startswith(Prefix))
+        if ContinuationToken:
+            keys = [key for key in keys if key > ContinuationToken]
+
+        page = keys[:MaxKeys]
+        response = {
+            'IsTruncated': len(keys) > MaxKeys,
+            'KeyCount': len(page),
+            'Prefix': Prefix,
+            'MaxKeys': MaxKeys
+        }
+        if page:
+            response['Contents'] = [
+                {
+                    'Key': key,
+                    'Size': len(objects[key]['data']),
+                    'LastModified': objects[key]['last_modified'],
+                    'ETag': objects[key]['etag']
+                }
+                for key in page if key in objects
+            ]
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        return response
+
+
+class EmulatedTranscribe:
+    """Transcribe job lifecycle: QUEUED -> IN_PROGRESS -> COMPLETED or FAILED."""
+    service = 'transcribe'
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.latency = emulator.latency
+        self.config = emulator.config['transcribe']
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start_transcription_job(self, TranscriptionJobName, Media, OutputBucketName=None, OutputKey=None, **kwargs):
+        self.latency.call(self.service, 'start_transcription_job')
+        now = time.time()
+        queue_seconds = self.latency.sample(self.config.get('queue_seconds'))
+        job_seconds = self.latency.sample(self.config.get('job_seconds'))
+
+        with self.lock:
+            if TranscriptionJobName in self.jobs:
+                raise _client_error('ConflictException', 'The requested job name already exists.',
+                                    'start_transcription_job')
+            job = {
+                'TranscriptionJobName': TranscriptionJobName,
+                'Media': Media,
+                'MediaFormat': kwargs.get('MediaFormat'),
+                'LanguageCode': kwargs.get('LanguageCode'),
+                'IdentifyLanguage': kwargs.get('IdentifyLanguage', False),
+                'OutputBucketName': OutputBucketName,
+                'OutputKey': OutputKey or f"{TranscriptionJobName}.json",
+                'CreationTime': datetime.now(timezone.utc),
+                'started_at': now + queue_seconds,
+                'completes_at': now + queue_seconds + job_seconds,
+                'fails': self.latency.chance(self.config.get('failure_rate')),
+                'finalized': False
+            }
+            self.jobs[TranscriptionJobName] = job
+
+        if self.config.get('events_queue'):
+            delay = job['completes_at'] - now + self.latency.sample(self.config.get('event_delay'))
+            timer = threading.Timer(delay, self._publish_event, (job,))
+            timer.daemon = True
+            timer.start()
+
+        return {'TranscriptionJob': self._describe(job)}
+
+    def get_transcription_job(self, TranscriptionJobName):
+        self.latency.call(self.service, 'get_transcription_job')
+        with self.lock:
+            job = self.jobs.get(TranscriptionJobName)
+        if job is None:
+            raise _client_error('BadRequestException', 'The requested job could not be found.',
+                                'get_transcription_job')
+        return {'TranscriptionJob': self._describe(job)}
+
+    def delete_transcription_job(self, TranscriptionJobName):
+        self.latency.call(self.service, 'delete_transcription_job')
+        with self.lock:
+            job = self.jobs.pop(TranscriptionJobName, None)
+        if job is None:
+            raise _client_error('BadRequestException', 'The requested job could not be found.',
+                                'delete_transcription_job')
+        # A deleted job never writes its transcript
+        job['finalized'] = True
+        return {}
+
+    def _status(self, job):
+        now = time.time()
+        if now < job['started_at']:
+            return 'QUEUED'
+        if now < job['completes_at']:
+            return 'IN_PROGRESS'
+        return 'FAILED' if job['fails'] else 'COMPLETED'
+
+    def _describe(self, job):
+        status = self._status(job)
+        if status in ('COMPLETED', 'FAILED'):
+            self._finalize(job, status)
+
+        description = {
+            'TranscriptionJobName': job['TranscriptionJobName'],
+            'TranscriptionJobStatus': status,
+            'Media': job['Media'],
+            'MediaFormat': job['MediaFormat'],
+            'CreationTime': job['CreationTime']
+        }
+        if job['LanguageCode']:
+            description['LanguageCode'] = job['LanguageCode']
+        if status in ('COMPLETED', 'FAILED'):
+            description['CompletionTime'] = datetime.fromtimestamp(job['completes_at'], timezone.utc)
+        if status == 'COMPLETED':
+            description['Transcript'] = {
+                'TranscriptFileUri': f"s3://{job['OutputBucketName']}/{job['OutputKey']}"
+            }
+        elif status == 'FAILED':
+            description['FailureReason'] = 'Job failed (injected by emulator)'
+        return description
+
+    def _finalize(self, job, status):
+        """Writes the transcript JSON to the emulated bucket once the job completes."""
+        with self.lock:
+            if job['finalized']:
+                return
+            job['finalized'] = True
+        if status == 'COMPLETED' and job['OutputBucketName']:
+            self.emulator.s3.store(job['OutputBucketName'], job['OutputKey'],
+                                   json.dumps(self.build_transcript(job)))
+
+    def _publish_event(self, job):
+        """Sends the EventBridge state-change event for a finished job to the events queue."""
+        status = 'FAILED' if job['fails'] else 'COMPLETED'
+        self._finalize(job, status)
+        event = {
+            'version': '0',
+            'id': str(uuid.uuid4()),
+            'detail-type': 'Transcribe Job State Change',
+            'source': 'aws.transcribe',
+            'account': '000000000000',
+            'time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'region': 'us-east-1',
+            'resources': [],
+            'detail': {
+                'TranscriptionJobName': job['TranscriptionJobName'],
+                'TranscriptionJobStatus': status
+            }
+        }
+        self.emulator.sqs.enqueue(self.config['events_queue'], json.dumps(event))
+
+    def build_transcript(self, job):
+        """Builds a transcript document shaped like Amazon Transcribe output."""
+        text = self.config.get('transcript', '')
+        language_code = job['LanguageCode'] or self.config.get('language_code', 'en-US')
+        items = []
+        for index, word in enumerate(text.split()):
+            items.append({
+                'start_time': f"{index * 0.4:.2f}",
+                'end_time': f"{index * 0.4 + 0.35:.2f}",
+                'alternatives': [{'confidence': '0.99', 'content': word.strip('.,!?')}],
+                'type': 'pronunciation'
+            })
+
+        results = {
+            'transcripts': [{'transcript': text}],
+            'items': items
+        }
+        if job['IdentifyLanguage']:
+            results['language_code'] = language_code
+            results['language_identification'] = [
+                {'code': language_code, 'score': str(self.config.get('language_score', 0.97))}
+            ]
+
+        return {
+            'jobName': job['TranscriptionJobName'],
+            'accountId': '000000000000',
+            'results': results,
+            'status': 'COMPLETED'
+        }
+
+
+class EmulatedSQS:
+    """Standard SQS queues with long polling and visibility timeouts."""
+    service = 'sqs'
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.latency = emulator.latency
+        self.queues = {}
+        self.condition = threading.Condition()
+
+    @staticmethod
+    def queue_url(name):
+        return f"https://sqs.us-east-1.amazonaws.com/000000000000/{name}"
+
+    def _queue(self, url_or_name):
+        name = url_or_name.rsplit('/', 1)[-1]
+        return self.queues.setdefault(name, {'messages': [], 'visibility_timeout': 30.0})
+
+    def enqueue(self, queue, body):
+        """Adds a message without latency or failure injection (used by other emulated services)."""
+        message = {
+            'MessageId': str(uuid.uuid4()),
+            'Body': body,
+            'visible_at': 0.0,
+            'receive_count': 0,
+            'receipt': None
+        }
+        with self.condition:
+            self._queue(queue)['messages'].append(message)
+            self.condition.notify_all()
+        return message['MessageId']
+
+    def create_queue(self, QueueName, Attributes=None, **kwargs):
+        self.latency.call(self.service, 'create_queue')
+        with self.condition:
+            queue = self._queue(QueueName)
+            if Attributes and 'VisibilityTimeout' in Attributes:
+                queue['visibility_timeout'] = float(Attributes['VisibilityTimeout'])
+        return {'QueueUrl': self.queue_url(QueueName)}
+
+    def get_queue_url(self, QueueName, **kwargs):
+        self.latency.call(self.service, 'get_queue_url')
+        return {'QueueUrl': self.queue_url(QueueName)}
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.latency.call(self.service, 'send_message')
+        return {'MessageId': self.enqueue(QueueUrl, MessageBody)}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None, **kwargs):
+        self.latency.call(self.service, 'receive_message')
+        deadline = time.monotonic() + WaitTimeSeconds * self.latency.time_scale
+        with self.condition:
+            queue = self._queue(QueueUrl)
+            visibility = queue['visibility_timeout'] if VisibilityTimeout is None else VisibilityTimeout
+            while True:
+                now = time.time()
+                ready = [m for m in queue['messages'] if m['visible_at'] <= now][:MaxNumberOfMessages]
+                remaining = deadline - time.monotonic()
+                if ready or remaining <= 0:
+                    break
+                hidden = [m['visible_at'] - now for m in queue['messages']]
+                # Wake up for new messages, or when a hidden one becomes visible again
+                self.condition.wait(min([remaining] + hidden))
+
+            messages = []
+            for message in ready:
+                message['visible_at'] = now + visibility * self.latency.time_scale
+                message['receive_count'] += 1
+                message['receipt'] = uuid.uuid4().hex
+                messages.append({
+                    'MessageId': message['MessageId'],
+                    'ReceiptHandle': message['receipt'],
+                    'Body': message['Body'],
+                    'Attributes': {'ApproximateReceiveCount': str(message['receive_count'])}
+                })
+        return {'Messages': messages} if messages else {}
+
+    def _find(self, QueueUrl, ReceiptHandle, operation):
+        for message in self._queue(QueueUrl)['messages']:
+            if message['receipt'] == ReceiptHandle:
+                return message
+        raise _client_error('ReceiptHandleIsInvalid', 'The receipt handle is not valid.', operation)
+
+    def delete_message(self, QueueUrl, ReceiptHandle, **kwargs):
+        self.latency.call(self.service, 'delete_message')
+        with self.condition:
+            message = self._find(QueueUrl, ReceiptHandle, 'delete_message')
+            self._queue(QueueUrl)['messages'].remove(message)
+        return {}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout, **kwargs):
+        self.latency.call(self.service, 'change_message_visibility')
+        with self.condition:
+            message = self._find(QueueUrl, ReceiptHandle, 'change_message_visibility')
+            message['visible_at'] = time.time() + VisibilityTimeout * self.latency.time_scale
+            self.condition.notify_all()
+        return {}
+
+
+class EmulatedBedrockRuntime:
+    """Nova-style invoke_model responses, including the usage block."""
+    service = 'bedrock-runtime'
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.latency = emulator.latency
+        self.config = emulator.config['bedrock']
+
+    def invoke_model(self, modelId, body, contentType='application/json', accept='application/json', **kwargs):
+        self.latency.call(self.service, 'invoke_model')
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode('utf-8')
+        response_body = self.build_response(json.loads(body))
+        return {
+            'body': StreamingBody(json.dumps(response_body).encode('utf-8')),
+            'contentType': 'application/json',
+            'ResponseMetadata': {'HTTPStatusCode': 200}
+        }
+
+    def build_response(self, request):
+        """Nova response body for a request (also used for batch inference records)."""
+        description = self.config.get('description', '')
+        response_body = {
+            'output': {
+                'message': {
+                    'role': 'assistant',
+                    'content': [{'text': description}]
+                }
+            },
+            'stopReason': 'end_turn',
+            'usage': {
+                'inputTokens': _estimate_tokens(request),
+                'outputTokens': self.config.get('output_tokens', len(description) // 4),
+            }
+        }
+        response_body['usage']['totalTokens'] = (
+            response_body['usage']['inputTokens'] + response_body['usage']['outputTokens']
+        )
+        return response_body
+
+
+def _estimate_tokens(request):
+    """Rough token estimate: ~4 characters per text token, fixed cost per image."""
+    tokens = 0
+    for system in request.get('system', []):
+        tokens += len(system.get('text', '')) // 4
+    for message in request.get('messages', []):
+        for content in message.get('content', []):
+            if 'text' in content:
+                tokens += len(content['text']) // 4
+            elif 'image' in content:
+                tokens += 1300
+    return max(tokens, 1)
+
+
+class EmulatedBedrockAgentRuntime:
+    """invoke_flow returning an event stream of trace, output and completion events."""
+    service = 'bedrock-agent-runtime'
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.latency = emulator.latency
+        self.config = emulator.config['flow']
+
+    def invoke_flow(self, flowIdentifier, flowAliasIdentifier, inputs, enableTrace=False, **kwargs):
+        # Latency here is time to first event; event_interval spaces the rest
+        self.latency.call(self.service, 'invoke_flow')
+        document = inputs[0]['content']['document']
+        return {
+            'executionId': uuid.uuid4().hex,
+            'responseStream': self._stream(flowIdentifier, document, enableTrace)
+        }
+
+    def _stream(self, flow_id, document, enable_trace):
+        interval = self.config.get('event_interval')
+        if enable_trace:
+            for index in range(int(self.config.get('trace_events', 0))):
+                yield {'traceEvent': {'trace': {'nodeInputTrace': {'nodeName': f"EmulatedNode{index}"}}}}
+                self._pause(interval)
+
+        # Mid-stream throttles surface while iterating, like botocore's EventStreamError
+        self.latency.maybe_fail(self.service, 'invoke_flow_stream')
+
+        output = self.config.get('output') or {
+            'emulated': True,
+            'flow_id': flow_id,
+            'country': document.get('country') if isinstance(document, dict) else None,
+            'file_type': document.get('file_type') if isinstance(document, dict) else None,
+            'input_characters': len(json.dumps(document)),
+            'risk_level': 'low',
+            'summary': 'Emulated cultural analysis result.'
+        }
+        yield {'flowOutputEvent': {'nodeName': 'FlowOutputNode', 'content': {'document': output}}}
+        self._pause(interval)
+        yield {'flowCompletionEvent': {'completionReason': 'SUCCESS'}}
+
+    def _pause(self, interval):
+        seconds = self.latency.sample(interval)
+        if seconds:
+            time.sleep(seconds)
+
+
+class EmulatedBedrock:
+    """
+    Batch inference job lifecycle:
+    Submitted -> Validating -> Scheduled -> InProgress -> Completed, PartiallyCompleted or Failed.
+    Reads the JSONL input from the emulated S3 and writes the .out file next to
+    the manifest under the output prefix, like Bedrock does.
+    """
+    service = 'bedrock'
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.latency = emulator.latency
+        self.config = emulator.config['batch']
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig, **kwargs):
+        self.latency.call(self.service, 'create_model_invocation_job')
+        input_uri = inputDataConfig['s3InputDataConfig']['s3Uri']
+        bucket, _, key = input_uri[len('s3://'):].partition('/')
+        obj = self.emulator.s3.buckets.get(bucket, {}).get(key)
+        if obj is None:
+            raise _client_error('ValidationException', f"Input file not found: {input_uri}",
+                                'create_model_invocation_job')
+        records = [json.loads(line) for line in obj['data'].splitlines() if line.strip()]
+        if len(records) < int(self.config.get('min_records', 0)):
+            raise _client_error('ValidationException',
+                                f"Batch job requires at least {self.config['min_records']} records",
+                                'create_model_invocation_job')
+
+        now = time.time()
+        queue_seconds = self.latency.sample(self.config.get('queue_seconds'))
+        run_seconds = len(records) * float(self.config.get('record_seconds', 0)) * self.latency.time_scale
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'jobArn': f"arn:aws:bedrock:us-east-1:000000000000:model-invocation-job/{job_id}",
+            'job_id': job_id,
+            'jobName': jobName,
+            'modelId': modelId,
+            'roleArn': roleArn,
+            'inputDataConfig': inputDataConfig,
+            'outputDataConfig': outputDataConfig,
+            'submitTime': datetime.now(timezone.utc),
+            'records': records,
+            'input_key': key,
+            'started_at': now + queue_seconds,
+            'completes_at': now + queue_seconds + run_seconds,
+            'stopped': False,
+            'finalized': None
+        }
+        with self.lock:
+            if any(existing['jobName'] == jobName for existing in self.jobs.values()):
+                raise _client_error('ConflictException', 'A job with this name already exists.',
+                                    'create_model_invocation_job')
+            self.jobs[job['jobArn']] = job
+        return {'jobArn': job['jobArn']}
+
+    def get_model_invocation_job(self, jobIdentifier):
+        self.latency.call(self.service, 'get_model_invocation_job')
+        job = self._job(jobIdentifier, 'get_model_invocation_job')
+        status = self._status(job)
+        description = {
+            key: job[key] for key in ('jobArn', 'jobName', 'modelId', 'roleArn', 'inputDataConfig',
+                                      'outputDataConfig', 'submitTime')
+        }
+        description['status'] = status
+        description['lastModifiedTime'] = datetime.now(timezone.utc)
+        if status in ('Completed', 'PartiallyCompleted', 'Failed', 'Stopped'):
+            description['endTime'] = datetime.fromtimestamp(job['completes_at'], timezone.utc)
+        if status == 'Failed':
+            description['message'] = 'Job failed (injected by emulator)'
+        return description
+
+    def stop_model_invocation_job(self, jobIdentifier):
+        self.latency.call(self.service, 'stop_model_invocation_job')
+        job = self._job(jobIdentifier, 'stop_model_invocation_job')
+        with self.lock:
+            job['stopped'] = True
+            job['completes_at'] = min(job['completes_at'], time.time())
+        return {}
+
+    def _job(self, identifier, operation):
+        with self.lock:
+            job = self.jobs.get(identifier) or next(
+                (job for job in self.jobs.values() if job['jobName'] == identifier), None
+            )
+        if job is None:
+            raise _client_error('ResourceNotFoundException', 'The batch job could not be found.', operation)
+        return job
+
+    def _status(self, job):
+        now = time.time()
+        if job['stopped']:
+            return 'Stopped'
+        if now < job['started_at']:
+            elapsed = now - job['submitTime'].timestamp()
+            waiting = job['started_at'] - job['submitTime'].timestamp()
+            return 'Submitted' if elapsed < waiting / 3 else 'Validating' if elapsed < waiting * 2 / 3 else 'Scheduled'
+        if now < job['completes_at']:
+            return 'InProgress'
+        return self._finalize(job)
+
+    def _finalize(self, job):
+        """Writes the output and manifest files once, returning the final status."""
+        with self.lock:
+            if job['finalized']:
+                return job['finalized']
+            job['finalized'] = 'InProgress'
+
+        output_uri = job['outputDataConfig']['s3OutputDataConfig']['s3Uri']
+        bucket, _, prefix = output_uri[len('s3://'):].partition('/')
+        prefix = f"{prefix.rstrip('/')}/{job['job_id']}/" if prefix else f"{job['job_id']}/"
+        runtime = self.emulator.services['bedrock-runtime']
+        lines = []
+        errors = 0
+        for record in job['records']:
+            line = {'recordId': record.get('recordId'), 'modelInput': record['modelInput']}
+            if self.latency.chance(self.config.get('record_error_rate')):
+                errors += 1
+                line['error'] = {'errorCode': 400, 'errorMessage': 'Record failed (injected by emulator)'}
+            else:
+                response = runtime.build_response(record['modelInput'])
+                line['modelOutput'] = response
+            lines.append(json.dumps(line))
+        self.emulator.s3.store(bucket, f"{prefix}{os.path.basename(job['input_key'])}.out", "\n".join(lines) + "\n")
+        self.emulator.s3.store(bucket, f"{prefix}manifest.json.out", json.dumps({
+            'totalRecordCount': len(job['records']),
+            'processedRecordCount': len(job['records']),
+            'successRecordCount': len(job['records']) - errors,
+            'errorRecordCount': errors
+        }))
+
+        status = 'PartiallyCompleted' if errors else 'Completed'
+        if errors == len(job['records']):
+            status = 'Failed'
+        with self.lock:
+            job['finalized'] = status
+        return status
+
+
+class AWSEmulator:
+    """Holds shared emulator state so every client sees the same buckets and jobs."""
+    def __init__(self, config=None):
+        self.config = _merge(DEFAULT_CONFIG, config if config is not None else load_config())
+        self.latency = LatencyModel(self.config)
+        self.s3 = EmulatedS3(self)
+        self.sqs = EmulatedSQS(self)
+        self.services = {
+            's3': self.s3,
+            'sqs': self.sqs,
+            'transcribe': EmulatedTranscribe(self),
+            'bedrock-runtime': EmulatedBedrockRuntime(self),
+            'bedrock-agent-runtime': EmulatedBedrockAgentRuntime(self),
+            'bedrock': EmulatedBedrock(self),
+        }
+
+    def client(self, service_name):
+        """Returns the emulated client for a service name, like boto3.client()."""
+        if service_name not in self.services:
+            raise ValueError(f"AWS emulator does not support service: {service_name}")
+        return self.services[service_name]
+
+
+_emulator = None
+_emulator_lock = threading.Lock()
+
+
+def get_emulator():
+    """Returns the process-wide emulator, creating it from configuration on first use."""
+    global _emulator
+    with _emulator_lock:
+        if _emulator is None:
+            _emulator = AWSEmulator()
+        return _emulator
+
+
+def reset_emulator(config=None):
+    """Replaces the process-wide emulator, e.g. between capacity-planning scenarios."""
+    global _emulator
+    with _emulator_lock:
+        _emulator = AWSEmulator(config)
+        return _emulator
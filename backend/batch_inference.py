@@ -0,0 +1,256 @@
+"""
+Bedrock batch inference for image-description backlogs
+Describing a back catalogue with one invoke_model call per image runs into the
+on-demand throughput quota. A batch inference job instead takes a JSONL file
+of Nova requests from S3, runs them on Bedrock's side (at batch pricing) and
+writes the responses back as JSONL:
+
+    write_input -> submit -> wait -> read_output
+
+describe_images() runs that lifecycle for a list of image files, splitting
+large backlogs into several jobs that run side by side. bulk_analyze.py
+--image-mode batch feeds the descriptions into the cultural analysis flow.
+Jobs take minutes to hours to start, so this is for offline audits only.
+
+Bedrock needs a service role it can assume to read and write the batch/
+prefix of the bucket, and rejects jobs smaller than BEDROCK_BATCH_MIN_RECORDS.
+
+Configuration:
+- BEDROCK_BATCH_ROLE_ARN: the service role (required on AWS)
+- BEDROCK_BATCH_MODEL_ID: model for batch jobs (default amazon.nova-pro-v1:0)
+- BEDROCK_BATCH_MIN_RECORDS: smallest job Bedrock accepts (default 100)
+- BEDROCK_BATCH_MAX_RECORDS: records per job; larger backlogs are split (default 50000)
+- BEDROCK_BATCH_POLL_SECONDS: time between job status checks (default 60)
+"""
+import json
+import math
+import os
+import tempfile
+import time
+import uuid
+
+import json_backend
+import metrics
+import usage
+from aws_clients import get_client
+from image_checker import build_image_request_body, detect_image_format
+
+BATCH_PREFIX = 'batch/'
+INPUT_FILE = 'input.jsonl'
+
+TERMINAL_STATUSES = ('Completed', 'PartiallyCompleted', 'Failed', 'Stopped', 'Expired')
+SUCCESS_STATUSES = ('Completed', 'PartiallyCompleted')
+
+JOBS = metrics.counter('bedrock_batch_jobs_total', 'Bedrock batch inference jobs by final status')
+RECORDS = metrics.counter('bedrock_batch_records_total', 'Bedrock batch inference records by outcome')
+JOB_SECONDS = metrics.histogram('bedrock_batch_job_seconds', 'Time from submitting a batch job to its final status')
+
+
+def min_records():
+    return int(os.getenv('BEDROCK_BATCH_MIN_RECORDS', '100'))
+
+
+def max_records():
+    return int(os.getenv('BEDROCK_BATCH_MAX_RECORDS', '50000'))
+
+
+def _bucket():
+    return os.getenv('S3_BUCKET_NAME', 'video-bucket-ken')
+
+
+def _split_s3_uri(uri):
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def split_batches(items, limit=None, minimum=None):
+    """
+    Splits items into evenly sized batches of at most `limit`, so no batch
+    falls below the minimum when a backlog is just over a multiple of the limit.
+    """
+    limit = limit or max_records()
+    minimum = minimum or min_records()
+    if len(items) < minimum:
+        raise ValueError(f"Batch inference needs at least {minimum} records, got {len(items)}")
+    count = math.ceil(len(items) / limit)
+    size = math.ceil(len(items) / count)
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def write_input(records, path, prompt="Describe this image in detail."):
+    """
+    Writes the batch input file: one {"recordId", "modelInput"} line per image,
+    modelInput being the same Nova request invoke_model would get. Images are
+    read and encoded one at a time, so memory stays flat however large the batch.
+    records: list of (record_id, image_path)
+    Returns: number of bytes written
+    """
+    with open(path, 'wb') as f:
+        for record_id, image_path in records:
+            with open(image_path, 'rb') as image:
+                image_bytes = image.read()
+            image_format = detect_image_format(image_bytes)
+            if image_format is None:
+                raise ValueError(f"Not a supported image: {image_path}")
+            f.write(b'{"recordId":' + json_backend.dumps(record_id) + b',"modelInput":')
+            f.write(build_image_request_body(image_bytes, image_format, prompt))
+            f.write(b'}\n')
+        return f.tell()
+
+
+def submit(input_path, job_name, bedrock=None, s3=None, bucket=None):
+    """
+    Uploads an input file and creates the batch job reading it.
+    Returns: the job ARN
+    """
+    bedrock = bedrock or get_client('bedrock', region_name=os.getenv('AWS_DEFAULT_REGION', 'us-east-1'))
+    s3 = s3 or get_client('s3')
+    bucket = bucket or _bucket()
+    prefix = f"{BATCH_PREFIX}{job_name}/"
+
+    s3.upload_file(input_path, bucket, prefix + INPUT_FILE)
+    response = bedrock.create_model_invocation_job(
+        jobName=job_name,
+        roleArn=os.getenv('BEDROCK_BATCH_ROLE_ARN', 'arn:aws:iam::000000000000:role/bedrock-batch'),
+        modelId=os.getenv('BEDROCK_BATCH_MODEL_ID', 'amazon.nova-pro-v1:0'),
+        inputDataConfig={'s3InputDataConfig': {'s3Uri': f"s3://{bucket}/{prefix}{INPUT_FILE}", 's3InputFormat': 'JSONL'}},
+        outputDataConfig={'s3OutputDataConfig': {'s3Uri': f"s3://{bucket}/{prefix}output/"}}
+    )
+    return response['jobArn']
+
+
+def wait(job_arn, bedrock=None, poll_seconds=None, submitted_at=None):
+    """
+    Polls a batch job until it reaches a final status.
+    Returns: the final get_model_invocation_job description
+    """
+    bedrock = bedrock or get_client('bedrock', region_name=os.getenv('AWS_DEFAULT_REGION', 'us-east-1'))
+    poll_seconds = float(poll_seconds if poll_seconds is not None else os.getenv('BEDROCK_BATCH_POLL_SECONDS', '60'))
+    while True:
+        job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+        if job['status'] in TERMINAL_STATUSES:
+            JOBS.inc(status=job['status'])
+            if submitted_at is not None:
+                JOB_SECONDS.observe(time.time() - submitted_at)
+            return job
+        time.sleep(poll_seconds)
+
+
+def _iter_lines(body):
+    pending = b''
+    for chunk in body.iter_chunks(1024 * 1024):
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        yield from lines
+    if pending:
+        yield pending
+
+
+def read_output(job, s3=None):
+    """
+    Reads a finished job's output file.
+    Returns: dict of record_id -> (description, error), one error per failed record
+    """
+    s3 = s3 or get_client('s3')
+    output_uri = job['outputDataConfig']['s3OutputDataConfig']['s3Uri'].rstrip('/')
+    input_name = os.path.basename(job['inputDataConfig']['s3InputDataConfig']['s3Uri'])
+    job_id = job['jobArn'].rsplit('/', 1)[-1]
+    bucket, key = _split_s3_uri(f"{output_uri}/{job_id}/{input_name}.out")
+
+    results = {}
+    for line in _iter_lines(s3.get_object(Bucket=bucket, Key=key)['Body']):
+        if not line.strip():
+            continue
+        record = json_backend.loads(line)
+        if 'modelOutput' in record:
+            usage.record_model('image_description', job['modelId'], record['modelOutput'].get('usage'), batch=True)
+            description = record['modelOutput']['output']['message']['content'][0]['text']
+            results[record['recordId']] = (description, None)
+            RECORDS.inc(outcome='success')
+        else:
+            error = record.get('error', {})
+            results[record['recordId']] = (None, error.get('errorMessage', 'Record failed'))
+            RECORDS.inc(outcome='failed')
+    return results
+
+
+def _load_state(state_path):
+    if state_path and os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"jobs": []}
+
+
+def _save_state(state_path, state):
+    if state_path:
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(state_path + '.tmp', state_path)
+
+
+def describe_images(image_paths, state_path=None, poll_seconds=None, bedrock=None, s3=None):
+    """
+    Describes images with batch inference jobs. Submitted jobs are recorded in
+    state_path, so an interrupted run resumes waiting for them instead of
+    submitting the images again; jobs that did not succeed are dropped from it.
+    New images too few to make a job while resuming are not submitted; they map
+    to (None, None), for the caller to describe on demand.
+    Returns tuple: (descriptions, logs, success) where descriptions maps each
+    path to (description, error)
+    """
+    logs = []
+    wanted = set(image_paths)
+    state = _load_state(state_path)
+    # Jobs whose images have all been dealt with since are forgotten
+    state['jobs'] = [job for job in state['jobs'] if wanted.intersection(job['records'].values())]
+    covered = {path for job in state['jobs'] for path in job['records'].values()}
+    new_paths = [path for path in image_paths if path not in covered]
+    if covered:
+        logs.append(f"Resuming {len(state['jobs'])} batch jobs covering {len(covered)} images")
+
+    leftover = []
+    if new_paths and state['jobs'] and len(new_paths) < min_records():
+        # Too few for a job of their own; the resumed jobs are still collected
+        leftover = new_paths
+        new_paths = []
+        logs.append(f"{len(leftover)} new images are below the batch job minimum of {min_records()}; "
+                    f"left for on-demand description")
+
+    if new_paths:
+        for batch in split_batches(new_paths):
+            job_name = f"image-descriptions-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            records = {f"IMG{index:08d}": path for index, path in enumerate(batch)}
+            fd, input_path = tempfile.mkstemp(suffix='.jsonl', prefix='batch_')
+            os.close(fd)
+            try:
+                size = write_input(list(records.items()), input_path)
+                job_arn = submit(input_path, job_name, bedrock=bedrock, s3=s3)
+            finally:
+                os.unlink(input_path)
+            state['jobs'].append({"job_arn": job_arn, "submitted_at": time.time(), "records": records})
+            _save_state(state_path, state)
+            logs.append(f"Submitted batch job {job_name}: {len(records)} images, {size} bytes of input")
+
+    descriptions = {}
+    kept = []
+    for job_state in state['jobs']:
+        job = wait(job_state['job_arn'], bedrock=bedrock, poll_seconds=poll_seconds,
+                   submitted_at=job_state.get('submitted_at'))
+        logs.append(f"Batch job {job['jobName']} finished: {job['status']}")
+        if job['status'] not in SUCCESS_STATUSES:
+            for path in job_state['records'].values():
+                descriptions[path] = (None, f"Batch job {job['status']}: {job.get('message', '')}".strip(': '))
+            continue
+        kept.append(job_state)
+        results = read_output(job, s3=s3)
+        for record_id, path in job_state['records'].items():
+            descriptions[path] = results.get(record_id, (None, "Missing from batch output"))
+
+    state['jobs'] = kept
+    _save_state(state_path, state)
+    descriptions = {path: value for path, value in descriptions.items() if path in wanted}
+    for path in leftover:
+        descriptions[path] = (None, None)
+    succeeded = sum(1 for description, _ in descriptions.values() if description is not None)
+    logs.append(f"Described {succeeded} of {len(image_paths)} images")
+    return descriptions, logs, succeeded > 0
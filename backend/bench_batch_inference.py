@@ -0,0 +1,83 @@
+"""
+Image description throughput: on-demand invoke_model vs batch inference
+Describes the same backlog both ways against the AWS emulator, with time
+compressed by --time-scale:
+- on-demand: --concurrency threads calling ImageToTextPipeline.describe_image,
+  paced by the resilience layer to an account quota of --quota requests/s
+- batch: batch_inference.describe_images (queue time, then --record-seconds
+  per record, jobs of up to BEDROCK_BATCH_MAX_RECORDS running side by side)
+
+The batch timings are assumptions fed to the emulator, not measurements of
+Bedrock; set them from your own jobs' history for a realistic comparison.
+Records are small synthetic JPEGs so local encoding time, which the time
+scale would magnify, stays negligible.
+
+    python bench_batch_inference.py --images 2000 --quota 2 --queue-seconds 900 --record-seconds 0.05
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare on-demand and batch image description throughput")
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16, help="On-demand worker threads")
+    parser.add_argument("--quota", type=float, default=2.0, help="On-demand invoke_model requests per second")
+    parser.add_argument("--latency", type=float, default=2.5, help="Median on-demand invoke_model seconds")
+    parser.add_argument("--queue-seconds", type=float, default=900, help="Batch job time before records run")
+    parser.add_argument("--record-seconds", type=float, default=0.05, help="Batch processing time per record")
+    parser.add_argument("--time-scale", type=float, default=0.002, help="Emulated seconds are multiplied by this")
+    args = parser.parse_args()
+
+    scale = args.time_scale
+    os.environ['AWS_BACKEND'] = 'emulator'
+    # The client-side limiter paces to the quota, so on-demand is limited by the quota rather than by retries
+    os.environ['AWS_RATE_LIMITS'] = json.dumps({"bedrock-runtime": {"rate": args.quota / scale, "burst": 1}})
+    os.environ['BEDROCK_BATCH_POLL_SECONDS'] = str(30 * scale)
+
+    import aws_emulator
+    import batch_inference
+    from image_checker import ImageToTextPipeline
+
+    aws_emulator.reset_emulator({
+        "time_scale": scale,
+        "latency": {"bedrock-runtime.invoke_model": {"distribution": "lognormal", "median": args.latency, "sigma": 0.3}},
+        "capacity": {"bedrock-runtime.invoke_model": {"rate": args.quota, "burst": args.quota}},
+        "batch": {"queue_seconds": args.queue_seconds, "record_seconds": args.record_seconds}
+    })
+
+    workdir = tempfile.mkdtemp(prefix='bench_batch_')
+    image = b'\xff\xd8\xff' + os.urandom(2048)
+    paths = []
+    for index in range(args.images):
+        path = os.path.join(workdir, f"image_{index:06d}.jpg")
+        with open(path, 'wb') as f:
+            f.write(image)
+        paths.append(path)
+
+    started = time.monotonic()
+    pipeline = ImageToTextPipeline()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        on_demand_ok = sum(1 for _, _, success in pool.map(pipeline.describe_image, paths) if success)
+    on_demand_seconds = (time.monotonic() - started) / scale
+
+    started = time.monotonic()
+    descriptions, logs, _ = batch_inference.describe_images(paths)
+    batch_seconds = (time.monotonic() - started) / scale
+    shutil.rmtree(workdir, ignore_errors=True)
+    batch_ok = sum(1 for description, _ in descriptions.values() if description is not None)
+
+    print(f"{args.images} images; on-demand quota {args.quota:g}/s with {args.concurrency} workers; "
+          f"batch queue {args.queue_seconds:g}s + {args.record_seconds:g}s/record")
+    print(f"{'mode':<10} {'described':>10} {'seconds':>10} {'images/hour':>12}")
+    for name, ok, seconds in (("on-demand", on_demand_ok, on_demand_seconds), ("batch", batch_ok, batch_seconds)):
+        print(f"{name:<10} {ok:>10} {seconds:>10.0f} {ok / seconds * 3600:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
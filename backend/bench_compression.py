@@ -0,0 +1,102 @@
+"""
+Request/response compression benchmark
+Measures what gzip and zstd (at the levels compression.py uses) save on the
+payloads this API moves, and what that is worth on slower client links:
+- an /image-to-text request carrying a base64 JPEG (test_image.jpg if present)
+- a /text-to-text request
+- a large analysis response with flow trace events
+
+The link is simulated (transfer = round trip + bytes / bandwidth), not shaped.
+
+    python bench_compression.py --mbits 1 10 100 --rtt-ms 50
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from bench_json import analysis_response
+
+
+def image_request():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_image.jpg')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            image = f.read()
+    else:
+        image = os.urandom(512 * 1024)
+    return json.dumps({
+        "image_data": base64.b64encode(image).decode('utf-8'),
+        "prompt": "Describe this image in detail."
+    }).encode('utf-8')
+
+
+def text_request():
+    paragraph = ("Our new campaign celebrates the festival with family gatherings, traditional food "
+                 "and greetings for customers across the region. ")
+    return json.dumps({"text": paragraph * 200}).encode('utf-8')
+
+
+def codecs():
+    gzip_level = int(os.getenv('GZIP_LEVEL', '6'))
+    found = [("gzip", lambda d: gzip.compress(d, gzip_level), gzip.decompress)]
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=int(os.getenv('ZSTD_LEVEL', '3')))
+        decompressor = zstandard.ZstdDecompressor()
+        found.append(("zstd", compressor.compress, decompressor.decompress))
+    return found
+
+
+def timed(func, arg, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def transfer_ms(size, mbits, rtt_ms):
+    return rtt_ms + size * 8 / (mbits * 1_000_000) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gzip and zstd on API payloads")
+    parser.add_argument("--mbits", type=float, nargs="*", default=[1, 10, 100], help="Link speeds in Mbit/s")
+    parser.add_argument("--rtt-ms", type=float, default=50)
+    parser.add_argument("--response-mb", type=float, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if zstandard is None:
+        print("zstandard is not installed; only gzip is measured")
+
+    payloads = [
+        ("image request", image_request()),
+        ("text request", text_request()),
+        ("analysis response", json.dumps(analysis_response(args.response_mb)).encode('utf-8')),
+    ]
+    links = " ".join(f"{f'{m:g}Mb/s ms':>12}" for m in args.mbits)
+    print(f"{'payload':<18} {'encoding':<9} {'bytes':>10} {'ratio':>6} {'comp ms':>8} {'decomp ms':>9} {links}")
+    for name, data in payloads:
+        identity = " ".join(f"{transfer_ms(len(data), m, args.rtt_ms):>12.1f}" for m in args.mbits)
+        print(f"{name:<18} {'identity':<9} {len(data):>10} {1:>6.1f} {'-':>8} {'-':>9} {identity}")
+        for encoding, compress, decompress in codecs():
+            compress_seconds, encoded = timed(compress, data, args.repeat)
+            decompress_seconds, _ = timed(decompress, encoded, args.repeat)
+            # Both ends pay their codec time on top of the transfer
+            codec_ms = (compress_seconds + decompress_seconds) * 1000
+            totals = " ".join(f"{transfer_ms(len(encoded), m, args.rtt_ms) + codec_ms:>12.1f}" for m in args.mbits)
+            print(f"{'':<18} {encoding:<9} {len(encoded):>10} {len(data) / len(encoded):>6.1f} "
+                  f"{compress_seconds * 1000:>8.1f} {decompress_seconds * 1000:>9.1f} {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Image ingest benchmark: base64 JSON vs raw bytes
+Compares the server-side cost of the two image routes, starting from the
+request body as it arrives and ending when the Bedrock request is on the wire:
+- /image-analysis: JSON body -> image_base64 string -> invoke_model JSON body
+- /image-analysis/binary: image bytes -> invoke_model body with the base64
+  written straight into it
+
+Reports the peak Python heap above the received body (tracemalloc) and the
+median latency per request. Bedrock and the flow are emulated with no latency.
+
+    python bench_image_ingest.py --sizes 1 5 20 --repeat 5
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+os.environ['AWS_BACKEND'] = 'emulator'
+os.environ.setdefault('AWS_RESILIENCE', '0')
+os.environ.setdefault('MEDIA_WORKERS', '0')
+
+import aws_emulator  # noqa: E402
+from aws_emulator import EmulatedBedrockRuntime, StreamingBody  # noqa: E402
+from app import ImageAnalysisRequest  # noqa: E402
+from image_checker import process_base64_image_and_get_analysis, process_image_bytes_and_get_analysis  # noqa: E402
+
+RESPONSE = {'output': {'message': {'role': 'assistant', 'content': [{'text': 'A benchmark image.'}]}},
+            'stopReason': 'end_turn', 'usage': {'inputTokens': 1300, 'outputTokens': 5, 'totalTokens': 1305}}
+
+
+class WireBedrockRuntime(EmulatedBedrockRuntime):
+    """Answers invoke_model without parsing the body, which is already in its wire format."""
+    def invoke_model(self, modelId, body, **kwargs):
+        return {'body': StreamingBody(json.dumps(RESPONSE).encode('utf-8'))}
+
+
+def base64_route(body):
+    request = ImageAnalysisRequest(**json.loads(body))
+    return process_base64_image_and_get_analysis(request.image_base64, request.image_format, request.country)
+
+
+def binary_route(body):
+    return process_image_bytes_and_get_analysis(body, 'jpeg', 'Malaysia')
+
+
+def measure(route, body, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, _, success = route(body)
+        latencies.append(time.perf_counter() - started)
+        assert success
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    route(body)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return statistics.median(latencies), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the base64 and binary image routes")
+    parser.add_argument("--sizes", type=float, nargs="*", default=[1, 5, 20], help="Image sizes in MB")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    emulator = aws_emulator.reset_emulator({})
+    emulator.services['bedrock-runtime'] = WireBedrockRuntime(emulator)
+
+    print(f"{'MB':>5} {'route':<8} {'body MB':>8} {'peak MB':>8} {'peak/image':>10} {'median ms':>10}")
+    for megabytes in args.sizes:
+        image = b'\xff\xd8\xff' + os.urandom(int(megabytes * 1024 * 1024))
+        routes = [
+            ("base64", base64_route, json.dumps({
+                "image_base64": base64.b64encode(image).decode('ascii'),
+                "image_format": "jpeg",
+                "country": "Malaysia"
+            }).encode('utf-8')),
+            ("binary", binary_route, image),
+        ]
+        for name, route, body in routes:
+            latency, peak = measure(route, body, args.repeat)
+            print(f"{megabytes:>5g} {name:<8} {len(body) / 2**20:>8.1f} {peak / 2**20:>8.1f} "
+                  f"{peak / len(image):>9.1f}x {latency * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+JSON serialisation microbenchmarks
+Compares the standard library with orjson on the three hot paths:
+- dumps of the Nova native_request carrying a base64 image
+- loads of a Transcribe transcript document
+- dumps of a large nested analysis response
+
+    python bench_json.py --sizes 1 10 50 --repeat 5
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def stdlib_loads(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def native_request(megabytes):
+    image = base64.b64encode(os.urandom(int(megabytes * 1024 * 1024 * 3 / 4))).decode('utf-8')
+    return {
+        "schemaVersion": "messages-v1",
+        "system": [{"text": "You are an expert image analyst."}],
+        "messages": [{"role": "user", "content": [
+            {"image": {"format": "jpeg", "source": {"bytes": image}}},
+            {"text": "Describe this image in detail."}
+        ]}],
+        "inferenceConfig": {"maxTokens": 10240, "temperature": 0.3, "topP": 0.9}
+    }
+
+
+def transcript_document(megabytes):
+    """Transcribe-shaped output whose per-word items add up to roughly `megabytes` MB."""
+    item = {
+        "start_time": "12.34", "end_time": "12.71",
+        "alternatives": [{"confidence": "0.998", "content": "campaign"}],
+        "type": "pronunciation"
+    }
+    count = int(megabytes * 1024 * 1024 / len(json.dumps(item)))
+    return stdlib_dumps({
+        "jobName": "transcribe_benchmark",
+        "results": {
+            "transcripts": [{"transcript": "campaign " * count}],
+            "items": [item] * count
+        },
+        "status": "COMPLETED"
+    })
+
+
+def analysis_response(megabytes):
+    """Nested dicts and lists like analysis_result / bedrock_analysis with trace events."""
+    event = {"type": "trace", "data": {"trace": {"nodeOutputTrace": {
+        "nodeName": "CulturalAnalysisPrompt",
+        "fields": [{"nodeOutputName": "modelCompletion", "content": {"document": "Risk notes " * 20}}]
+    }}}}
+    count = int(megabytes * 1024 * 1024 / len(json.dumps(event)))
+    return {"success": True, "bedrock_analysis": {"bedrock_results": [event] * count, "flow_outputs": []}}
+
+
+def timed(func, arg, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stdlib json against orjson")
+    parser.add_argument("--sizes", type=float, nargs="*", default=[1, 10, 50], help="Payload sizes in MB")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed; only the standard library is measured")
+
+    print(f"{'case':<20} {'MB':>5} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8}")
+    for megabytes in args.sizes:
+        cases = [
+            ("native_request dumps", stdlib_dumps, (lambda o: orjson.dumps(o)) if orjson else None,
+             native_request(megabytes)),
+            ("transcript loads", stdlib_loads, orjson.loads if orjson else None,
+             transcript_document(megabytes)),
+            ("response dumps", stdlib_dumps, (lambda o: orjson.dumps(o)) if orjson else None,
+             analysis_response(megabytes)),
+        ]
+        for name, stdlib_func, fast_func, payload in cases:
+            stdlib_seconds = timed(stdlib_func, payload, args.repeat)
+            if fast_func:
+                fast_seconds = timed(fast_func, payload, args.repeat)
+                print(f"{name:<20} {megabytes:>5g} {stdlib_seconds * 1000:>10.1f} "
+                      f"{fast_seconds * 1000:>10.1f} {stdlib_seconds / fast_seconds:>7.1f}x")
+            else:
+                print(f"{name:<20} {megabytes:>5g} {stdlib_seconds * 1000:>10.1f} {'-':>10} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
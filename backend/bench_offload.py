@@ -0,0 +1,57 @@
+"""
+Media offload throughput benchmark
+Simulates concurrent /speech-to-text requests decoding base64 video into temp
+files, first inline on request threads and then with 1..N media worker
+processes, and reports throughput for each worker count.
+
+    python bench_offload.py --payload-mb 20 --requests 32 --threads 16 --workers 0 1 2 4 8
+"""
+import argparse
+import base64
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import media_offload
+
+
+def run(data, requests, threads):
+    def one(_):
+        path, size = media_offload.decode_base64_to_file(data, suffix='.mp4', prefix='bench_')
+        os.unlink(path)
+        return size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        decoded = sum(pool.map(one, range(requests)))
+    return time.perf_counter() - started, decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of base64 media decoding by worker count")
+    parser.add_argument("--payload-mb", type=float, default=20.0, help="Decoded size of each synthetic video")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent request threads")
+    parser.add_argument("--workers", type=int, nargs="*", default=[0, 1, 2, 4, 8])
+    args = parser.parse_args()
+
+    data = base64.b64encode(os.urandom(int(args.payload_mb * 1024 * 1024))).decode('ascii')
+    print(f"CPUs: {os.cpu_count()}  payload: {args.payload_mb:g} MB x {args.requests} requests, "
+          f"{args.threads} request threads")
+    print(f"{'workers':>8} {'seconds':>9} {'MB/s':>9} {'req/s':>8}")
+
+    os.environ['MEDIA_OFFLOAD_MIN_BYTES'] = '0'
+    for workers in args.workers:
+        os.environ['MEDIA_WORKERS'] = str(workers)
+        media_offload.shutdown()
+        if workers:
+            # Start the workers before timing
+            media_offload.get_pool().submit(int, 0).result()
+        elapsed, decoded = run(data, args.requests, args.threads)
+        label = "inline" if workers == 0 else str(workers)
+        print(f"{label:>8} {elapsed:>9.2f} {decoded / 1024 / 1024 / elapsed:>9.1f} {args.requests / elapsed:>8.2f}")
+    media_offload.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Throttling benchmark for the resilience layer
+Runs bursts of concurrent Nova calls against the AWS emulator with a capacity
+quota and compares naive immediate client retries with the resilience layer
+(shared adaptive rate limiter, jittered backoff, circuit breaker).
+
+    python bench_resilience.py --workers 32 --requests 200 --capacity 5
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_emulator
+import resilience
+
+NOVA_REQUEST = json.dumps({
+    "schemaVersion": "messages-v1",
+    "messages": [{"role": "user", "content": [{"text": "Describe this image in detail."}]}],
+    "inferenceConfig": {"maxTokens": 512}
+})
+
+
+def naive_call(client, retries):
+    """What clients do today: retry straight away when the call fails."""
+    for attempt in range(retries + 1):
+        try:
+            return client.invoke_model(modelId='us.amazon.nova-pro-v1:0', body=NOVA_REQUEST)
+        except Exception:
+            if attempt == retries:
+                raise
+
+
+def run_scenario(name, call, workers, requests):
+    successes = 0
+    lock = threading.Lock()
+    latencies = []
+
+    def one(_):
+        nonlocal successes
+        started = time.perf_counter()
+        try:
+            call()
+            ok = True
+        except Exception:
+            ok = False
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            successes += ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "succeeded": successes,
+        "success_rate": successes / requests,
+        "elapsed_seconds": round(elapsed, 2),
+        "p50_seconds": round(latencies[len(latencies) // 2], 3),
+        "p99_seconds": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare naive retries with the resilience layer under throttling")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--capacity", type=float, default=5.0, help="Emulated invoke_model quota (calls/second)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Emulated invoke_model latency (seconds)")
+    parser.add_argument("--naive-retries", type=int, default=3)
+    args = parser.parse_args()
+
+    config = {
+        "latency": {"bedrock-runtime.invoke_model": {"distribution": "constant", "seconds": args.latency}},
+        "capacity": {"bedrock-runtime.invoke_model": {"rate": args.capacity, "burst": args.capacity}}
+    }
+
+    results = []
+
+    emulator = aws_emulator.reset_emulator(config)
+    raw_client = emulator.client('bedrock-runtime')
+    results.append(run_scenario("naive retries", lambda: naive_call(raw_client, args.naive_retries),
+                                args.workers, args.requests))
+
+    emulator = aws_emulator.reset_emulator(config)
+    resilience.reset_dependencies()
+    wrapped = resilience.wrap_client(emulator.client('bedrock-runtime'), 'bedrock-runtime')
+    results.append(run_scenario("resilience layer", lambda: naive_call(wrapped, 0),
+                                args.workers, args.requests))
+
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
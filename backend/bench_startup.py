@@ -0,0 +1,68 @@
+"""
+Cold start benchmark
+Measures, in a fresh interpreter per run, the time to import the app (including
+the Lambda handler and its startup hooks) and the latency of the first and
+second requests, for each STARTUP_MODE.
+
+    python bench_startup.py --runs 5                  # against the AWS emulator
+    python bench_startup.py --runs 5 --backend aws    # against real AWS
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD_SCRIPT = r"""
+import json, time
+started = time.perf_counter()
+import lambda_handler
+imported = time.perf_counter()
+
+event = {
+    "version": "2.0",
+    "rawPath": "/text-analysis",
+    "rawQueryString": "",
+    "headers": {"content-type": "application/json"},
+    "requestContext": {"http": {"method": "POST", "path": "/text-analysis", "sourceIp": "127.0.0.1"}},
+    "body": json.dumps({"text_content": "Selamat pagi! Nasi lemak for breakfast.", "country": "Malaysia"}),
+    "isBase64Encoded": False,
+}
+timings = {"import_and_startup": imported - started}
+for name in ("first_request", "second_request"):
+    request_started = time.perf_counter()
+    response = lambda_handler.handler(event, None)
+    timings[name] = time.perf_counter() - request_started
+    timings[name + "_status"] = response["statusCode"]
+print(json.dumps(timings))
+"""
+
+
+def run_once(mode, backend):
+    env = dict(os.environ, STARTUP_MODE=mode, AWS_BACKEND=backend)
+    output = subprocess.run([sys.executable, "-c", CHILD_SCRIPT], env=env, capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and first-request latency per startup mode")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="emulator", choices=["emulator", "aws"])
+    parser.add_argument("--modes", nargs="*", default=["lazy", "prewarm"])
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'import+startup ms':>18} {'first request ms':>17} {'second request ms':>18}")
+    for mode in args.modes:
+        runs = [run_once(mode, args.backend) for _ in range(args.runs)]
+        medians = {
+            key: statistics.median(run[key] for run in runs) * 1000
+            for key in ("import_and_startup", "first_request", "second_request")
+        }
+        print(f"{mode:<10} {medians['import_and_startup']:>18.1f} {medians['first_request']:>17.1f} "
+              f"{medians['second_request']:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
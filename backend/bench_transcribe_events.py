@@ -0,0 +1,121 @@
+"""
+Transcribe completion detection benchmark
+Runs speech-to-text jobs against the emulator twice, once detecting completion
+by polling only and once with the SQS completion-event consumer, and reports
+how long each job waited after Transcribe finished and how many status polls
+were made. Emulated time is compressed by --time-scale; reported seconds are
+scaled back to real-AWS time.
+
+    python bench_transcribe_events.py --jobs 20 --time-scale 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ['AWS_BACKEND'] = 'emulator'
+# Client-side rate limits run in real time and would distort compressed emulator time
+os.environ['AWS_RESILIENCE'] = '0'
+
+import metrics
+import transcribe_events
+from aws_emulator import reset_emulator
+from speech_to_text import MP4ToTextPipeline
+
+
+def histogram_values(name, **labels):
+    """Returns (sum, count) of a histogram from the metrics registry."""
+    total = count = 0.0
+    suffix = "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}" if labels else ""
+    for line in metrics.render().splitlines():
+        if line.startswith(f"{name}_sum{suffix} "):
+            total = float(line.split()[-1])
+        elif line.startswith(f"{name}_count{suffix} "):
+            count = float(line.split()[-1])
+    return total, count
+
+
+def counter_value(name):
+    return sum(float(line.split()[-1]) for line in metrics.render().splitlines()
+               if line.startswith(name) and not line.startswith('#'))
+
+
+def run(mode, args, videos):
+    scale = args.time_scale
+    reset_emulator({
+        "seed": args.seed,
+        "time_scale": scale,
+        "transcribe": {
+            "queue_seconds": {"distribution": "exponential", "mean": 5},
+            "job_seconds": {"distribution": "uniform", "low": 30, "high": 90},
+            "events_queue": "transcribe-events",
+            "event_delay": {"distribution": "uniform", "low": 0.5, "high": 2}
+        }
+    })
+    os.environ['TRANSCRIBE_POLL_SECONDS'] = str(10 * scale)
+    os.environ['TRANSCRIBE_EVENTS_FALLBACK_POLL_SECONDS'] = str(60 * scale)
+    if mode == 'events':
+        os.environ['TRANSCRIBE_EVENTS_QUEUE_URL'] = 'transcribe-events'
+        transcribe_events.start()
+
+    pipeline = MP4ToTextPipeline()
+    polls_before = counter_value('transcribe_status_polls_total')
+    lag_before = histogram_values('transcribe_completion_lag_seconds', source='event' if mode == 'events' else 'poll')
+
+    def one(video):
+        started = time.perf_counter()
+        text, _, success = pipeline.process_video_detailed(video)
+        return time.perf_counter() - started, success
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(one, videos))
+
+    transcribe_events.stop()
+    os.environ.pop('TRANSCRIBE_EVENTS_QUEUE_URL', None)
+
+    lag_sum, lag_count = histogram_values('transcribe_completion_lag_seconds',
+                                          source='event' if mode == 'events' else 'poll')
+    lag_sum, lag_count = lag_sum - lag_before[0], lag_count - lag_before[1]
+    return {
+        "ok": sum(1 for _, success in results if success),
+        "end_to_end": statistics.mean(seconds for seconds, _ in results) / scale,
+        "lag": (lag_sum / lag_count / scale) if lag_count else float('nan'),
+        "polls": (counter_value('transcribe_status_polls_total') - polls_before) / args.jobs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polling vs event-driven Transcribe completion")
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--time-scale", type=float, default=0.05, help="Emulated seconds per real-AWS second")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # One file per job: job names are derived from the file name
+    videos = []
+    for _ in range(args.jobs):
+        with tempfile.NamedTemporaryFile(suffix='.mp4', prefix='bench_', delete=False) as f:
+            f.write(os.urandom(1024))
+            videos.append(f.name)
+    try:
+        print(f"{args.jobs} jobs, job time 30-90 s, events delivered 0.5-2 s after completion, poll every 10 s")
+        print(f"{'mode':<8} {'ok':>4} {'mean e2e s':>11} {'mean lag s':>11} {'polls/job':>10}")
+        results = {}
+        for mode in ('poll', 'events'):
+            results[mode] = run(mode, args, videos)
+            r = results[mode]
+            print(f"{mode:<8} {r['ok']:>4} {r['end_to_end']:>11.1f} {r['lag']:>11.2f} {r['polls']:>10.1f}")
+        saved_sum, saved_count = histogram_values('transcribe_event_latency_saved_seconds')
+        if saved_count:
+            print(f"latency saved per job (vs next poll): {saved_sum / saved_count / args.time_scale:.2f} s")
+    finally:
+        for video in videos:
+            os.unlink(video)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
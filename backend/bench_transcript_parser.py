@@ -0,0 +1,97 @@
+"""
+Transcript parsing benchmark
+Compares reading a Transcribe output document whole (read() + json_backend.loads,
+as save_transcript_text did) with transcript_parser's streaming parse, on
+synthetic transcripts of hour-long media. Reports the best time and the peak
+traced memory of each; the document itself is built before tracing starts.
+
+    python bench_transcript_parser.py --hours 1 4 --repeat 3
+"""
+import argparse
+import time
+import tracemalloc
+
+import json_backend
+import transcript_parser
+from aws_emulator import StreamingBody
+
+WORDS = ("the", "campaign", "launches", "across", "markets", "with", "local", "partners", "and", "gestures")
+
+
+def transcript_document(hours, words_per_second=2.5):
+    """Transcribe-shaped output for `hours` of speech, with punctuation every twelfth word."""
+    items = []
+    words = []
+    count = int(hours * 3600 * words_per_second)
+    for index in range(count):
+        start = index / words_per_second
+        word = WORDS[index % len(WORDS)]
+        words.append(word)
+        items.append({"start_time": f"{start:.3f}", "end_time": f"{start + 0.3:.3f}",
+                      "alternatives": [{"confidence": "0.998", "content": word}], "type": "pronunciation"})
+        if index % 12 == 11:
+            items.append({"alternatives": [{"confidence": "0.0", "content": "."}], "type": "punctuation"})
+    return json_backend.dumps({
+        "jobName": "transcribe_benchmark",
+        "accountId": "000000000000",
+        "results": {
+            "language_code": "en-US",
+            "transcripts": [{"transcript": " ".join(words)}],
+            "items": items,
+            "language_identification": [{"code": "en-US", "score": "0.97"}]
+        },
+        "status": "COMPLETED"
+    })
+
+
+def full_load(data):
+    document = json_backend.loads(StreamingBody(data).read())
+    results = document['results']
+    duration = max((float(item['end_time']) for item in results['items'] if 'end_time' in item), default=0.0)
+    return results['transcripts'][0]['transcript'], results.get('language_identification'), duration
+
+
+def streamed(data, word_timings=False):
+    result = transcript_parser.parse(StreamingBody(data), word_timings=word_timings)
+    return result['transcript'], result['language_identification'], result['duration']
+
+
+def measure(func, data, repeat):
+    """Returns (best seconds, peak traced bytes)."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark whole-document and streaming transcript parsing")
+    parser.add_argument("--hours", type=float, nargs="*", default=[1, 4], help="Media durations to synthesise")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"json backend: {json_backend.BACKEND}, transcript parser: {transcript_parser.BACKEND}")
+    print(f"{'case':<22} {'hours':>5} {'MB':>7} {'ms':>9} {'peak MB':>9}")
+    for hours in args.hours:
+        data = transcript_document(hours)
+        expected = full_load(data)
+        cases = [
+            ("read + loads", full_load),
+            ("streamed", streamed),
+            ("streamed + timings", lambda d: streamed(d, word_timings=True)),
+        ]
+        for name, func in cases:
+            if func(data) != expected:
+                raise SystemExit(f"{name} disagrees with the whole-document parse")
+            seconds, peak = measure(func, data, args.repeat)
+            print(f"{name:<22} {hours:>5g} {len(data) / 1e6:>7.1f} {seconds * 1000:>9.1f} {peak / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
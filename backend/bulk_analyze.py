@@ -0,0 +1,377 @@
+"""
+Bulk offline analysis of text, image and video files
+Walks directories (or reads a manifest), runs every supported file through
+the matching pipeline and appends one JSON line per file to the output:
+
+    python bulk_analyze.py assets/ --output results.jsonl
+    python bulk_analyze.py --manifest audit.txt --concurrency text=16,image=8,video=4
+
+- .txt/.md -> cultural analysis flow; images -> Nova Pro description + flow
+  (raw bytes, see image_checker.process_image_bytes_and_get_analysis);
+  .mp4 -> Transcribe, plus the flow unless --no-bedrock
+- Each media type has its own worker pool, so slow videos never hold up text.
+- --image-mode batch describes the images with Bedrock batch inference jobs
+  instead of one invoke_model call each (see batch_inference), then runs the
+  flow on the descriptions. For large offline backlogs only: jobs can take hours.
+- Upstream calls run in the scheduler's bulk class (--priority), so they
+  leave the capacity reserved for interactive checks alone.
+- The output file is the checkpoint: every result is flushed as it finishes,
+  and a rerun skips files already recorded as successful (unless they changed
+  since). Failed files are retried on the next run; --skip-failed keeps them.
+
+A manifest holds one path per line, or JSON lines {"path": ..., "country": ...}.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import scheduler
+from aws_clients import load_environment
+
+TEXT_EXTENSIONS = ('.txt', '.md')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+# start_transcription submits every video as MediaFormat mp4
+VIDEO_EXTENSIONS = ('.mp4',)
+
+DEFAULT_CONCURRENCY = {"text": 16, "image": 8, "video": 4}
+
+
+def media_type(path):
+    """Returns 'text', 'image' or 'video' for a supported file, otherwise None."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TEXT_EXTENSIONS:
+        return "text"
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+def parse_concurrency(value):
+    """Parses 'text=16,image=8,video=4' over DEFAULT_CONCURRENCY."""
+    concurrency = dict(DEFAULT_CONCURRENCY)
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        name, _, count = part.partition("=")
+        name = name.strip()
+        if name not in concurrency:
+            raise ValueError(f"Unknown media type in --concurrency: {name}")
+        concurrency[name] = max(1, int(count))
+    return concurrency
+
+
+def discover(paths, manifest=None, country="Malaysia"):
+    """
+    Yields (path, country) for every supported file under the given paths
+    and in the manifest, each file once, in a stable order.
+    """
+    seen = set()
+
+    def candidates():
+        for path in paths:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        yield os.path.join(root, name), country
+            else:
+                yield path, country
+        if manifest:
+            with open(manifest, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    if line.startswith("{"):
+                        entry = json.loads(line)
+                        yield entry["path"], entry.get("country") or country
+                    else:
+                        yield line, country
+
+    for path, file_country in candidates():
+        path = os.path.abspath(path)
+        if path not in seen and media_type(path) is not None:
+            seen.add(path)
+            yield path, file_country
+
+
+def fingerprint(path):
+    """Size and modification time, so files changed since their result was recorded are redone."""
+    stat = os.stat(path)
+    return stat.st_size, int(stat.st_mtime)
+
+
+def load_checkpoint(output_path):
+    """
+    Reads earlier results from the output file.
+    Returns: dict of path -> last recorded line for that path
+    """
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short when the previous run was killed
+                continue
+            done[record["path"]] = record
+    return done
+
+
+def analyze_text(path, country, options):
+    from text_checker import process_text_content
+
+    with open(path, "r", encoding="utf-8") as f:
+        text_content = f.read()
+    result, logs, success = process_text_content(text_content, country, options.tier)
+    return {"analysis_result": result}, logs, success
+
+
+def analyze_image(path, country, options):
+    from image_checker import detect_image_format, process_image_bytes_and_get_analysis
+
+    with open(path, "rb") as f:
+        image_bytes = f.read()
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    image_format = detect_image_format(image_bytes) or ("jpeg" if ext == "jpg" else ext)
+    result, logs, success = process_image_bytes_and_get_analysis(image_bytes, image_format, country, options.tier)
+    return {"analysis_result": result}, logs, success
+
+
+def analyze_video(path, country, options):
+    from speech_to_text import MP4ToTextPipeline
+
+    # S3 keys and Transcribe job names come from the file name and the current second;
+    # a unique, Transcribe-safe alias keeps same-named files in different folders apart
+    alias_dir = tempfile.mkdtemp(prefix="bulk_")
+    safe_name = re.sub(r"[^0-9A-Za-z.-]", "-", os.path.basename(path))
+    alias = os.path.join(alias_dir, f"{hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]}-{safe_name}")
+    try:
+        try:
+            os.symlink(path, alias)
+        except OSError:
+            shutil.copyfile(path, alias)
+
+        pipeline = MP4ToTextPipeline(tier=options.tier)
+        if options.no_bedrock:
+            text, language_info, success = pipeline.process_video_detailed(alias, options.language_code)
+            bedrock_result = None
+        else:
+            text, language_info, bedrock_result, success = pipeline.process_video_with_bedrock(
+                alias, options.language_code
+            )
+        return {"text": text, "language_info": language_info, "bedrock_analysis": bedrock_result}, [], success
+    finally:
+        shutil.rmtree(alias_dir, ignore_errors=True)
+
+
+def analyze_described_image(path, country, options, description):
+    """Flow analysis for an image already described by a batch job."""
+    from image_checker import BedrockFlowInvoker
+
+    result, logs, success = BedrockFlowInvoker(tier=options.tier).invoke_cultural_analysis_flow(
+        description, country=country, file_type="image"
+    )
+    return {"image_description": description, "analysis_result": result}, logs, success
+
+
+def undescribed_image(path, country, options, error):
+    return {}, [error], False
+
+
+ANALYZERS = {"text": analyze_text, "image": analyze_image, "video": analyze_video}
+
+
+def describe_in_batch(images, options, pool):
+    """
+    Describes images with batch inference jobs, then queues their flow
+    analysis on the image pool. Images the jobs leave out are analyzed on demand.
+    Returns: list of futures, one per image
+    """
+    import batch_inference
+
+    try:
+        descriptions, logs, _ = batch_inference.describe_images(
+            [path for path, _ in images], state_path=options.output + ".batch.json"
+        )
+    except Exception as e:
+        descriptions, logs = {}, [f"Batch inference failed: {str(e)}"]
+    for line in logs:
+        print(line, file=sys.stderr)
+
+    futures = []
+    for path, country in images:
+        description, error = descriptions.get(path, (None, logs[-1]))
+        if description is not None:
+            analyzer = functools.partial(analyze_described_image, description=description)
+        elif error is None:
+            # Left out of the batch jobs: described on demand
+            analyzer = None
+        else:
+            analyzer = functools.partial(undescribed_image, error=error)
+        futures.append(pool.submit(run_one, path, country, options, analyzer))
+    return futures
+
+
+def run_one(path, country, options, analyzer=None):
+    """Analyzes one file. Returns the JSON line recorded for it."""
+    kind = media_type(path)
+    started = time.monotonic()
+    record = {"path": path, "type": kind, "country": country}
+    try:
+        record["size"], record["mtime"] = fingerprint(path)
+        with scheduler.scope(options.priority, options.tenant):
+            result, logs, success = (analyzer or ANALYZERS[kind])(path, country, options)
+        record.update(result)
+        record["success"] = bool(success)
+        if not success:
+            record["error"] = logs[-1] if logs else "Analysis failed"
+    except Exception as e:
+        record["success"] = False
+        record["error"] = str(e)
+    record["seconds"] = round(time.monotonic() - started, 3)
+    record["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return record
+
+
+class ResultWriter:
+    """Appends result lines to the output, flushed as each file finishes."""
+    def __init__(self, path):
+        # Start a fresh line after a line cut short by an interrupted run
+        with open(path, "ab+") as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze directories of text, image and video files into JSONL")
+    parser.add_argument("paths", nargs="*", help="Files or directories to analyze (walked recursively)")
+    parser.add_argument("--manifest", help="File listing paths, one per line or as JSON lines")
+    parser.add_argument("--output", default="bulk_results.jsonl", help="JSONL results file, also the checkpoint")
+    parser.add_argument("--country", default="Malaysia", help="Country context for files without their own")
+    parser.add_argument("--concurrency", default="",
+                        help="Workers per media type, e.g. text=16,image=8,video=4 (defaults shown)")
+    parser.add_argument("--language-code", default=None, help="Transcribe language code (default: auto-detect)")
+    parser.add_argument("--no-bedrock", action="store_true", help="Transcribe videos without the Bedrock flow")
+    parser.add_argument("--image-mode", choices=("on-demand", "batch"), default="on-demand",
+                        help="Describe images with one invoke_model call each, or with batch inference jobs")
+    parser.add_argument("--tier", choices=("fast", "balanced", "thorough"), default=None,
+                        help="Latency tier for models, prompts and flow alias (default: LATENCY_TIER)")
+    parser.add_argument("--priority", choices=("interactive", "bulk"), default="bulk",
+                        help="Scheduling class of the upstream calls; bulk leaves reserved capacity to live users")
+    parser.add_argument("--tenant", default="bulk_analyze", help="Tenant the upstream calls are fair-queued under")
+    parser.add_argument("--skip-failed", action="store_true", help="Do not retry files that failed in earlier runs")
+    parser.add_argument("--dry-run", action="store_true", help="List what would be analyzed and exit")
+    args = parser.parse_args()
+
+    if not args.paths and not args.manifest:
+        parser.error("give at least one path or --manifest")
+
+    load_environment()
+    concurrency = parse_concurrency(args.concurrency)
+    checkpoint = load_checkpoint(args.output)
+
+    pending = []
+    skipped = 0
+    for path, country in discover(args.paths, args.manifest, args.country):
+        previous = checkpoint.get(path)
+        if previous is not None and (previous.get("success") or args.skip_failed):
+            try:
+                unchanged = (previous.get("size"), previous.get("mtime")) == fingerprint(path)
+            except OSError:
+                unchanged = True
+            if unchanged:
+                skipped += 1
+                continue
+        pending.append((path, country))
+
+    counts = {kind: sum(1 for path, _ in pending if media_type(path) == kind) for kind in ANALYZERS}
+    print(f"{len(pending)} files to analyze ({', '.join(f'{n} {k}' for k, n in counts.items())}), "
+          f"{skipped} already done", file=sys.stderr)
+    if args.dry_run:
+        for path, country in pending:
+            print(f"{media_type(path)}\t{country}\t{path}")
+        return
+
+    pools = {kind: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"bulk-{kind}")
+             for kind, workers in concurrency.items()}
+    writer = ResultWriter(args.output)
+    started = time.monotonic()
+    succeeded = failed = 0
+    batch_images = []
+    if args.image_mode == "batch":
+        import batch_inference
+
+        batch_images = [(path, country) for path, country in pending if media_type(path) == "image"]
+        if len(batch_images) < batch_inference.min_records():
+            print(f"Only {len(batch_images)} images, below the batch job minimum of {batch_inference.min_records()}; "
+                  f"describing them on demand", file=sys.stderr)
+            batch_images = []
+    batched = {path for path, _ in batch_images}
+
+    done = 0
+    try:
+        outstanding = {pools[media_type(path)].submit(run_one, path, country, args)
+                       for path, country in pending if path not in batched}
+        if batch_images:
+            pools["batch"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-batch")
+            outstanding.add(pools["batch"].submit(describe_in_batch, batch_images, args, pools["image"]))
+        while outstanding:
+            finished, outstanding = wait(outstanding, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                if isinstance(record, list):
+                    # The batch jobs finished; these futures run the flow on each description
+                    outstanding.update(record)
+                    continue
+                done += 1
+                writer.write(record)
+                if record["success"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                    print(f"FAILED {record['path']}: {record.get('error')}", file=sys.stderr)
+                if done % 25 == 0 or done == len(pending):
+                    elapsed = time.monotonic() - started
+                    print(f"[{done}/{len(pending)}] {succeeded} ok, {failed} failed, "
+                          f"{done / elapsed:.2f} files/s", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrupted; finished files are saved, rerun the same command to continue", file=sys.stderr)
+    finally:
+        for pool in pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        writer.close()
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
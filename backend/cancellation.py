@@ -0,0 +1,332 @@
+"""
+Request deadlines and cancellation on client disconnect
+Each POST to an analysis route gets a CancelToken with a deadline. The deadline
+comes from the X-Request-Timeout header (seconds), or REQUEST_TIMEOUT_SECONDS
+when the header is missing. The token is also cancelled when the client
+disconnects. The token travels with the request's context into the threads
+doing its work. The pipelines check it between stages and while they wait,
+so a closed browser tab or a timed-out proxy stops the rest of the work:
+
+- the upload is aborted (the boto3 progress callback raises, so a multipart
+  upload is aborted by the transfer manager) and the partial object removed
+- a running Transcribe job is deleted instead of polled to completion
+- Nova and Bedrock Flow calls that have not started are skipped
+
+AWS calls also run under resilience.deadline_scope, so retries and rate-limit
+waits never run past the deadline. A request cancelled by its deadline is
+answered with 504.
+
+The pipelines run in stages (upload, transcription, image_description, flow).
+Each stage's typical duration is learned from completed runs. When a request
+is cancelled, the rest of its current stage plus its remaining stages are
+counted as saved resource-seconds (cancelled_saved_seconds_total).
+
+Configuration:
+- REQUEST_TIMEOUT_SECONDS: deadline when the client sends none (default 1800)
+- REQUEST_TIMEOUT_MAX_SECONDS: cap on X-Request-Timeout (default 3600)
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+import resilience
+
+CANCELLED = metrics.counter('requests_cancelled_total',
+                            'Requests whose work was cancelled, by endpoint, reason and stage')
+SAVED_SECONDS = metrics.counter('cancelled_saved_seconds_total',
+                                'Estimated upstream work avoided by cancelling, in stage-seconds')
+CLEANUPS = metrics.counter('cancelled_cleanups_total', 'Cleanup actions after a cancellation, by action and outcome')
+STAGE_SECONDS = metrics.histogram('pipeline_stage_seconds', 'Duration of completed pipeline stages')
+
+# Weight of the newest sample in each stage's typical duration
+EWMA_WEIGHT = 0.2
+
+_current = contextvars.ContextVar('cancel_token', default=None)
+_typical = {}
+_typical_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    """Raised inside a request's work once its client has gone or its deadline has passed."""
+    def __init__(self, reason):
+        super().__init__(f"Request cancelled: {reason.replace('_', ' ')}")
+        self.reason = reason
+
+
+def typical_seconds(stage):
+    """Learned duration of a stage, or 0 before it has completed once."""
+    with _typical_lock:
+        return _typical.get(stage, 0.0)
+
+
+def _learn(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    with _typical_lock:
+        previous = _typical.get(stage)
+        _typical[stage] = seconds if previous is None else previous + EWMA_WEIGHT * (seconds - previous)
+
+
+class CancelToken:
+    """Cancellation state of one request, shared by every thread working on it."""
+    def __init__(self, endpoint, timeout=None):
+        self.endpoint = endpoint
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.event = threading.Event()
+        self.reason = None
+        self.lock = threading.Lock()
+        self.plan = []
+        self.stage = None
+        self.stage_started = None
+        self.reported = False
+        self.finished = False
+        self.outlives_client = False
+
+    def cancel(self, reason):
+        """Cancels the request's remaining work; no effect once the request has finished."""
+        with self.lock:
+            if self.finished or self.reason or (reason == 'client_disconnected' and self.outlives_client):
+                return
+            self.reason = reason
+        self.event.set()
+
+    def cancelled(self):
+        if not self.event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel('deadline')
+        return self.event.is_set()
+
+    def check(self):
+        """Raises Cancelled (recording what it saves, once) if the request is cancelled."""
+        if not self.cancelled():
+            return
+        with self.lock:
+            report = not self.reported
+            self.reported = True
+            stage, started, plan = self.stage, self.stage_started, list(self.plan)
+        if report:
+            saved = 0.0
+            remaining = plan
+            if stage is not None:
+                saved += max(0.0, typical_seconds(stage) - (time.monotonic() - started))
+                remaining = plan[plan.index(stage) + 1:] if stage in plan else []
+            saved += sum(typical_seconds(name) for name in remaining)
+            CANCELLED.inc(endpoint=self.endpoint, reason=self.reason, stage=stage or 'none')
+            SAVED_SECONDS.inc(saved, endpoint=self.endpoint, reason=self.reason)
+        raise Cancelled(self.reason)
+
+    def wait(self, seconds):
+        """Sleeps up to `seconds`, waking early (and raising Cancelled) on cancellation."""
+        if self.deadline is not None:
+            seconds = min(seconds, max(0.0, self.deadline - time.monotonic()))
+        self.event.wait(seconds)
+        self.check()
+
+
+def current():
+    """The token of the current request, or None."""
+    return _current.get()
+
+
+def check():
+    """Raises Cancelled if the current request is cancelled; no-op outside requests."""
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+def sleep(seconds):
+    """time.sleep that ends early when the current request is cancelled."""
+    token = _current.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.wait(seconds)
+
+
+def keep_on_disconnect(token=None):
+    """
+    Lets the work of a request (the current one by default) continue when its
+    client disconnects: other requests share it, or the client can fetch the
+    result later. The deadline still applies.
+    """
+    token = token or _current.get()
+    if token is not None:
+        with token.lock:
+            token.outlives_client = True
+
+
+def plan(stages):
+    """Declares the stages the current request will run, for the saved-work estimate."""
+    token = _current.get()
+    if token is not None:
+        with token.lock:
+            token.plan = list(stages)
+
+
+@contextmanager
+def stage(name):
+    """
+    Runs one pipeline stage: checks for cancellation first, marks the stage
+    as the request's current one, and learns its duration when it completes.
+    """
+    token = _current.get()
+    if token is not None:
+        token.check()
+        with token.lock:
+            previous = token.stage, token.stage_started
+            token.stage, token.stage_started = name, time.monotonic()
+    started = time.monotonic()
+    try:
+        yield
+        # A stage cut short by cancellation says nothing about how long it takes
+        if token is None or not token.event.is_set():
+            _learn(name, time.monotonic() - started)
+    finally:
+        if token is not None:
+            with token.lock:
+                token.stage, token.stage_started = previous
+
+
+def checked_callback(callback=None):
+    """
+    Wraps a boto3 transfer Callback so the transfer fails once the current
+    request is cancelled. boto3 calls it from its own threads, so the token is
+    captured here.
+    """
+    token = _current.get()
+
+    def call(bytes_amount):
+        if token is not None:
+            token.check()
+        if callback is not None:
+            callback(bytes_amount)
+    return call
+
+
+def cleanup(action, func, *args, **kwargs):
+    """Runs a best-effort cleanup call after a cancellation, recording its outcome."""
+    try:
+        func(*args, **kwargs)
+        CLEANUPS.inc(action=action, outcome='success')
+    except Exception:
+        CLEANUPS.inc(action=action, outcome='error')
+
+
+@contextmanager
+def scope(token):
+    """Runs the block (and threads copying its context) under a token and its deadline."""
+    reset = _current.set(token)
+    try:
+        if token.deadline is not None:
+            with resilience.deadline_scope(max(0.0, token.deadline - time.monotonic())):
+                yield token
+        else:
+            yield token
+    finally:
+        _current.reset(reset)
+
+
+@contextmanager
+def detached():
+    """
+    Runs the block with no token and no deadline, for work that must outlive
+    the request (background jobs the client polls for).
+    """
+    reset = _current.set(None)
+    try:
+        with resilience.no_deadline():
+            yield
+    finally:
+        _current.reset(reset)
+
+
+def request_timeout(headers):
+    """The deadline in seconds for a request: X-Request-Timeout, capped, else the server default."""
+    default = float(os.getenv('REQUEST_TIMEOUT_SECONDS', '1800'))
+    ceiling = float(os.getenv('REQUEST_TIMEOUT_MAX_SECONDS', '3600'))
+    raw = headers.get(b'x-request-timeout')
+    if raw is None:
+        return min(default, ceiling)
+    try:
+        seconds = float(raw.decode('latin-1'))
+    except ValueError:
+        return min(default, ceiling)
+    return min(seconds, ceiling) if seconds > 0 else min(default, ceiling)
+
+
+class CancellationMiddleware:
+    """
+    Gives each POST to the guarded paths a CancelToken, cancels it when the
+    client disconnects, and turns a response produced after the deadline into 504.
+
+    Once the body has been read, a watcher takes over the connection's receive
+    channel to see the disconnect; later receive() calls by the app are served
+    the disconnect message it saw.
+    """
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope_, receive, send):
+        if scope_['type'] != 'http' or scope_['method'] != 'POST' or scope_['path'] not in self.paths:
+            await self.app(scope_, receive, send)
+            return
+
+        headers = dict(scope_['headers'])
+        token = CancelToken(scope_['path'], request_timeout(headers))
+        disconnected = asyncio.get_running_loop().create_future()
+        watcher = None
+
+        async def watch():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    token.cancel('client_disconnected')
+                    disconnected.set_result(message)
+                    return
+
+        async def receive_body():
+            nonlocal watcher
+            if watcher is not None:
+                return await asyncio.shield(disconnected)
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                token.cancel('client_disconnected')
+                if not disconnected.done():
+                    disconnected.set_result(message)
+            elif not message.get('more_body', False):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        response_started = False
+
+        async def send_checked(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start' and token.reason == 'deadline':
+                message = dict(message, status=504)
+            await send(message)
+            # Set once sent: a send cancelled because of the disconnect delivers nothing
+            if message['type'] == 'http.response.start':
+                response_started = True
+
+        try:
+            with scope(token):
+                await self.app(scope_, receive_body, send_checked)
+            if not response_started and token.reason == 'client_disconnected':
+                # Starlette drops a response once it has seen the disconnect, but the
+                # outer middleware still expects one. 499: client closed request.
+                await send({'type': 'http.response.start', 'status': 499, 'headers': []})
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            with token.lock:
+                token.finished = True
+            if watcher is not None:
+                watcher.cancel()
+
+
+def install(app, paths):
+    """Adds deadlines and disconnect cancellation for POSTs to the given paths."""
+    app.add_middleware(CancellationMiddleware, paths=paths)
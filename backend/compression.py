@@ -0,0 +1,282 @@
+"""
+Compressed request and response bodies
+Requests may be sent with Content-Encoding: gzip (or zstd when the zstandard
+package is installed). They are decompressed incrementally as the body is
+read, so a compressed upload never sits in memory twice. Limits on total size
+and on compression ratio reject decompression bombs with 413 before they expand.
+
+Responses above a minimum size are compressed with the best encoding the
+client lists in Accept-Encoding (zstd, then gzip).
+
+Configuration:
+- REQUEST_MAX_DECOMPRESSED_BYTES: largest decompressed request body (default 256 MiB)
+- REQUEST_MAX_COMPRESSION_RATIO: largest decompressed/compressed ratio, checked
+  once a body passes 1 MiB (default 100)
+- RESPONSE_COMPRESSION_MIN_BYTES: smaller responses are sent as-is (default 1024)
+- RESPONSE_COMPRESSION=0: never compress responses
+- GZIP_LEVEL (default 6), ZSTD_LEVEL (default 3)
+"""
+import os
+import zlib
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bytes of zstd input fed per step, bounding how far one step can overshoot the limits
+ZSTD_INPUT_STEP = 512
+
+# Small bodies legitimately compress very well; the ratio limit applies above this
+RATIO_CHECK_BYTES = 1024 * 1024
+
+# Scope key carrying the most a compressed request body can decode to, for the memory budget
+DECODED_BOUND_KEY = 'compression.decoded_bytes_bound'
+
+REQUEST_BYTES = metrics.counter('request_body_wire_bytes_total', 'Request body bytes received, by Content-Encoding')
+REQUEST_DECODED_BYTES = metrics.counter('request_body_decoded_bytes_total',
+                                        'Request body bytes after decompression, by Content-Encoding')
+RESPONSE_BYTES = metrics.counter('response_body_wire_bytes_total', 'Response body bytes sent, by Content-Encoding')
+RESPONSE_RAW_BYTES = metrics.counter('response_body_raw_bytes_total',
+                                     'Response body bytes before compression, by Content-Encoding')
+REJECTED = metrics.counter('request_decompression_rejected_total', 'Compressed request bodies rejected')
+
+
+def supported_encodings():
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding):
+    """Picks the response encoding from an Accept-Encoding header, or None for identity."""
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+    for encoding in supported_encodings():
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+class Decoder:
+    """Incremental request body decoder enforcing the size and ratio limits."""
+    def __init__(self, encoding, max_bytes, max_ratio):
+        self.encoding = encoding
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self.compressed = 0
+        self.decompressed = 0
+        if encoding == 'gzip':
+            # 16 + MAX_WBITS: gzip header and trailer
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._zstd = zstandard.ZstdDecompressor().decompressobj()
+
+    def _check(self, produced):
+        self.decompressed += produced
+        if self.decompressed > self.max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Decompressed request body exceeds {self.max_bytes} bytes")
+        if self.decompressed > RATIO_CHECK_BYTES and self.decompressed > self.compressed * self.max_ratio:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Request body compression ratio exceeds {self.max_ratio}")
+
+    def decode(self, data, final=False):
+        """Decodes one chunk of the compressed body. Returns the decompressed bytes."""
+        self.compressed += len(data)
+        output = []
+        try:
+            if self.encoding == 'gzip':
+                # max_length bounds each step; the rest waits in unconsumed_tail
+                remaining = self.max_bytes - self.decompressed + 1
+                chunk = self._zlib.decompress(data, remaining)
+                while True:
+                    self._check(len(chunk))
+                    output.append(chunk)
+                    if not self._zlib.unconsumed_tail:
+                        break
+                    chunk = self._zlib.decompress(self._zlib.unconsumed_tail, self.max_bytes - self.decompressed + 1)
+                if final:
+                    chunk = self._zlib.flush()
+                    self._check(len(chunk))
+                    output.append(chunk)
+                    if not self._zlib.eof:
+                        raise ValueError("truncated gzip stream")
+            else:
+                for start in range(0, len(data), ZSTD_INPUT_STEP):
+                    chunk = self._zstd.decompress(data[start:start + ZSTD_INPUT_STEP])
+                    self._check(len(chunk))
+                    output.append(chunk)
+        except HTTPException:
+            REJECTED.inc(encoding=self.encoding, reason='limit')
+            raise
+        except (zlib.error, ValueError) + ((zstandard.ZstdError,) if zstandard else ()) as e:
+            REJECTED.inc(encoding=self.encoding, reason='corrupt')
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Invalid {self.encoding} request body: {str(e)}")
+        return b''.join(output)
+
+
+class Encoder:
+    """Incremental response body encoder."""
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._zlib = zlib.compressobj(int(os.getenv('GZIP_LEVEL', '6')), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            self._zstd = zstandard.ZstdCompressor(level=int(os.getenv('ZSTD_LEVEL', '3'))).compressobj()
+
+    def encode(self, data, final=False):
+        if self.encoding == 'gzip':
+            return self._zlib.compress(data) + (self._zlib.flush() if final else b'')
+        return self._zstd.compress(data) + (self._zstd.flush() if final else b'')
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+class CompressionMiddleware:
+    """ASGI middleware decoding compressed request bodies and compressing responses."""
+    def __init__(self, app, max_bytes, max_ratio, min_response_bytes, compress_responses=True):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self.min_response_bytes = min_response_bytes
+        self.compress_responses = compress_responses
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        headers = scope['headers']
+        request_encoding = (_header(headers, b'content-encoding') or 'identity').strip().lower()
+        if request_encoding not in ('identity',) + supported_encodings():
+            response = JSONResponse(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                content={"detail": f"Unsupported Content-Encoding: {request_encoding}"},
+                headers={"Accept-Encoding": ", ".join(supported_encodings())}
+            )
+            return await response(scope, receive, send)
+
+        if request_encoding != 'identity':
+            decoder = Decoder(request_encoding, self.max_bytes, self.max_ratio)
+            # The app sees the decoded body; its length is not known up front, only bounded by the limits
+            scope = dict(scope)
+            scope[DECODED_BOUND_KEY] = self.decoded_bound(_header(headers, b'content-length'))
+            scope['headers'] = [(k, v) for k, v in headers if k not in (b'content-encoding', b'content-length')]
+            receive = self._decoding_receive(receive, decoder)
+
+        response_encoding = choose_encoding(_header(headers, b'accept-encoding')) if self.compress_responses else None
+        if response_encoding is not None:
+            send = _CompressingSend(send, response_encoding, self.min_response_bytes)
+
+        await self.app(scope, receive, send)
+
+    def decoded_bound(self, content_length):
+        """The most a compressed body of content_length bytes (None: unknown) can decode to."""
+        try:
+            compressed = int(content_length)
+        except (TypeError, ValueError):
+            return self.max_bytes
+        return min(self.max_bytes, max(RATIO_CHECK_BYTES, int(compressed * self.max_ratio)))
+
+    @staticmethod
+    def _decoding_receive(receive, decoder):
+        async def decoding_receive():
+            message = await receive()
+            if message['type'] != 'http.request':
+                return message
+            body = message.get('body', b'')
+            final = not message.get('more_body', False)
+            decoded = decoder.decode(body, final=final)
+            REQUEST_BYTES.inc(len(body), encoding=decoder.encoding)
+            REQUEST_DECODED_BYTES.inc(len(decoded), encoding=decoder.encoding)
+            return {'type': 'http.request', 'body': decoded, 'more_body': not final}
+        return decoding_receive
+
+
+class _CompressingSend:
+    """Wraps ASGI send, compressing the response once it is known to be large enough."""
+    def __init__(self, send, encoding, min_bytes):
+        self.send = send
+        self.encoding = encoding
+        self.min_bytes = min_bytes
+        self.start = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message['type'] == 'http.response.start':
+            headers = message.get('headers', [])
+            content_type = _header(headers, b'content-type') or ''
+            content_length = _header(headers, b'content-length')
+            # Already encoded, a stream the client reads incrementally, or declared too small
+            # (responses passed through other middleware arrive in chunks, so the length header is the only hint)
+            self.passthrough = (_header(headers, b'content-encoding') is not None
+                                or content_type.startswith('text/event-stream')
+                                or (content_length is not None and int(content_length) < self.min_bytes))
+            if self.passthrough:
+                return await self.send(message)
+            self.start = message
+            return
+
+        if message['type'] != 'http.response.body' or self.passthrough:
+            return await self.send(message)
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body and len(body) < self.min_bytes:
+                self.passthrough = True
+                await self.send(start)
+                return await self.send(message)
+
+            self.encoder = Encoder(self.encoding)
+            headers = [(k, v) for k, v in start.get('headers', []) if k != b'content-length']
+            headers.append((b'content-encoding', self.encoding.encode('latin-1')))
+            vary = _header(headers, b'vary')
+            if vary is None:
+                headers.append((b'vary', b'Accept-Encoding'))
+            elif 'accept-encoding' not in vary.lower():
+                headers = [(k, v + b', Accept-Encoding' if k == b'vary' else v) for k, v in headers]
+
+            encoded = self.encoder.encode(body, final=not more_body)
+            if not more_body:
+                headers.append((b'content-length', str(len(encoded)).encode('latin-1')))
+            await self.send({**start, 'headers': headers})
+        else:
+            encoded = self.encoder.encode(body, final=not more_body)
+
+        RESPONSE_RAW_BYTES.inc(len(body), encoding=self.encoding)
+        RESPONSE_BYTES.inc(len(encoded), encoding=self.encoding)
+        await self.send({'type': 'http.response.body', 'body': encoded, 'more_body': more_body})
+
+
+def install(app):
+    """Adds request decompression and response compression. Install last so it wraps everything else."""
+    app.add_middleware(
+        CompressionMiddleware,
+        max_bytes=int(os.getenv('REQUEST_MAX_DECOMPRESSED_BYTES', str(256 * 1024 * 1024))),
+        max_ratio=float(os.getenv('REQUEST_MAX_COMPRESSION_RATIO', '100')),
+        min_response_bytes=int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024')),
+        compress_responses=os.getenv('RESPONSE_COMPRESSION', '1').lower() not in ('0', 'false', 'no')
+    )
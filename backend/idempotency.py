@@ -0,0 +1,294 @@
+"""
+Idempotency keys for the analysis routes
+The frontend and proxies retry POSTs that time out. Without a key each retry
+is a new request: /speech-to-text uploads the video again and starts another
+Transcribe job, /image-analysis runs Nova again. A client that sends
+Idempotency-Key: <unique value> gets one execution per key:
+
+- the first request runs; its response is stored under the key
+- a retry while it is still running waits for it and gets the same response
+- a retry after it finished gets the stored response (Idempotent-Replayed: true)
+- reusing a key with a different request (path, query or body) is rejected with 422
+
+A keyed request runs to completion even if its client disconnects (the retry
+will want the result), but its deadline still applies. The middleware sits
+inside admission control and the memory budget, so the body is buffered
+only once the request is admitted, and a retry waiting on the original holds
+its own admission slot while it waits. Failures are not
+stored, so a retry after a failure, a deadline or shed load runs again:
+responses that ask for a retry (5xx, and 429 from admission control) and the
+routes' own failure responses (200 with "success": false, e.g. when Nova or
+the flow call failed).
+
+Keys are kept in memory per worker, least recently used first out, up to
+IDEMPOTENCY_MAX_KEYS keys and IDEMPOTENCY_MAX_BYTES of stored responses, and
+expire IDEMPOTENCY_TTL_SECONDS after their response was stored. Retries
+reach the same key only on the same worker, so run one worker per instance
+or route retries stickily when using several.
+
+Configuration:
+- IDEMPOTENCY_TTL_SECONDS: how long a stored response is replayed (default 86400)
+- IDEMPOTENCY_MAX_KEYS: most keys kept (default 10000)
+- IDEMPOTENCY_MAX_BYTES: most response bytes kept (default 64 MiB)
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+import cancellation
+import json_backend
+import metrics
+
+# Longer keys are rejected; clients send UUIDs or similar
+MAX_KEY_LENGTH = 255
+
+# Responses a retry should not get back
+RETRYABLE_STATUSES = (408, 425, 429)
+
+REQUESTS = metrics.counter('idempotency_requests_total',
+                           'Keyed requests by endpoint and outcome (executed, attached, replayed, mismatch)')
+STORED_KEYS = metrics.gauge('idempotency_stored_keys', 'Idempotency keys currently held')
+STORED_BYTES = metrics.gauge('idempotency_stored_bytes', 'Response bytes held for idempotency keys')
+EVICTIONS = metrics.counter('idempotency_evictions_total', 'Idempotency keys dropped, by reason')
+
+
+class _Entry:
+    """One key: its request fingerprint and, once finished, the response to replay."""
+    __slots__ = ('fingerprint', 'done', 'response', 'size', 'expires_at')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = asyncio.get_running_loop().create_future()
+        self.response = None
+        self.size = 0
+        self.expires_at = None
+
+
+def _replayable(response):
+    """False for no response, responses asking for a retry, and the routes' "success": false failures."""
+    if response is None or response[0] >= 500 or response[0] in RETRYABLE_STATUSES:
+        return False
+    content_type = _header(response[1], b'content-type') or ''
+    if content_type.startswith('application/json'):
+        try:
+            document = json_backend.loads(response[2])
+        except ValueError:
+            return True
+        return not (isinstance(document, dict) and document.get('success') is False)
+    return True
+
+
+class IdempotencyStore:
+    """Bounded LRU of keys. In-flight keys are never evicted; they hold no response yet."""
+    def __init__(self, ttl, max_keys, max_bytes):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+    def _update_gauges(self):
+        STORED_KEYS.set(len(self.entries))
+        STORED_BYTES.set(self.bytes)
+
+    def _drop(self, key, reason):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        EVICTIONS.inc(reason=reason)
+
+    def get(self, key):
+        """The live entry for a key, or None."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._drop(key, 'expired')
+            self._update_gauges()
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def begin(self, key, fingerprint):
+        entry = _Entry(fingerprint)
+        self.entries[key] = entry
+        self._evict()
+        return entry
+
+    def finish(self, key, entry, response):
+        """Stores a finished response under its key, or forgets the key when it is not replayable."""
+        if not entry.done.done():
+            entry.done.set_result(response)
+        if self.entries.get(key) is not entry:
+            return
+        size = len(response[2]) + sum(len(k) + len(v) for k, v in response[1]) if response is not None else 0
+        if not _replayable(response) or size > self.max_bytes:
+            del self.entries[key]
+        else:
+            entry.response = response
+            entry.size = size
+            entry.expires_at = time.monotonic() + self.ttl
+            self.bytes += size
+        self._evict()
+
+    def abandon(self, key, entry, error):
+        """Forgets a key whose request raised; requests attached to it get the error."""
+        if not entry.done.done():
+            entry.done.set_exception(error)
+            # Retrieved here so an entry nobody attached to does not log "exception never retrieved"
+            entry.done.exception()
+        if self.entries.get(key) is entry:
+            del self.entries[key]
+        self._update_gauges()
+
+    def _evict(self):
+        if len(self.entries) > self.max_keys or self.bytes > self.max_bytes:
+            for key in [key for key, entry in self.entries.items() if entry.response is not None]:
+                if len(self.entries) <= self.max_keys and self.bytes <= self.max_bytes:
+                    break
+                self._drop(key, 'capacity')
+        self._update_gauges()
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware giving POSTs to the guarded paths at-most-once execution per Idempotency-Key."""
+    def __init__(self, app, paths, store):
+        self.app = app
+        self.paths = set(paths)
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST' or scope['path'] not in self.paths:
+            return await self.app(scope, receive, send)
+        key = _header(scope['headers'], b'idempotency-key')
+        if key is None:
+            return await self.app(scope, receive, send)
+        endpoint = scope['path']
+        if not key.strip() or len(key) > MAX_KEY_LENGTH:
+            response = JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                                    content={"detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"})
+            return await response(scope, receive, send)
+
+        # The body is needed up front for the fingerprint, and replayed to the app afterwards
+        fingerprint = hashlib.sha256()
+        for part in (scope['path'].encode('utf-8'), scope.get('query_string', b'')):
+            fingerprint.update(len(part).to_bytes(8, 'big') + part)
+        chunks = []
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body = message.get('body', b'')
+                fingerprint.update(body)
+                chunks.append(body)
+                if not message.get('more_body', False):
+                    break
+        except HTTPException as e:
+            # Raised by the decompressing receive for oversized bodies
+            response = JSONResponse(status_code=e.status_code, content={"detail": e.detail}, headers=e.headers)
+            return await response(scope, receive, send)
+        fingerprint = fingerprint.hexdigest()
+
+        entry = self.store.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                REQUESTS.inc(endpoint=endpoint, outcome='mismatch')
+                response = JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                        content={"detail": "Idempotency-Key was already used with a different request"})
+                return await response(scope, receive, send)
+            REQUESTS.inc(endpoint=endpoint, outcome='replayed' if entry.response is not None else 'attached')
+            # shield: this retry going away must not cancel the request it is waiting on
+            stored = await asyncio.shield(entry.done)
+            return await self._replay(stored, scope, receive, send)
+
+        REQUESTS.inc(endpoint=endpoint, outcome='executed')
+        entry = self.store.begin(key, fingerprint)
+        # Cancellation sits outside; its token must not end the work when this client goes
+        cancellation.keep_on_disconnect()
+        task = asyncio.ensure_future(self._execute(scope, chunks, send))
+
+        def settle(finished):
+            if finished.cancelled():
+                self.store.abandon(key, entry, asyncio.CancelledError())
+            elif finished.exception() is not None:
+                self.store.abandon(key, entry, finished.exception())
+            else:
+                self.store.finish(key, entry, finished.result())
+
+        task.add_done_callback(settle)
+        await asyncio.shield(task)
+
+    async def _execute(self, scope, chunks, send):
+        """
+        Runs the app on the buffered body, passing the response to the client
+        while it is still connected.
+        Returns tuple: (status, headers, body)
+        """
+        body = b''.join(chunks)
+        chunks.clear()
+        delivered = False
+        # The app never sees the client disconnect, so the work outlives the connection
+        never = asyncio.Event()
+
+        async def replay_receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await never.wait()
+
+        start = None
+        parts = []
+        client_gone = False
+
+        async def capture_send(message):
+            nonlocal start, client_gone
+            if message['type'] == 'http.response.start':
+                start = message
+            elif message['type'] == 'http.response.body':
+                parts.append(message.get('body', b''))
+            if not client_gone:
+                try:
+                    await send(message)
+                except Exception:
+                    client_gone = True
+
+        await self.app(scope, replay_receive, capture_send)
+        if start is None:
+            return None
+        return start['status'], list(start.get('headers', [])), b''.join(parts)
+
+    @staticmethod
+    async def _replay(stored, scope, receive, send):
+        if stored is None:
+            response = JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                    content={"detail": "The original request produced no response"})
+            return await response(scope, receive, send)
+        status_code, headers, body = stored
+        await send({'type': 'http.response.start', 'status': status_code,
+                    'headers': headers + [(b'idempotent-replayed', b'true')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+def install(app, paths):
+    """Adds Idempotency-Key handling for POSTs to the given paths."""
+    app.add_middleware(
+        IdempotencyMiddleware,
+        paths=paths,
+        store=IdempotencyStore(
+            ttl=float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400')),
+            max_keys=int(os.getenv('IDEMPOTENCY_MAX_KEYS', '10000')),
+            max_bytes=int(os.getenv('IDEMPOTENCY_MAX_BYTES', str(64 * 1024 * 1024)))
+        )
+    )
@@ -2,22 +2,131 @@
 Image to Text Pipeline using Amazon Nova Pro
 Simple flow: Image -> Bedrock (Nova Pro) -> Text Description
 """
-import boto3
+import binascii
 import json
 import os
-import base64
-from dotenv import load_dotenv
+import json_backend
+import cancellation
+import tiers
+import usage
+from aws_clients import get_client, load_environment
+
+load_environment()
+
+SYSTEM_PROMPT = ("You are an expert image analyst. Provide a detailed description of the image including "
+                 "objects, people, activities, setting, and any notable details.")
+
+DEFAULT_PROMPT = "Describe this image in detail."
+
+INFERENCE_CONFIG = {"maxTokens": 10240, "temperature": 0.3, "topP": 0.9}
+
+# Stands in for the image in the serialised request; the base64 is spliced in its place
+IMAGE_PLACEHOLDER = "__IMAGE_BYTES__"
+
+# Raw bytes base64-encoded per step (a multiple of 3, so chunks concatenate without padding)
+BASE64_CHUNK_BYTES = 3 * 256 * 1024
+
+# Characters that can be copied into a JSON string unescaped
+BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='
+
+# Leading bytes of each format Nova accepts
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+
+def detect_image_format(image_bytes):
+    """Returns the image format from its leading bytes, or None if it is not a supported image."""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return image_format
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def tier_inference_config(tier):
+    """INFERENCE_CONFIG with a latency tier's token budget."""
+    return dict(INFERENCE_CONFIG, maxTokens=tier['max_tokens'])
+
+
+def build_image_request_body(image_bytes, image_format, prompt, system_prompt=SYSTEM_PROMPT,
+                             inference_config=INFERENCE_CONFIG):
+    """
+    Builds the Nova invoke_model body for raw image bytes. The image is
+    base64-encoded chunk by chunk directly into the body, so the body itself
+    is the only full-size copy made.
+    Returns: bytearray holding the JSON request
+    """
+    native_request = {
+        "schemaVersion": "messages-v1",
+        "system": [{"text": system_prompt}],
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"image": {"format": image_format, "source": {"bytes": IMAGE_PLACEHOLDER}}},
+                    {"text": prompt}
+                ]
+            }
+        ],
+        "inferenceConfig": inference_config
+    }
+    prefix, suffix = bytes(json_backend.dumps(native_request)).split(IMAGE_PLACEHOLDER.encode('ascii'))
+
+    body = bytearray(len(prefix) + (len(image_bytes) + 2) // 3 * 4 + len(suffix))
+    body[:len(prefix)] = prefix
+    offset = len(prefix)
+    view = memoryview(image_bytes)
+    for start in range(0, len(image_bytes), BASE64_CHUNK_BYTES):
+        encoded = binascii.b2a_base64(view[start:start + BASE64_CHUNK_BYTES], newline=False)
+        body[offset:offset + len(encoded)] = encoded
+        offset += len(encoded)
+    body[offset:] = suffix
+    return body
+
+
+def splice_base64_body(native_request, base64_data):
+    """
+    Serialises a Nova request whose image source holds IMAGE_PLACEHOLDER and
+    copies base64_data into its place chunk by chunk, so the body is the only
+    full-size copy made. Base64 text needs no JSON escaping.
+    Returns: bytearray holding the JSON request, or None if base64_data is not plain base64 text
+    """
+    prefix, suffix = bytes(json_backend.dumps(native_request)).split(IMAGE_PLACEHOLDER.encode('ascii'))
+    body = bytearray(len(prefix) + len(base64_data) + len(suffix))
+    body[:len(prefix)] = prefix
+    offset = len(prefix)
+    for start in range(0, len(base64_data), BASE64_CHUNK_BYTES):
+        chunk = base64_data[start:start + BASE64_CHUNK_BYTES]
+        if not chunk.isascii():
+            return None
+        encoded = chunk.encode('ascii')
+        if encoded.translate(None, BASE64_ALPHABET):
+            return None
+        body[offset:offset + len(encoded)] = encoded
+        offset += len(encoded)
+    body[offset:] = suffix
+    return body
 
-load_dotenv()
 
 class ImageToTextPipeline:
-    def __init__(self, model_id='us.amazon.nova-pro-v1:0'):
+    def __init__(self, model_id=None, backend=None, tier=None):
         """
         Initializes the pipeline with a Bedrock runtime client.
+        backend: 'aws' or 'emulator'; defaults to the AWS_BACKEND setting.
+        tier: latency tier name (see tiers.py); defaults to LATENCY_TIER.
+        model_id: overrides the tier's model.
         """
         self.region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
-        self.bedrock_runtime = boto3.client('bedrock-runtime', region_name=self.region)
-        self.model_id = model_id
+        self.bedrock_runtime = get_client('bedrock-runtime', region_name=self.region, backend=backend)
+        self.tier = tiers.get(tier)
+        if model_id:
+            self.tier = dict(self.tier, model_id=model_id)
+        self.model_id = self.tier['model_id']
 
     def _get_image_format(self, image_file_path):
         """Determines the image format from its file extension."""
@@ -33,79 +142,60 @@ class ImageToTextPipeline:
         else:
             raise ValueError(f"Unsupported image format: {ext}")
 
-    def describe_image(self, image_file_path, prompt="Describe this image in detail."):
+    def describe_image(self, image_file_path, prompt=None):
         """
-        Generate description for an image using Amazon Nova Pro.
+        Generate description for an image file using Amazon Nova.
+        prompt: defaults to the tier's prompt.
         Returns: tuple (description, logs, success)
         """
-        logs = []
-        
+        logs = [f"Processing image: {image_file_path}"]
+
         try:
-            logs.append(f"Processing image: {image_file_path}")
-            
             with open(image_file_path, "rb") as f:
                 image_data = f.read()
-            
-            logs.append(f"Image data loaded: {len(image_data)} bytes")
-            
-            base64_image_data = base64.b64encode(image_data).decode('utf-8')
             image_format = self._get_image_format(image_file_path)
-            
-            logs.append(f"Image format detected: {image_format}")
-
-            # System instructions
-            system_list = [
-                {"text": "You are an expert image analyst. Provide a detailed description of the image including objects, people, activities, setting, and any notable details."}
-            ]
-
-            # User message with image and text prompt
-            message_list = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "image": {
-                                "format": image_format,
-                                "source": {"bytes": base64_image_data}
-                            }
-                        },
-                        {
-                            "text": prompt
-                        }
-                    ]
-                }
-            ]
-
-            # Inference parameters
-            inference_config = {
-                "maxTokens": 10240,
-                "temperature": 0.3,
-                "topP": 0.9
-            }
+        except (OSError, ValueError) as e:
+            logs.append(f"Error describing image: {str(e)}")
+            return None, logs, False
 
-            # Full request payload
-            native_request = {
-                "schemaVersion": "messages-v1",
-                "system": system_list,
-                "messages": message_list,
-                "inferenceConfig": inference_config
-            }
+        description, image_logs, success = self.describe_image_bytes(image_data, image_format, prompt)
+        return description, logs + image_logs, success
 
-            logs.append("Invoking Amazon Nova Pro for image description")
+    def describe_image_bytes(self, image_bytes, image_format, prompt=None):
+        """
+        Generate description for raw image bytes using Amazon Nova.
+        The request body is written straight from the bytes (see
+        build_image_request_body), without a base64 string or JSON dump of it.
+        If the tier's model is throttled, a faster tier's model describes the image.
+        Returns: tuple (description, logs, success)
+        """
+        logs = [f"Image data loaded: {len(image_bytes)} bytes, format: {image_format}"]
 
-            # Invoke Nova Pro
+        def invoke(tier):
+            request_body = build_image_request_body(
+                image_bytes, image_format, prompt or tier['prompt'] or DEFAULT_PROMPT,
+                tier['system_prompt'] or SYSTEM_PROMPT, tier_inference_config(tier)
+            )
             response = self.bedrock_runtime.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(native_request),
+                modelId=tier['model_id'],
+                body=request_body,
                 contentType='application/json',
                 accept='application/json'
             )
+            return json_backend.loads(response['body'].read())
+
+        try:
+            logs.append(f"Invoking {self.model_id} for image description ({self.tier['name']} tier)")
 
-            response_body = json.loads(response['body'].read())
+            with cancellation.stage('image_description'):
+                response_body, tier = tiers.call('image_description', self.tier, 'model_id', invoke)
+            if tier is not self.tier:
+                logs.append(f"{self.model_id} throttled; described with {tier['model_id']} ({tier['name']} tier)")
+            usage.record_model('image_description', tier['model_id'], response_body.get('usage'))
             description = response_body["output"]["message"]["content"][0]["text"]
-            
+
             logs.append(f"Image description generated successfully: {len(description)} characters")
-            
+
             return description, logs, True
 
         except Exception as e:
@@ -117,14 +207,20 @@ class BedrockFlowInvoker:
     """
     Invokes a Bedrock Flow for cultural analysis.
     """
-    def __init__(self, flow_id="CJB0RNM9XM", flow_alias="I4LBMMG8G8"):
+    def __init__(self, flow_id="CJB0RNM9XM", flow_alias=None, backend=None, tier=None):
         """
         Initializes the invoker with a Bedrock Agent Runtime client.
+        backend: 'aws' or 'emulator'; defaults to the AWS_BACKEND setting.
+        tier: latency tier name (see tiers.py); defaults to LATENCY_TIER.
+        flow_alias: overrides the tier's flow alias.
         """
         self.region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
-        self.client = boto3.client("bedrock-agent-runtime", region_name=self.region)
+        self.client = get_client("bedrock-agent-runtime", region_name=self.region, backend=backend)
         self.flow_id = flow_id
-        self.flow_alias = flow_alias
+        self.tier = tiers.get(tier)
+        if flow_alias:
+            self.tier = dict(self.tier, flow_alias=flow_alias)
+        self.flow_alias = self.tier['flow_alias']
 
     def invoke_cultural_analysis_flow(self, text_content, country="Malaysia", file_type="image"):
         """
@@ -144,35 +240,51 @@ class BedrockFlowInvoker:
 
             log_messages.append(f"Invoking Bedrock flow with input: {input_document}")
 
-            # Invoke the flow
-            response = self.client.invoke_flow(
-                flowIdentifier=self.flow_id,
-                flowAliasIdentifier=self.flow_alias,
-                enableTrace=True,
-                inputs=[
-                    {
-                        "content": {
-                            "document": input_document
-                        },
-                        "nodeName": "FlowInputNode",
-                        "nodeOutputName": "document"
-                    }
-                ]
-            )
-
-            final_output = None
-            for event in response["responseStream"]:
-                # Each event is a dict with exactly one key
-                for event_type, event_value in event.items():
-                    if event_type == "flowOutputEvent":
-                        # The output is nested under 'content' and then 'document'
-                        output_value = event_value.get('content', {}).get('document')
-                        if output_value:
-                            final_output = output_value
-                            log_messages.append(f"Flow output received: {type(output_value)}")
-                    elif event_type == "exception":
-                        log_messages.append(f"Exception received from Bedrock Flow: {json.dumps(event_value)}")
-                        return None, log_messages, False
+            def run(tier):
+                # Invoke the flow
+                response = self.client.invoke_flow(
+                    flowIdentifier=self.flow_id,
+                    flowAliasIdentifier=tier['flow_alias'],
+                    enableTrace=True,
+                    inputs=[
+                        {
+                            "content": {
+                                "document": input_document
+                            },
+                            "nodeName": "FlowInputNode",
+                            "nodeOutputName": "document"
+                        }
+                    ]
+                )
+
+                final_output = None
+                node_transitions = 0
+                for event in response["responseStream"]:
+                    cancellation.check()
+                    # Each event is a dict with exactly one key
+                    for event_type, event_value in event.items():
+                        if event_type == "traceEvent" and "nodeInputTrace" in event_value.get("trace", {}):
+                            node_transitions += 1
+                        elif event_type == "flowOutputEvent":
+                            # The output is nested under 'content' and then 'document'
+                            output_value = event_value.get('content', {}).get('document')
+                            if output_value:
+                                final_output = output_value
+                                log_messages.append(f"Flow output received: {type(output_value)}")
+                        elif event_type == "exception":
+                            log_messages.append(f"Exception received from Bedrock Flow: {json.dumps(event_value)}")
+                            usage.record_flow(node_transitions)
+                            return None, False
+
+                usage.record_flow(node_transitions)
+                return final_output, True
+
+            with cancellation.stage('flow'):
+                (final_output, completed), tier = tiers.call('flow', self.tier, 'flow_alias', run)
+            if tier is not self.tier:
+                log_messages.append(f"Flow alias throttled; ran on the {tier['name']} tier's alias")
+            if not completed:
+                return None, log_messages, False
 
             if final_output:
                 log_messages.append("Bedrock flow completed successfully")
@@ -187,7 +299,8 @@ class BedrockFlowInvoker:
 
 
 
-def process_base64_image_and_get_analysis(base64_data: str, image_format: str, country: str = "Malaysia") -> dict:
+def process_base64_image_and_get_analysis(base64_data: str, image_format: str, country: str = "Malaysia",
+                                          tier: str = None) -> dict:
     """
     Processes a base64-encoded image to generate a description and then runs
     it through a cultural analysis Bedrock Flow.
@@ -196,6 +309,7 @@ def process_base64_image_and_get_analysis(base64_data: str, image_format: str, c
         base64_data (str): The base64-encoded image data.
         image_format (str): The image format (jpeg, png, webp, gif).
         country (str): The country context for analysis.
+        tier (str): Latency tier (fast, balanced, thorough); defaults to LATENCY_TIER.
 
     Returns:
         dict: A dictionary containing the analysis result, logs, and status.
@@ -212,61 +326,70 @@ def process_base64_image_and_get_analysis(base64_data: str, image_format: str, c
     
     try:
         # Generate image description
-        pipeline = ImageToTextPipeline()
+        cancellation.plan(['image_description', 'flow'])
+        pipeline = ImageToTextPipeline(tier=tier)
         
         # Add a method to handle base64 directly
         logs = []
         logs.append(f"Processing base64 image data: {len(base64_data)} characters")
 
-        # System instructions
-        system_list = [
-            {"text": "You are an expert image analyst. Provide a detailed description of the image including objects, people, activities, setting, and any notable details."}
-        ]
+        def invoke(tier):
+            # System instructions
+            system_list = [
+                {"text": tier['system_prompt'] or SYSTEM_PROMPT}
+            ]
 
-        # User message with image and text prompt
-        message_list = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "image": {
-                            "format": image_format,
-                            "source": {"bytes": base64_data}
+            # User message with image and text prompt
+            message_list = [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "image": {
+                                "format": image_format,
+                                "source": {"bytes": base64_data}
+                            }
+                        },
+                        {
+                            "text": tier['prompt'] or DEFAULT_PROMPT
                         }
-                    },
-                    {
-                        "text": "Describe this image in detail."
-                    }
-                ]
+                    ]
+                }
+            ]
+
+            # Full request payload
+            native_request = {
+                "schemaVersion": "messages-v1",
+                "system": system_list,
+                "messages": message_list,
+                "inferenceConfig": tier_inference_config(tier)
             }
-        ]
-
-        # Inference parameters
-        inference_config = {
-            "maxTokens": 10240,
-            "temperature": 0.3,
-            "topP": 0.9
-        }
-
-        # Full request payload
-        native_request = {
-            "schemaVersion": "messages-v1",
-            "system": system_list,
-            "messages": message_list,
-            "inferenceConfig": inference_config
-        }
-
-        logs.append("Invoking Amazon Nova Pro for image description")
-
-        # Invoke Nova Pro
-        response = pipeline.bedrock_runtime.invoke_model(
-            modelId=pipeline.model_id,
-            body=json.dumps(native_request),
-            contentType='application/json',
-            accept='application/json'
-        )
 
-        response_body = json.loads(response['body'].read())
+            # The base64 string is spliced into the serialised request rather than serialised with it
+            image_source = message_list[0]["content"][0]["image"]["source"]
+            image_source["bytes"] = IMAGE_PLACEHOLDER
+            request_body = splice_base64_body(native_request, base64_data)
+            if request_body is None:
+                # Not plain base64 text (whitespace, a data: prefix...): let the serialiser escape it
+                image_source["bytes"] = base64_data
+                request_body = json_backend.dumps(native_request)
+
+            # Invoke Nova
+            response = pipeline.bedrock_runtime.invoke_model(
+                modelId=tier['model_id'],
+                body=request_body,
+                contentType='application/json',
+                accept='application/json'
+            )
+            return json_backend.loads(response['body'].read())
+
+        logs.append(f"Invoking {pipeline.model_id} for image description ({pipeline.tier['name']} tier)")
+        with cancellation.stage('image_description'):
+            response_body, described_by = tiers.call('image_description', pipeline.tier, 'model_id', invoke)
+        if described_by is not pipeline.tier:
+            logs.append(f"{pipeline.model_id} throttled; described with {described_by['model_id']} "
+                        f"({described_by['name']} tier)")
+        usage.record_model('image_description', described_by['model_id'], response_body.get('usage'))
         description = response_body["output"]["message"]["content"][0]["text"]
         
         logs.append(f"Image description generated successfully: {len(description)} characters")
@@ -277,7 +400,7 @@ def process_base64_image_and_get_analysis(base64_data: str, image_format: str, c
         
         # Process the description through cultural analysis
         result["logs"].append("Invoking cultural analysis flow")
-        flow_invoker = BedrockFlowInvoker()
+        flow_invoker = BedrockFlowInvoker(tier=tier)
         flow_result, flow_logs, flow_success = flow_invoker.invoke_cultural_analysis_flow(
             description, country=country, file_type="image"
         )
@@ -299,5 +422,37 @@ def process_base64_image_and_get_analysis(base64_data: str, image_format: str, c
     return result["analysis_result"], result["logs"], result["success"]
 
 
+def process_image_bytes_and_get_analysis(image_bytes: bytes, image_format: str, country: str = "Malaysia",
+                                         tier: str = None) -> tuple:
+    """
+    Binary counterpart of process_base64_image_and_get_analysis: describes raw
+    image bytes with Nova Pro, then runs the description through the
+    cultural analysis Bedrock Flow.
 
+    Returns: tuple (analysis_result, logs, success)
+    """
+    logs = [f"Processing binary image data ({len(image_bytes)} bytes)"]
 
+    try:
+        cancellation.plan(['image_description', 'flow'])
+        pipeline = ImageToTextPipeline(tier=tier)
+        description, describe_logs, success = pipeline.describe_image_bytes(image_bytes, image_format)
+        logs.extend(describe_logs)
+        if not success:
+            return None, logs, False
+
+        logs.append("Invoking cultural analysis flow")
+        flow_result, flow_logs, flow_success = BedrockFlowInvoker(tier=tier).invoke_cultural_analysis_flow(
+            description, country=country, file_type="image"
+        )
+        logs.extend(flow_logs)
+
+        if flow_success and flow_result:
+            logs.append("Binary image analysis completed successfully")
+            return flow_result, logs, True
+        logs.append("Binary image analysis failed")
+        return None, logs, False
+
+    except Exception as e:
+        logs.append(f"Exception occurred: {str(e)}")
+        return None, logs, False
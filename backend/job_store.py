@@ -0,0 +1,327 @@
+"""
+Durable store for /speech-to-text jobs
+Transcribe jobs outlive the process that started them, so every job is
+recorded in SQLite as soon as it is submitted: the uploaded video key, the
+Transcribe job name, whether Bedrock analysis was requested and the current
+state. On startup, unfinished jobs are collected again, and finished results
+stay readable by id (GET /jobs/{id}) across restarts.
+
+Several workers can share one database file. A job is only collected by the
+worker holding its lease, which is renewed on every Transcribe status poll;
+a job whose lease has expired (its worker died) can be claimed by another.
+
+Background collection (wait=false requests and resumed jobs) runs on its own
+thread pool: each collection holds a thread for the whole Transcribe wait,
+and in the request threadpool a few dozen of them would stall every route.
+
+States: uploading -> transcribing -> analyzing -> completed | failed
+
+Configuration:
+- JOB_STORE_PATH: SQLite file (default jobs.db)
+- JOB_LEASE_SECONDS: how long a worker owns a job without renewing (default 60)
+- JOB_RESUME=0: do not resume unfinished jobs on startup
+- JOB_COLLECT_WORKERS: threads collecting jobs in the background (default 16)
+- JOB_RESUME_CONCURRENCY: most resumed jobs collected at once per worker (default 4)
+"""
+import contextvars
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import json_backend
+import metrics
+import progress
+import usage
+import video_analysis
+
+UNFINISHED_STATES = ('uploading', 'transcribing', 'analyzing')
+
+JOBS_RESUMED = metrics.counter('jobs_resumed_total', 'Unfinished speech-to-text jobs collected again after a restart')
+JOBS_FINISHED = metrics.counter('jobs_finished_total', 'Speech-to-text jobs reaching a final state')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    filename TEXT,
+    language_code TEXT,
+    use_bedrock INTEGER NOT NULL DEFAULT 0,
+    multimodal INTEGER NOT NULL DEFAULT 0,
+    video_key TEXT,
+    video_timestamp TEXT,
+    job_name TEXT,
+    result TEXT,
+    visual_findings TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+_COLUMNS = ('id', 'state', 'filename', 'language_code', 'use_bedrock', 'multimodal', 'video_key', 'video_timestamp',
+            'job_name', 'result', 'visual_findings', 'error', 'owner', 'lease_until', 'created_at', 'updated_at')
+
+# Columns added after the first release, for databases created before them
+_ADDED_COLUMNS = {
+    'multimodal': "INTEGER NOT NULL DEFAULT 0",
+    'visual_findings': "TEXT",
+}
+
+_JSON_COLUMNS = ('result', 'visual_findings')
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def worker_id():
+    """Identifies this worker process as a lease owner."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobStore:
+    """SQLite-backed job records, safe to share between threads and worker processes."""
+    def __init__(self, path=None, lease_seconds=None):
+        self.path = path or os.getenv('JOB_STORE_PATH', 'jobs.db')
+        self.lease_seconds = float(lease_seconds or os.getenv('JOB_LEASE_SECONDS', '60'))
+        self.owner = worker_id()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL lets readers (GET /jobs/{id}) run while another worker writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for name, definition in _ADDED_COLUMNS.items():
+            if name not in existing:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def create(self, job_id, filename=None, language_code=None, use_bedrock=False, multimodal=False):
+        """Records a new job in the 'uploading' state, leased to this worker."""
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, state, filename, language_code, use_bedrock, multimodal, owner, lease_until,"
+            " created_at, updated_at) VALUES (?, 'uploading', ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, filename, language_code, int(bool(use_bedrock)), int(bool(multimodal)), self.owner,
+             now + self.lease_seconds, now, now)
+        )
+
+    def update(self, job_id, **fields):
+        for name in _JSON_COLUMNS:
+            if fields.get(name) is not None:
+                fields[name] = json_backend.dumps(fields[name]).decode('utf-8')
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        """Returns the job as a dict (result decoded), or None."""
+        row = self._execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job['use_bedrock'] = bool(job['use_bedrock'])
+        job['multimodal'] = bool(job['multimodal'])
+        for name in _JSON_COLUMNS:
+            if job[name] is not None:
+                job[name] = json_backend.loads(job[name])
+        return job
+
+    def unfinished(self):
+        """Returns ids of jobs not yet completed or failed, oldest first."""
+        placeholders = ", ".join("?" for _ in UNFINISHED_STATES)
+        rows = self._execute(
+            f"SELECT id FROM jobs WHERE state IN ({placeholders}) ORDER BY created_at", UNFINISHED_STATES
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, job_id):
+        """
+        Takes (or renews) the lease on an unfinished job.
+        Returns: True if this worker now owns the job
+        """
+        now = time.time()
+        cursor = self._execute(
+            "UPDATE jobs SET owner = ?, lease_until = ?"
+            " WHERE id = ? AND state IN ('uploading', 'transcribing', 'analyzing')"
+            " AND (owner = ? OR lease_until < ?)",
+            (self.owner, now + self.lease_seconds, job_id, self.owner, now)
+        )
+        return cursor.rowcount == 1
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide JobStore, opening the database on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
+
+
+def get_executor():
+    """Returns the background collection threads, starting them on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv('JOB_COLLECT_WORKERS', '16')),
+                                           thread_name_prefix='job-collect')
+        return _executor
+
+
+def submit(func, *args):
+    """Runs func on the collection executor with the caller's context variables."""
+    context = contextvars.copy_context()
+    return get_executor().submit(context.run, func, *args)
+
+
+def shutdown():
+    """Stops the collection executor; queued collections are dropped and resumed on the next start."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def finish(store, job_id, result=None, error=None):
+    """Moves a job to its final state and releases the lease."""
+    state = 'failed' if error else 'completed'
+    store.update(job_id, state=state, result=result, error=error, owner=None, lease_until=0)
+    JOBS_FINISHED.inc(state=state)
+    progress.hub.publish(job_id, state, {"error": error} if error else {"result": result})
+
+
+def collect_job(job_id, pipeline=None, store=None, visual=None):
+    """
+    Collects a submitted job: waits for Transcribe, reads the transcript and
+    runs the Bedrock flow if it was requested, recording each step.
+    visual: the job's video_analysis.VisualAnalysis for multimodal jobs; it
+    runs during the Transcribe wait and is only awaited once the transcript is in.
+    Returns tuple: (text, language_info, bedrock_result, success)
+    """
+    store = store or get_store()
+    job = store.get(job_id)
+    if job is None or not store.claim(job_id):
+        if visual is not None:
+            visual.cancel()
+        return None, None, None, False
+
+    # Jobs resumed after a restart have no request to inherit a usage recorder from
+    recorder = usage.current() or usage.UsageRecorder('/speech-to-text')
+    with progress.job_scope(job_id), usage.scope(recorder.endpoint, recorder):
+        return _collect(store, job, pipeline, visual, recorder)
+
+
+def _collect(store, job, pipeline, visual, recorder):
+    job_id = job['id']
+
+    if job['state'] == 'uploading':
+        # The worker died before the upload finished; the temp file is gone with it
+        finish(store, job_id, error="Interrupted before the video was uploaded")
+        return None, None, None, False
+
+    if pipeline is None:
+        from speech_to_text import MP4ToTextPipeline
+        pipeline = MP4ToTextPipeline()
+
+    try:
+        text, language_info, success = pipeline.collect_transcription(
+            job['job_name'], job['video_timestamp'], on_poll=lambda: store.claim(job_id)
+        )
+        if not success:
+            finish(store, job_id, error="Transcription failed")
+            return None, None, None, False
+
+        findings = None
+        if visual is not None:
+            waiting_since = time.monotonic()
+            findings, _, _ = visual.result()
+            video_analysis.VISUAL_WAIT.observe(time.monotonic() - waiting_since)
+            store.update(job_id, visual_findings=findings)
+            progress.emit("keyframes_ready", keyframes=findings)
+        elif job['multimodal']:
+            # Resumed after a restart: frames described before it are kept, the rest are lost with the worker
+            findings = job['visual_findings'] or []
+
+        bedrock_result = None
+        if job['use_bedrock']:
+            store.update(job_id, state='analyzing')
+            progress.emit("state", state='analyzing')
+            content = video_analysis.merge_findings(text, findings)
+            bedrock_result = pipeline.process_text_with_bedrock(content, job['filename'] or "video_file")
+
+        finish(store, job_id, result={
+            "text": text,
+            "language_info": language_info,
+            "bedrock_analysis": bedrock_result,
+            "keyframes": findings,
+            "usage": recorder.summary()
+        })
+        return text, language_info, bedrock_result, True
+    except Exception as e:
+        finish(store, job_id, error=str(e))
+        return None, None, None, False
+    finally:
+        if visual is not None:
+            # No effect once result() ran; otherwise the job failed first and the frames are not needed
+            visual.cancel()
+
+
+def lease_wait(job_id, store=None):
+    """
+    Seconds until this worker may claim an unfinished job: 0 when it can now,
+    None when the job is gone or finished and needs no collecting.
+    """
+    store = store or get_store()
+    job = store.get(job_id)
+    if job is None or job['state'] not in UNFINISHED_STATES:
+        return None
+    remaining = job['lease_until'] - time.time()
+    if job['owner'] == store.owner or remaining < 0:
+        return 0.0
+    return max(0.5, remaining)
+
+
+def resume_job(job_id, store=None):
+    """
+    Resumes one unfinished job after a restart, if its lease is free. Callers
+    wait for another worker's lease to run out with lease_wait() first.
+    Returns: True if this worker collected the job
+    """
+    store = store or get_store()
+    job = store.get(job_id)
+    if job is None or job['state'] not in UNFINISHED_STATES or not store.claim(job_id):
+        return False
+    JOBS_RESUMED.inc(state=job['state'])
+    collect_job(job_id, store=store)
+    return True
+
+
+def resume_enabled():
+    return os.getenv('JOB_RESUME', '1').lower() not in ('0', 'false', 'no')
+
+
+def resume_concurrency():
+    return max(1, int(os.getenv('JOB_RESUME_CONCURRENCY', '4')))
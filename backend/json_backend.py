@@ -0,0 +1,39 @@
+"""
+Fast JSON backend
+Uses orjson when it is installed and falls back to the standard library.
+Set JSON_BACKEND=json to force the standard library.
+"""
+import datetime
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None and os.getenv('JSON_BACKEND', 'orjson').lower() == 'orjson' else 'json'
+
+
+def _default(obj):
+    # orjson serialises datetimes natively; match it (boto3 responses carry them)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Serialises obj to compact UTF-8 JSON bytes."""
+    if BACKEND == 'orjson':
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def loads(data):
+    """Parses JSON from bytes, bytearray, memoryview or str."""
+    if BACKEND == 'orjson':
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode('utf-8')
+    return json.loads(data)
+
@@ -0,0 +1,134 @@
+"""
+AWS Lambda entry point for the same routes as app.py
+Translates API Gateway (REST v1 and HTTP API v2) and ALB events into ASGI
+requests for the FastAPI app, so no extra adapter package is needed.
+
+Handler setting: lambda_handler.handler
+The app's startup hooks (e.g. STARTUP_MODE=prewarm) run once per cold start,
+during Lambda's init phase.
+"""
+import asyncio
+import base64
+from urllib.parse import urlencode
+
+from app import app
+
+TEXT_CONTENT_TYPES = ('text/', 'application/json', 'application/xml', 'application/javascript')
+
+_loop = asyncio.new_event_loop()
+_lifespan = {"started": False}
+
+
+async def _startup():
+    """Runs the ASGI lifespan startup so on_event("startup") hooks execute."""
+    startup_complete = asyncio.Event()
+    messages = asyncio.Queue()
+    await messages.put({"type": "lifespan.startup"})
+
+    async def receive():
+        return await messages.get()
+
+    async def send(message):
+        if message["type"] in ("lifespan.startup.complete", "lifespan.startup.failed"):
+            startup_complete.set()
+
+    # The lifespan task waits for a shutdown message that never comes; Lambda freezes it
+    _lifespan["task"] = _loop.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send))
+    await startup_complete.wait()
+    _lifespan["started"] = True
+
+
+def _build_scope(event):
+    """Builds an ASGI HTTP scope from an API Gateway v1/v2 or ALB event."""
+    if event.get("version") == "2.0":
+        http = event["requestContext"]["http"]
+        method = http["method"]
+        path = event.get("rawPath") or http.get("path", "/")
+        query_string = event.get("rawQueryString", "")
+        headers = dict(event.get("headers") or {})
+        if event.get("cookies"):
+            headers["cookie"] = "; ".join(event["cookies"])
+        source_ip = http.get("sourceIp", "")
+    else:
+        method = event["httpMethod"]
+        path = event.get("path", "/")
+        multi = event.get("multiValueQueryStringParameters")
+        if multi:
+            query_string = urlencode([(k, v) for k, values in multi.items() for v in values])
+        else:
+            query_string = urlencode(event.get("queryStringParameters") or {})
+        headers = dict(event.get("headers") or {})
+        source_ip = (event.get("requestContext", {}).get("identity") or {}).get("sourceIp", "")
+
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": headers.get("x-forwarded-proto", headers.get("X-Forwarded-Proto", "https")),
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "root_path": "",
+        "query_string": query_string.encode("utf-8"),
+        "headers": [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in headers.items()],
+        "client": (source_ip, 0),
+        "server": (headers.get("host", "lambda"), 443),
+    }
+
+
+async def _invoke(event):
+    if not _lifespan["started"]:
+        await _startup()
+
+    scope = _build_scope(event)
+    body = event.get("body") or ""
+    body = base64.b64decode(body) if event.get("isBase64Encoded") else body.encode("utf-8")
+
+    request_sent = False
+    response = {"status": 500, "headers": [], "body": []}
+    response_complete = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Lambda never disconnects mid-request; block until the response is done
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+
+    headers = {}
+    for key, value in response["headers"]:
+        name = key.decode("latin-1")
+        # Repeated headers (e.g. Set-Cookie) are joined; API Gateway accepts comma-separated values
+        headers[name] = f"{headers[name]},{value.decode('latin-1')}" if name in headers else value.decode("latin-1")
+
+    payload = b"".join(response["body"])
+    content_type = headers.get("content-type", "")
+    is_text = content_type.startswith(TEXT_CONTENT_TYPES) and "content-encoding" not in headers
+    return {
+        "statusCode": response["status"],
+        "headers": headers,
+        "body": payload.decode("utf-8") if is_text else base64.b64encode(payload).decode("ascii"),
+        "isBase64Encoded": not is_text,
+    }
+
+
+def handler(event, context):
+    """Lambda entry point."""
+    return _loop.run_until_complete(_invoke(event))
+
+
+# Run startup hooks at import time, i.e. during the Lambda init phase
+_loop.run_until_complete(_startup())
@@ -0,0 +1,379 @@
+"""
+Concurrent load generator for the Video Speech-to-Text API
+Replaces the serial test_api.py harness when you need numbers under concurrency.
+
+Modes:
+- open:   fixed arrival rate (requests are scheduled whether or not earlier ones finished)
+- closed: N virtual users, each sending its next request after the previous one returns
+
+Examples:
+    python load_test.py --mode open --rate 5 --duration 60 --mix text=5,image=3,health=1
+    python load_test.py --mode closed --users 20 --duration 60 --mix text=1,image=1 --pace 2
+    python load_test.py --mode closed --users 4 --mix video=1 --video test_video.mp4
+
+Latency is reported twice: as measured from when each request was actually sent,
+and corrected for coordinated omission (measured from when it should have been sent).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+BASE_URL = "http://localhost:8000"
+
+PERCENTILES = [50, 90, 95, 99, 99.9]
+
+
+def load_payloads(text_file="test.txt", image_files=("test_image.jpg", "test2.jpg"), video_file=None):
+    """
+    Reads the sample payloads once so request bodies are not rebuilt per request.
+    Returns: dict of endpoint name -> list of (method, path, json_body)
+    """
+    payloads = {
+        "testing": [("GET", "/testing", None)],
+        "health": [("GET", "/health", None)],
+    }
+
+    if text_file and os.path.exists(text_file):
+        with open(text_file, "r", encoding="utf-8") as f:
+            text_content = f.read()
+        payloads["text"] = [("POST", "/text-analysis", {"text_content": text_content, "country": "Malaysia"})]
+
+    images = []
+    for image_file in image_files:
+        if image_file and os.path.exists(image_file):
+            with open(image_file, "rb") as f:
+                image_base64 = base64.b64encode(f.read()).decode("utf-8")
+            image_format = image_file.split(".")[-1].lower()
+            if image_format == "jpg":
+                image_format = "jpeg"
+            images.append(("POST", "/image-analysis", {
+                "image_base64": image_base64,
+                "image_format": image_format,
+                "country": "Malaysia"
+            }))
+    if images:
+        payloads["image"] = images
+
+    if video_file and os.path.exists(video_file):
+        with open(video_file, "rb") as f:
+            video_base64 = base64.b64encode(f.read()).decode("utf-8")
+        payloads["video"] = [("POST", "/speech-to-text", {
+            "video_base64": video_base64,
+            "filename": os.path.basename(video_file),
+            "use_bedrock": True
+        })]
+
+    return payloads
+
+
+def synthetic_payloads(megabytes, seed=None):
+    """
+    Random payloads of the given size for memory testing: an image and a video
+    whose decoded size is `megabytes` MB (the JSON body is ~33% larger).
+    Returns: dict of endpoint name -> list of (method, path, json_body)
+    """
+    rng = random.Random(seed)
+    data = base64.b64encode(rng.randbytes(int(megabytes * 1024 * 1024))).decode("utf-8")
+    return {
+        "image": [("POST", "/image-analysis", {"image_base64": data, "image_format": "jpeg", "country": "Malaysia"})],
+        "video": [("POST", "/speech-to-text", {"video_base64": data, "filename": "synthetic.mp4", "use_bedrock": False})]
+    }
+
+
+def parse_mix(mix):
+    """Parses 'text=5,image=3,health=1' into {'text': 5.0, 'image': 3.0, 'health': 1.0}."""
+    weights = {}
+    for part in mix.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class Workload:
+    """Picks the next request according to the endpoint mix."""
+    def __init__(self, payloads, weights, seed=None):
+        missing = [name for name in weights if name not in payloads]
+        if missing:
+            raise ValueError(f"No payload available for endpoint(s): {', '.join(missing)}")
+        self.payloads = payloads
+        self.names = list(weights)
+        self.weights = [weights[name] for name in self.names]
+        self.random = random.Random(seed)
+
+    def next(self):
+        name = self.random.choices(self.names, weights=self.weights)[0]
+        method, path, body = self.random.choice(self.payloads[name])
+        return name, method, path, body
+
+
+class Sample:
+    """One completed request."""
+    __slots__ = ("endpoint", "intended", "started", "finished", "outcome")
+
+    def __init__(self, endpoint, intended, started, finished, outcome):
+        self.endpoint = endpoint
+        self.intended = intended
+        self.started = started
+        self.finished = finished
+        self.outcome = outcome
+
+    @property
+    def latency(self):
+        return self.finished - self.started
+
+    @property
+    def corrected_latency(self):
+        return self.finished - self.intended
+
+
+async def send(client, workload, intended):
+    """Sends one request and classifies its outcome."""
+    endpoint, method, path, body = workload.next()
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=body)
+        if response.status_code != 200:
+            outcome = f"HTTP {response.status_code}"
+        elif method == "POST" and response.json().get("success") is False:
+            outcome = "success=false"
+        else:
+            outcome = "ok"
+    except Exception as e:
+        outcome = type(e).__name__
+    return Sample(endpoint, intended, started, time.perf_counter(), outcome)
+
+
+async def run_open_loop(client, workload, rate, duration, poisson=False, seed=None):
+    """
+    Fixed arrival rate: request i is due at start + i/rate (or Poisson arrivals).
+    Requests are launched on schedule regardless of how many are still in flight,
+    so latency is measured against the intended send time.
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    tasks = []
+    next_due = start
+    while next_due < start + duration:
+        delay = next_due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, workload, next_due)))
+        next_due += rng.expovariate(rate) if poisson else 1.0 / rate
+    return await asyncio.gather(*tasks)
+
+
+async def run_closed_loop(client, workload, users, duration, think_time=0.0, pace=None):
+    """
+    N virtual users, each waiting for its response before sending again.
+    With pace set, each user intends to start a request every `pace` seconds,
+    so a slow response pushes later requests past their intended start time.
+    """
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def user(index):
+        samples = []
+        # Spread users over the first pacing interval instead of a thundering herd
+        intended = start + (pace * index / users if pace else 0.0)
+        while intended < deadline:
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sample = await send(client, workload, intended)
+            samples.append(sample)
+            if think_time:
+                await asyncio.sleep(think_time)
+            if pace:
+                intended += pace
+            else:
+                intended = time.perf_counter()
+        return samples
+
+    results = await asyncio.gather(*(user(i) for i in range(users)))
+    return [sample for samples in results for sample in samples]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def backfill(latencies, expected_interval):
+    """
+    Coordinated-omission correction for unpaced closed-loop runs (HdrHistogram style):
+    a response that took L seconds also hid the requests that would have been sent
+    every expected_interval during it, so add their synthetic latencies L-I, L-2I, ...
+    """
+    if not expected_interval or expected_interval <= 0:
+        return list(latencies)
+    corrected = []
+    for latency in latencies:
+        corrected.append(latency)
+        missing = latency - expected_interval
+        while missing >= expected_interval:
+            corrected.append(missing)
+            missing -= expected_interval
+    return corrected
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    summary = {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "max": values[-1],
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct:g}"] = percentile(values, pct)
+    return summary
+
+
+def build_report(samples, mode, elapsed, expected_interval=None):
+    """
+    Aggregates samples into throughput, latency percentiles and an error breakdown.
+    Returns: dict
+    """
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+
+    report = {
+        "mode": mode,
+        "elapsed_seconds": elapsed,
+        "requests": len(samples),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "errors": dict(Counter(s.outcome for s in samples if s.outcome != "ok")),
+        "endpoints": {}
+    }
+
+    for endpoint, endpoint_samples in sorted(by_endpoint.items()):
+        latencies = [s.latency for s in endpoint_samples]
+        if mode == "closed" and expected_interval is not None:
+            corrected = backfill(latencies, expected_interval)
+        else:
+            corrected = [s.corrected_latency for s in endpoint_samples]
+        report["endpoints"][endpoint] = {
+            "requests": len(endpoint_samples),
+            "ok": sum(1 for s in endpoint_samples if s.outcome == "ok"),
+            "errors": dict(Counter(s.outcome for s in endpoint_samples if s.outcome != "ok")),
+            "latency": summarize(latencies),
+            "corrected_latency": summarize(corrected)
+        }
+
+    return report
+
+
+def print_report(report):
+    print("=" * 70)
+    print(f"Mode: {report['mode']}  Requests: {report['requests']}  "
+          f"Elapsed: {report['elapsed_seconds']:.1f}s  Throughput: {report['throughput_rps']:.2f} req/s")
+    print("=" * 70)
+
+    columns = ["count", "mean"] + [f"p{pct:g}" for pct in PERCENTILES] + ["max"]
+    header = f"{'endpoint':<10} {'kind':<10}" + "".join(f"{c:>9}" for c in columns)
+    print(header)
+    for endpoint, stats in report["endpoints"].items():
+        for kind in ("latency", "corrected_latency"):
+            summary = stats[kind]
+            label = "measured" if kind == "latency" else "corrected"
+            cells = []
+            for column in columns:
+                value = summary.get(column)
+                if value is None:
+                    cells.append(f"{'-':>9}")
+                elif column == "count":
+                    cells.append(f"{value:>9d}")
+                else:
+                    cells.append(f"{value * 1000:>8.0f}m")
+            print(f"{endpoint:<10} {label:<10}" + "".join(cells))
+
+    print("-" * 70)
+    if report["errors"]:
+        print("Errors:")
+        for endpoint, stats in report["endpoints"].items():
+            for outcome, count in sorted(stats["errors"].items()):
+                print(f"  {endpoint:<10} {outcome:<25} {count}")
+    else:
+        print("Errors: none")
+    print("(latencies in milliseconds)")
+
+
+async def run(args):
+    payloads = load_payloads(args.text, args.images, args.video)
+    if args.synthetic_mb:
+        payloads.update(synthetic_payloads(args.synthetic_mb, seed=args.seed))
+    workload = Workload(payloads, parse_mix(args.mix), seed=args.seed)
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        if args.mode == "open":
+            samples = await run_open_loop(client, workload, args.rate, args.duration,
+                                          poisson=args.poisson, seed=args.seed)
+            expected_interval = None
+        else:
+            samples = await run_closed_loop(client, workload, args.users, args.duration,
+                                            think_time=args.think_time, pace=args.pace)
+            # Paced runs already measure from the intended start; unpaced runs get backfilled
+            if args.pace:
+                expected_interval = None
+            else:
+                measured = sorted(s.latency for s in samples)
+                expected_interval = args.expected_interval or (
+                    (percentile(measured, 50) or 0.0) + args.think_time
+                )
+        elapsed = time.perf_counter() - start
+
+    return build_report(samples, args.mode, elapsed, expected_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load generator for the API")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--mode", choices=["open", "closed"], default="closed")
+    parser.add_argument("--mix", default="text=1,image=1,health=1",
+                        help="Endpoint weights: testing, health, text, image, video")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load")
+    parser.add_argument("--rate", type=float, default=5.0, help="Open loop: requests per second")
+    parser.add_argument("--poisson", action="store_true", help="Open loop: Poisson instead of fixed arrivals")
+    parser.add_argument("--users", type=int, default=10, help="Closed loop: number of virtual users")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Closed loop: pause between requests")
+    parser.add_argument("--pace", type=float, default=None,
+                        help="Closed loop: intended seconds between request starts per user")
+    parser.add_argument("--expected-interval", type=float, default=None,
+                        help="Closed loop without --pace: interval used for coordinated-omission backfill")
+    parser.add_argument("--text", default="test.txt")
+    parser.add_argument("--images", nargs="*", default=["test_image.jpg", "test2.jpg"])
+    parser.add_argument("--video", default=None, help="MP4 file to enable the 'video' endpoint")
+    parser.add_argument("--synthetic-mb", type=float, default=None,
+                        help="Replace image/video payloads with random data of this many MB")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_output", default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Process-pool offload for CPU-bound media work
+Base64 decoding of uploaded media holds the GIL and stalls every other
+request on the worker. With MEDIA_WORKERS > 0 it runs in a pool of worker
+processes instead.
+
+Large strings are handed to workers through shared memory rather than pickled,
+and the decoded media is written by the worker straight to a temp file, so
+only a path comes back.
+
+Nova request bodies are not offloaded: splicing the base64 string into the
+serialised request (image_checker.splice_base64_body) is a single copy, which
+a process hop could only add to.
+
+Configuration:
+- MEDIA_WORKERS: number of worker processes (default 0 = run inline)
+- MEDIA_OFFLOAD_MIN_BYTES: smaller payloads run inline (default 1 MiB)
+"""
+import base64
+import binascii
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_count():
+    return int(os.getenv('MEDIA_WORKERS', '0'))
+
+
+def should_offload(size):
+    """True when a payload of `size` bytes should go to the process pool."""
+    return worker_count() > 0 and size >= int(os.getenv('MEDIA_OFFLOAD_MIN_BYTES', str(1024 * 1024)))
+
+
+def get_pool():
+    """Returns the process pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver/spawn: forking a process that already runs threads is unsafe
+            method = 'forkserver' if sys.platform.startswith('linux') else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=worker_count(),
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _payload_offset(data):
+    """Offset of the base64 payload, skipping a 'data:...;base64,' prefix."""
+    return data.index(',') + 1 if data.startswith('data:') else 0
+
+
+def _share(data):
+    """Copies an ASCII string into a new shared memory block. Caller closes and unlinks it."""
+    encoded = data.encode('ascii')
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(encoded)))
+    block.buf[:len(encoded)] = encoded
+    return block, len(encoded)
+
+
+def _run_shared(func, data, *args):
+    """Runs func(shm_name, size, *args) in the pool with data in shared memory."""
+    block, size = _share(data)
+    try:
+        return get_pool().submit(func, block.name, size, *args).result()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _attach(name):
+    # Workers share the parent's resource tracker (forkserver/spawn), so the
+    # block stays registered once and the parent's unlink() releases it
+    return shared_memory.SharedMemory(name=name)
+
+
+def _write_decoded(decoded, suffix, prefix):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix=prefix) as temp_file:
+        temp_file.write(decoded)
+        return temp_file.name, len(decoded)
+
+
+def _decode_to_file_worker(shm_name, size, offset, suffix, prefix):
+    block = _attach(shm_name)
+    try:
+        decoded = binascii.a2b_base64(block.buf[offset:size])
+    finally:
+        block.close()
+    return _write_decoded(decoded, suffix, prefix)
+
+
+def decode_base64_to_file(data, suffix='', prefix='media_'):
+    """
+    Decodes base64 (optionally a data URL) into a temp file.
+    Returns tuple: (temp_file_path, decoded_size). The caller deletes the file.
+    """
+    offset = _payload_offset(data)
+    if should_offload(len(data)):
+        return _run_shared(_decode_to_file_worker, data, offset, suffix, prefix)
+    return _write_decoded(base64.b64decode(data[offset:]), suffix, prefix)
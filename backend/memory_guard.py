@@ -0,0 +1,197 @@
+"""
+Per-request memory accounting and per-worker memory budget
+Large base64 bodies are held several times over (request bytes, the JSON string,
+decoded media, request payloads to AWS), so admission is based on an estimate of
+Content-Length x MEMORY_COST_MULTIPLIER. For gzip/zstd bodies the most they
+can decompress to (see compression.CompressionMiddleware.decoded_bound) stands
+in for Content-Length.
+
+Configuration:
+- MEMORY_BUDGET_BYTES: per-worker budget for large requests (0 = not enforced)
+- MEMORY_BUDGET_MODE: 'reject' (fail fast) or 'queue' (wait up to MEMORY_QUEUE_TIMEOUT_SECONDS)
+- MEMORY_COST_MULTIPLIER: estimated peak bytes per request body byte (default 4)
+- MEMORY_LARGE_REQUEST_BYTES: smaller requests bypass the budget (default 1 MiB)
+- MEMORY_TRACKING=1: record tracemalloc high-water marks per request and endpoint
+
+Metrics are exposed through the metrics module at /metrics.
+"""
+import asyncio
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from fastapi.responses import JSONResponse
+
+import compression
+import metrics
+
+REQUEST_BODY_BYTES = metrics.histogram(
+    'request_body_bytes', 'Request body size per endpoint', buckets=metrics.BYTE_BUCKETS)
+REQUEST_MEMORY_PEAK = metrics.histogram(
+    'request_memory_peak_bytes', 'Traced allocation high-water mark per request', buckets=metrics.BYTE_BUCKETS)
+ENDPOINT_MEMORY_PEAK = metrics.gauge(
+    'endpoint_memory_peak_bytes', 'Highest traced allocation high-water mark seen per endpoint')
+PROCESS_PEAK_RSS = metrics.gauge(
+    'process_peak_rss_bytes', 'Peak resident set size of this worker')
+BUDGET_LIMIT = metrics.gauge(
+    'memory_budget_limit_bytes', 'Configured per-worker memory budget')
+BUDGET_RESERVED = metrics.gauge(
+    'memory_budget_reserved_bytes', 'Memory currently reserved by admitted large requests')
+BUDGET_QUEUED = metrics.gauge(
+    'memory_budget_queued_requests', 'Large requests waiting for memory budget')
+BUDGET_REJECTIONS = metrics.counter(
+    'memory_budget_rejections_total', 'Requests rejected by the memory budget')
+BUDGET_QUEUE_WAIT = metrics.histogram(
+    'memory_budget_queue_wait_seconds', 'Time large requests waited for memory budget')
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a request cannot be admitted within the memory budget."""
+    def __init__(self, message, status_code=503, reason='full', retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class MemoryBudget:
+    """Reserves estimated request memory against a per-worker limit."""
+    def __init__(self, limit_bytes, mode='reject', queue_timeout=30.0):
+        self.limit = limit_bytes
+        self.mode = mode
+        self.queue_timeout = queue_timeout
+        self.reserved = 0
+        self._condition = None
+        BUDGET_LIMIT.set(limit_bytes)
+
+    @property
+    def condition(self):
+        # Created on first use so it binds to the server's running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _fits(self, nbytes):
+        return self.reserved + nbytes <= self.limit
+
+    async def acquire(self, nbytes):
+        """Reserves nbytes, waiting in queue mode. Raises MemoryBudgetExceeded."""
+        if nbytes > self.limit:
+            raise MemoryBudgetExceeded(
+                f"Request needs an estimated {nbytes} bytes, more than the worker budget of {self.limit}",
+                status_code=413, reason='too_large'
+            )
+
+        async with self.condition:
+            if not self._fits(nbytes):
+                if self.mode != 'queue':
+                    raise MemoryBudgetExceeded("Worker memory budget exhausted, retry later",
+                                               reason='full', retry_after=1)
+                BUDGET_QUEUED.inc()
+                try:
+                    await asyncio.wait_for(self.condition.wait_for(lambda: self._fits(nbytes)),
+                                           self.queue_timeout)
+                except asyncio.TimeoutError:
+                    raise MemoryBudgetExceeded("Timed out waiting for worker memory budget, retry later",
+                                               reason='queue_timeout', retry_after=int(self.queue_timeout))
+                finally:
+                    BUDGET_QUEUED.dec()
+            self.reserved += nbytes
+            BUDGET_RESERVED.set(self.reserved)
+
+    async def release(self, nbytes):
+        async with self.condition:
+            self.reserved -= nbytes
+            BUDGET_RESERVED.set(self.reserved)
+            self.condition.notify_all()
+
+
+class MemoryTracker:
+    """
+    Per-request allocation high-water marks using tracemalloc.
+    The traced peak is process-wide, so it is reset only when no other tracked
+    request is in flight; overlapping requests each report the shared peak,
+    which is an upper bound for any one of them.
+    """
+    def __init__(self):
+        self.active = 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self):
+        if self.active == 0:
+            tracemalloc.reset_peak()
+        self.active += 1
+        return tracemalloc.get_traced_memory()[0]
+
+    def stop(self, baseline):
+        self.active -= 1
+        peak = tracemalloc.get_traced_memory()[1]
+        return max(0, peak - baseline)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def install(app, paths):
+    """Adds memory accounting and budget enforcement for POST requests to the given paths."""
+    limit = int(os.getenv('MEMORY_BUDGET_BYTES', '0'))
+    tracking = os.getenv('MEMORY_TRACKING', '').lower() in ('1', 'true', 'yes')
+    if not limit and not tracking:
+        return
+
+    budget = MemoryBudget(
+        limit,
+        mode=os.getenv('MEMORY_BUDGET_MODE', 'reject').lower(),
+        queue_timeout=float(os.getenv('MEMORY_QUEUE_TIMEOUT_SECONDS', '30'))
+    ) if limit else None
+    multiplier = float(os.getenv('MEMORY_COST_MULTIPLIER', '4'))
+    large_request_bytes = int(os.getenv('MEMORY_LARGE_REQUEST_BYTES', str(1024 * 1024)))
+    tracker = MemoryTracker() if tracking else None
+    guarded_paths = set(paths)
+
+    @app.middleware("http")
+    async def guard_memory(request, call_next):
+        endpoint = request.url.path
+        if request.method != 'POST' or endpoint not in guarded_paths:
+            return await call_next(request)
+
+        # A compressed body has no usable Content-Length; budget for the most it can decode to
+        content_length = (request.scope.get(compression.DECODED_BOUND_KEY)
+                          or int(request.headers.get('content-length') or 0))
+        REQUEST_BODY_BYTES.observe(content_length, endpoint=endpoint)
+
+        reserved = 0
+        estimate = int(content_length * multiplier)
+        if budget and estimate >= large_request_bytes:
+            queued_at = time.perf_counter()
+            try:
+                await budget.acquire(estimate)
+            except MemoryBudgetExceeded as e:
+                BUDGET_REJECTIONS.inc(endpoint=endpoint, reason=e.reason)
+                headers = {'Retry-After': str(e.retry_after)} if e.retry_after else None
+                return JSONResponse(status_code=e.status_code, content={"success": False, "error": str(e)},
+                                    headers=headers)
+            BUDGET_QUEUE_WAIT.observe(time.perf_counter() - queued_at, endpoint=endpoint)
+            reserved = estimate
+
+        baseline = tracker.start() if tracker else None
+        try:
+            response = await call_next(request)
+        finally:
+            if tracker:
+                request_peak = tracker.stop(baseline)
+                REQUEST_MEMORY_PEAK.observe(request_peak, endpoint=endpoint)
+                ENDPOINT_MEMORY_PEAK.set_max(request_peak, endpoint=endpoint)
+            PROCESS_PEAK_RSS.set(peak_rss_bytes())
+            if reserved:
+                await budget.release(reserved)
+
+        if tracker:
+            response.headers['X-Memory-Peak-Bytes'] = str(request_peak)
+        return response
@@ -0,0 +1,146 @@
+"""
+In-process metrics registry
+Counters, gauges and histograms rendered in the Prometheus text format at /metrics.
+"""
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+BYTE_BUCKETS = (2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28, 2 ** 30, 2 ** 32)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    rendered = ','.join(f'{name}="{_escape(value)}"' for name, value in key)
+    return '{' + rendered + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down per label set."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_max(self, value, **labels):
+        """Keeps the highest value seen (high-water mark)."""
+        key = _label_key(labels)
+        with self.lock:
+            if value > self.values.get(key, float('-inf')):
+                self.values[key] = value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            state = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, state in self.values.items():
+                for bound, count in zip(self.buckets, state['buckets']):
+                    samples.append((f"{self.name}_bucket", key + (('le', f"{bound:g}"),), count))
+                samples.append((f"{self.name}_bucket", key + (('le', '+Inf'),), state['count']))
+                samples.append((f"{self.name}_sum", key, state['sum']))
+                samples.append((f"{self.name}_count", key, state['count']))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, **kwargs)
+                self.metrics[name] = metric
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def render(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in sorted(metrics, key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation):
+    return REGISTRY._get_or_create(Counter, name, documentation)
+
+
+def gauge(name, documentation):
+    return REGISTRY._get_or_create(Gauge, name, documentation)
+
+
+def histogram(name, documentation, buckets=DEFAULT_BUCKETS):
+    return REGISTRY._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+
+def render():
+    return REGISTRY.render()
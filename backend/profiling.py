@@ -0,0 +1,289 @@
+"""
+On-demand CPU profiling for the API
+Sampling profiler that writes collapsed stacks (flamegraph.pl / speedscope format).
+
+- Per-request: send the header 'X-Profile: 1' to sample that single request. The
+  stacks are saved under PROFILE_DIR and the profile id is returned in the
+  X-Profile-Id response header; fetch it from GET /admin/profiles/{profile_id}.
+- Admin toggle: POST /admin/profiling {"requests": 5, "path": "/image-analysis"}
+  profiles the next N matching requests without any client change.
+- Continuous: PROFILING_CONTINUOUS=1 samples every thread at a low rate
+  (PROFILING_CONTINUOUS_HZ, default 10) and appends collapsed stacks to PROFILE_DIR.
+
+Nothing is installed unless PROFILING_ENABLED=1, so the overhead is zero when off.
+Both the header and the admin routes require PROFILING_ADMIN_TOKEN in
+X-Admin-Token; without a token configured they are refused, since profiles
+expose stack samples of every thread.
+"""
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# The session of the request currently being profiled, if any
+_current_session = contextvars.ContextVar('profile_session', default=None)
+
+
+def is_enabled():
+    return os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+
+def collapse_stack(frame):
+    """Returns a frame's stack as 'file:function;file:function' from the root down."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+def write_collapsed(path, counts, mode='w'):
+    """Writes 'stack count' lines, the input format for flamegraph.pl and speedscope."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, mode, encoding='utf-8') as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+class ProfileSession:
+    """
+    Collects samples for one request from the threads working on it.
+    The event loop thread is registered for the whole request (body parsing,
+    validation, response encoding); worker threads register via track_thread().
+    Work from other requests sharing the event loop thread shows up too.
+    """
+    def __init__(self, path):
+        self.id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.path = path
+        self.counts = Counter()
+        self.threads = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.lock = threading.Lock()
+
+    def add_thread(self, thread_id):
+        with self.lock:
+            self.threads[thread_id] += 1
+
+    def remove_thread(self, thread_id):
+        with self.lock:
+            self.threads[thread_id] -= 1
+            if self.threads[thread_id] <= 0:
+                del self.threads[thread_id]
+
+    def record(self, frames):
+        with self.lock:
+            thread_ids = list(self.threads)
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.counts[collapse_stack(frame)] += 1
+                self.samples += 1
+
+    def save(self, directory=PROFILE_DIR):
+        """Writes the collapsed stacks to disk and returns the file path."""
+        self.duration = time.perf_counter() - self.started
+        path = os.path.join(directory, f"{self.id}.folded")
+        write_collapsed(path, self.counts)
+        return path
+
+
+class _RequestSampler:
+    """One shared sampling thread serving every active request profile."""
+    def __init__(self, hz):
+        self.interval = 1.0 / hz
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start_session(self, session):
+        with self.lock:
+            self.sessions.add(session)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='profiling-request-sampler', daemon=True)
+                self.thread.start()
+
+    def stop_session(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                sessions = list(self.sessions)
+                if not sessions:
+                    self.thread = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                session.record(frames)
+
+
+class ContinuousSampler:
+    """
+    Low-rate sampler over all threads. Every flush interval the aggregated
+    stacks are appended to an hourly collapsed-stack file in PROFILE_DIR.
+    """
+    def __init__(self, hz=10.0, flush_seconds=60.0, directory=PROFILE_DIR):
+        self.interval = 1.0 / hz
+        self.flush_seconds = flush_seconds
+        self.directory = directory
+        self.counts = Counter()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='profiling-continuous-sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.flush()
+
+    def flush(self):
+        if not self.counts:
+            return
+        counts, self.counts = self.counts, Counter()
+        name = f"continuous-{os.getpid()}-{datetime.now().strftime('%Y%m%d%H')}.folded"
+        write_collapsed(os.path.join(self.directory, name), counts, mode='a')
+
+    def _run(self):
+        own_id = threading.get_ident()
+        last_flush = time.monotonic()
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.counts[collapse_stack(frame)] += 1
+            if time.monotonic() - last_flush >= self.flush_seconds:
+                self.flush()
+                last_flush = time.monotonic()
+
+
+@contextmanager
+def track_thread():
+    """
+    Registers the calling thread with the current request's profile, if any.
+    Wrap blocking work that runs outside the event loop thread with this.
+    """
+    session = _current_session.get()
+    if session is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    session.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        session.remove_thread(thread_id)
+
+
+class ProfilingToggle(BaseModel):
+    requests: int = 1  # Number of upcoming requests to profile
+    path: str = None  # Only profile requests for this path (default: any)
+
+
+def _token_valid(token):
+    """Fails closed: no token is valid unless PROFILING_ADMIN_TOKEN is set."""
+    expected = os.getenv('PROFILING_ADMIN_TOKEN')
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def _check_admin_token(token):
+    if not os.getenv('PROFILING_ADMIN_TOKEN'):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Profiling admin routes are disabled until PROFILING_ADMIN_TOKEN is set")
+    if not _token_valid(token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+def install(app):
+    """Adds the profiling middleware, admin routes and continuous sampler when enabled."""
+    if not is_enabled():
+        return
+
+    sampler = _RequestSampler(float(os.getenv('PROFILING_SAMPLE_HZ', '200')))
+    pending = {"requests": 0, "path": None}
+    pending_lock = threading.Lock()
+
+    def take_pending(path):
+        with pending_lock:
+            if pending["requests"] > 0 and pending["path"] in (None, path):
+                pending["requests"] -= 1
+                return True
+        return False
+
+    @app.middleware("http")
+    async def profile_request(request, call_next):
+        requested = request.headers.get('x-profile', '').lower() in ('1', 'true', 'yes')
+        if requested:
+            requested = _token_valid(request.headers.get('x-admin-token'))
+        if not requested and not take_pending(request.url.path):
+            return await call_next(request)
+
+        session = ProfileSession(request.url.path)
+        token = _current_session.set(session)
+        session.add_thread(threading.get_ident())
+        sampler.start_session(session)
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop_session(session)
+            _current_session.reset(token)
+            session.save()
+        response.headers['X-Profile-Id'] = session.id
+        return response
+
+    router = APIRouter(prefix="/admin", tags=["admin"])
+
+    @router.post("/profiling")
+    async def toggle_profiling(toggle: ProfilingToggle, x_admin_token: str = Header(None)):
+        """Profile the next N requests, optionally only for one path"""
+        _check_admin_token(x_admin_token)
+        with pending_lock:
+            pending["requests"] = max(0, toggle.requests)
+            pending["path"] = toggle.path
+        return {"pending_requests": pending["requests"], "path": pending["path"]}
+
+    @router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+    async def get_profile(profile_id: str, x_admin_token: str = Header(None)):
+        """Return a saved request profile as collapsed stacks"""
+        _check_admin_token(x_admin_token)
+        path = os.path.join(PROFILE_DIR, f"{os.path.basename(profile_id)}.folded")
+        if not os.path.exists(path):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    app.include_router(router)
+
+    if os.getenv('PROFILING_CONTINUOUS', '').lower() in ('1', 'true', 'yes'):
+        continuous = ContinuousSampler(
+            hz=float(os.getenv('PROFILING_CONTINUOUS_HZ', '10')),
+            flush_seconds=float(os.getenv('PROFILING_FLUSH_SECONDS', '60'))
+        )
+
+        @app.on_event("startup")
+        async def start_continuous_profiling():
+            continuous.start()
+
+        @app.on_event("shutdown")
+        async def stop_continuous_profiling():
+            continuous.stop()
@@ -0,0 +1,209 @@
+"""
+Progress events for long-running /speech-to-text jobs
+The pipelines report what they are doing (upload bytes sent, Transcribe status
+changes, transcript fetched, keyframes described, Bedrock flow events) with
+emit(), and clients follow along over one WebSocket instead of polling:
+
+    ws://host/ws/progress?job_id=<id>          subscribe on connect (repeatable)
+    {"subscribe": "<id>"} / {"unsubscribe": "<id>"}   any number of jobs per connection
+
+Every message is {"job_id", "seq", "type", "time", "data"}. A subscriber first
+gets a "snapshot" of the stored job, then the job's recent events, then live
+ones. "completed" and "failed" are the final events of a job.
+
+Events only reach connections on the worker process running the job; with
+several workers, route clients to the worker that accepted the job (or rely
+on the snapshot and GET /jobs/{id}).
+
+Configuration:
+- PROGRESS_HISTORY_EVENTS: events kept per job for late subscribers (default 200)
+- PROGRESS_HISTORY_SECONDS: how long a finished job's events are kept (default 300)
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import json_backend
+import metrics
+
+FINAL_EVENTS = ('completed', 'failed')
+
+EVENTS = metrics.counter('progress_events_total', 'Progress events published')
+DROPPED = metrics.counter('progress_events_dropped_total', 'Progress events dropped for slow subscribers')
+SUBSCRIPTIONS = metrics.gauge('progress_subscriptions', 'Active job subscriptions across WebSocket connections')
+
+_current_job = contextvars.ContextVar('progress_job', default=None)
+
+
+class ProgressHub:
+    """
+    Fans out job events to subscriber queues. publish() may be called from
+    any thread; all other state is only touched on the event loop.
+    """
+    def __init__(self, history_size=200, history_seconds=300.0, queue_size=256):
+        self.history_size = history_size
+        self.history_seconds = history_seconds
+        self.queue_size = queue_size
+        self.loop = None
+        self.history = {}
+        self.sequence = {}
+        self.subscribers = {}
+
+    def bind(self, loop):
+        self.loop = loop
+
+    def publish(self, job_id, event_type, data=None):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._dispatch, job_id, event_type, data or {}, time.time())
+
+    def _dispatch(self, job_id, event_type, data, timestamp):
+        seq = self.sequence.get(job_id, 0) + 1
+        self.sequence[job_id] = seq
+        event = {"job_id": job_id, "seq": seq, "type": event_type, "time": timestamp, "data": data}
+        self.history.setdefault(job_id, deque(maxlen=self.history_size)).append(event)
+        EVENTS.inc(type=event_type)
+        for queue in list(self.subscribers.get(job_id, ())):
+            self._offer(queue, event)
+        if event_type in FINAL_EVENTS:
+            self.loop.call_later(self.history_seconds, self._forget, job_id, seq)
+
+    def _offer(self, queue, event):
+        if queue.full():
+            # A slow client loses its oldest events rather than holding up the job
+            queue.get_nowait()
+            DROPPED.inc()
+        queue.put_nowait(event)
+
+    def _forget(self, job_id, seq):
+        if self.sequence.get(job_id) == seq:
+            self.history.pop(job_id, None)
+            self.sequence.pop(job_id, None)
+
+    def new_queue(self):
+        return asyncio.Queue(maxsize=self.queue_size)
+
+    def subscribe(self, job_id, queue):
+        """Adds a connection's queue to a job and replays the job's recent events into it."""
+        if queue in self.subscribers.setdefault(job_id, set()):
+            return
+        self.subscribers[job_id].add(queue)
+        SUBSCRIPTIONS.inc()
+        for event in self.history.get(job_id, ()):
+            self._offer(queue, event)
+
+    def unsubscribe(self, job_id, queue):
+        queues = self.subscribers.get(job_id)
+        if queues and queue in queues:
+            queues.discard(queue)
+            SUBSCRIPTIONS.dec()
+            if not queues:
+                del self.subscribers[job_id]
+
+
+hub = ProgressHub(
+    history_size=int(os.getenv('PROGRESS_HISTORY_EVENTS', '200')),
+    history_seconds=float(os.getenv('PROGRESS_HISTORY_SECONDS', '300'))
+)
+
+
+@contextmanager
+def job_scope(job_id):
+    """Attributes emit() calls in this context (and threads copying it) to a job."""
+    token = _current_job.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+def emit(event_type, **data):
+    """Publishes an event for the job of the current context; a no-op outside a job."""
+    job_id = _current_job.get()
+    if job_id is not None:
+        hub.publish(job_id, event_type, data)
+
+
+class UploadProgress:
+    """boto3 upload Callback that emits upload_progress about every 5% of the file."""
+    def __init__(self, total_bytes, step=0.05):
+        self.total_bytes = total_bytes
+        self.step_bytes = max(1, int(total_bytes * step))
+        self.sent = 0
+        self.reported = 0
+        self.lock = threading.Lock()
+        # boto3 calls back from its transfer threads, which do not inherit our context
+        self.job_id = _current_job.get()
+
+    def __call__(self, bytes_amount):
+        with self.lock:
+            self.sent += bytes_amount
+            if self.sent - self.reported < self.step_bytes and self.sent < self.total_bytes:
+                return
+            self.reported = self.sent
+            sent = self.sent
+        if self.job_id is not None:
+            hub.publish(self.job_id, 'upload_progress', {"bytes_sent": sent, "total_bytes": self.total_bytes})
+
+
+def install(app):
+    """Adds the /ws/progress WebSocket endpoint."""
+    from fastapi import WebSocket, WebSocketDisconnect
+    from starlette.concurrency import run_in_threadpool
+
+    import job_store
+
+    @app.on_event("startup")
+    async def bind_progress_hub():
+        hub.bind(asyncio.get_running_loop())
+
+    async def snapshot(job_id):
+        job = await run_in_threadpool(job_store.get_store().get, job_id)
+        data = {"found": False}
+        if job is not None:
+            data = {"found": True, "state": job["state"], "error": job["error"], "result": job["result"]}
+        return {"job_id": job_id, "seq": 0, "type": "snapshot", "time": time.time(), "data": data}
+
+    @app.websocket("/ws/progress")
+    async def progress_socket(websocket: WebSocket):
+        """Streams progress events for any number of jobs over one connection"""
+        await websocket.accept()
+        queue = hub.new_queue()
+        subscribed = set()
+
+        async def subscribe(job_id):
+            if job_id and job_id not in subscribed:
+                subscribed.add(job_id)
+                hub._offer(queue, await snapshot(job_id))
+                hub.subscribe(job_id, queue)
+
+        async def forward():
+            while True:
+                # json_backend: flow trace events carry datetimes
+                await websocket.send_text(json_backend.dumps(await queue.get()).decode('utf-8'))
+
+        sender = asyncio.create_task(forward())
+        try:
+            for job_id in websocket.query_params.getlist("job_id"):
+                await subscribe(job_id)
+            while True:
+                message = await websocket.receive_json()
+                if not isinstance(message, dict):
+                    continue
+                if "subscribe" in message:
+                    await subscribe(str(message["subscribe"]))
+                elif "unsubscribe" in message:
+                    job_id = str(message["unsubscribe"])
+                    subscribed.discard(job_id)
+                    hub.unsubscribe(job_id, queue)
+        except (WebSocketDisconnect, ValueError):
+            pass
+        finally:
+            sender.cancel()
+            for job_id in subscribed:
+                hub.unsubscribe(job_id, queue)
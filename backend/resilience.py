@@ -0,0 +1,381 @@
+"""
+Resilience layer for AWS calls
+Every client returned by aws_clients.get_client is wrapped so that, per
+dependency (AWS service), calls go through:
+- a token-bucket rate limiter shared across requests, which backs off its rate
+  when the service throttles and recovers gradually on success
+- retries with full-jitter exponential backoff that never run past a deadline;
+  throttled calls are always retried, since the service turned them away, but
+  transient failures and timeouts only for idempotent operations (a timed-out
+  start_transcription_job may have started the job, and repeating it conflicts)
+- a circuit breaker that fails fast while the dependency is unhealthy
+
+Configuration:
+- AWS_RESILIENCE=0 disables the layer
+- AWS_RATE_LIMITS: inline JSON or file path, e.g. {"bedrock-runtime": {"rate": 5, "burst": 10}}
+- AWS_RETRY_MAX_ATTEMPTS (default 5), AWS_RETRY_BASE_DELAY (0.2), AWS_RETRY_MAX_DELAY (5)
+- AWS_RETRY_DEADLINE_SECONDS: total time budget per call including retries (default 30)
+- AWS_BREAKER_FAILURE_THRESHOLD (default 5), AWS_BREAKER_RESET_SECONDS (default 30)
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+DEFAULT_RATE_LIMITS = {
+    'bedrock-runtime': {'rate': 10.0, 'burst': 20.0},
+    'bedrock-agent-runtime': {'rate': 10.0, 'burst': 20.0},
+    'transcribe': {'rate': 5.0, 'burst': 10.0},
+    's3': {'rate': 100.0, 'burst': 200.0},
+}
+
+THROTTLE_ERROR_CODES = {
+    'ThrottlingException', 'Throttling', 'ThrottledException', 'TooManyRequestsException',
+    'LimitExceededException', 'SlowDown', 'RequestLimitExceeded', 'RequestThrottled',
+    'ProvisionedThroughputExceededException',
+}
+
+TRANSIENT_ERROR_CODES = {
+    'InternalServerException', 'InternalFailureException', 'InternalError', 'InternalFailure',
+    'ServiceUnavailableException', 'ServiceUnavailable', 'ModelNotReadyException',
+    'ModelTimeoutException', 'RequestTimeout', 'RequestTimeoutException',
+}
+
+TRANSIENT_EXCEPTION_NAMES = {
+    'EndpointConnectionError', 'ConnectionClosedError', 'ReadTimeoutError',
+    'ConnectTimeoutError', 'ConnectionError',
+}
+
+# Operations safe to repeat after a transient failure or timeout, besides the read-only prefixes
+IDEMPOTENT_PREFIXES = ('get_', 'list_', 'describe_', 'head_')
+IDEMPOTENT_OPERATIONS = {
+    'invoke_model', 'invoke_flow', 'download_file', 'download_fileobj', 'delete_object', 'delete_objects',
+    'delete_transcription_job', 'receive_message', 'delete_message', 'change_message_visibility',
+}
+
+CALLS = metrics.counter('aws_calls_total', 'AWS calls by service, operation and outcome')
+RETRIES = metrics.counter('aws_retries_total', 'AWS call retries by service, operation and reason')
+RATE_LIMIT_WAIT = metrics.histogram('aws_rate_limit_wait_seconds', 'Time spent waiting for a rate limiter token')
+RATE_LIMIT_RATE = metrics.gauge('aws_rate_limit_rate', 'Current adaptive request rate per service')
+CIRCUIT_STATE = metrics.gauge('aws_circuit_state', 'Circuit breaker state per service (0 closed, 1 half-open, 2 open)')
+
+# Absolute time.monotonic() deadline for the current request, if any
+_deadline = contextvars.ContextVar('aws_deadline', default=None)
+
+
+class ResilienceError(Exception):
+    """Raised when the resilience layer refuses or gives up on a call."""
+
+
+class CircuitOpenError(ResilienceError):
+    pass
+
+
+class DeadlineExceeded(ResilienceError):
+    pass
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Caps every AWS call (and its retries) made inside the block to `seconds` from now."""
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(min(current, new_deadline) if current else new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def no_deadline():
+    """Lifts the request deadline inside the block, for background work that outlives the request."""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """Seconds left before the current request deadline, or None if there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def error_code(error):
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code')
+    return None
+
+
+def classify(error):
+    """Returns 'throttle', 'transient' or None (not retryable) for an exception."""
+    code = error_code(error)
+    if code in THROTTLE_ERROR_CODES:
+        return 'throttle'
+    if code in TRANSIENT_ERROR_CODES:
+        return 'transient'
+    if code is not None:
+        status = getattr(error, 'response', {}).get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return 'transient' if status and status >= 500 else None
+    if type(error).__name__ in TRANSIENT_EXCEPTION_NAMES:
+        return 'transient'
+    return None
+
+
+def is_idempotent(operation):
+    return operation in IDEMPOTENT_OPERATIONS or operation.startswith(IDEMPOTENT_PREFIXES)
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to throttling (AIMD): the rate is cut
+    on every throttle and creeps back up towards the configured maximum.
+    """
+    def __init__(self, name, rate, burst, min_rate=None, decrease_factor=0.5, increase_step=None):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate or max(rate * 0.05, 0.1)
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step or max(rate * 0.05, 0.05)
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+        RATE_LIMIT_RATE.set(rate, service=name)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, deadline=None):
+        """Blocks until a token is available. Raises DeadlineExceeded if it would pass the deadline."""
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    RATE_LIMIT_WAIT.observe(now - started, service=self.name)
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded(f"Rate limit for {self.name} would exceed the request deadline")
+            time.sleep(wait)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # Drop any saved burst so the cut takes effect immediately
+            self.tokens = min(self.tokens, 0)
+        RATE_LIMIT_RATE.set(self.rate, service=self.name)
+
+    def on_success(self):
+        with self.lock:
+            if self.rate >= self.max_rate:
+                return
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+        RATE_LIMIT_RATE.set(self.rate, service=self.name)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls, rejects calls while
+    open, and lets one trial call through after `reset_timeout` (half-open).
+    """
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+        CIRCUIT_STATE.set(self.state, service=name)
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.set(state, service=self.name)
+
+    def allow(self):
+        """Raises CircuitOpenError if the call should not be attempted."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+        raise CircuitOpenError(f"Circuit breaker for {self.name} is open")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trial_in_flight = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=0.2, max_delay=5.0, deadline_seconds=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+
+    def backoff(self, attempt):
+        """Full jitter: uniform between 0 and the capped exponential delay."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class Dependency:
+    """Rate limiter and circuit breaker shared by every call to one AWS service."""
+    def __init__(self, name, bucket, breaker, retry_policy):
+        self.name = name
+        self.bucket = bucket
+        self.breaker = breaker
+        self.retry_policy = retry_policy
+
+    def call(self, operation, func, *args, **kwargs):
+        """Runs one AWS call through the breaker, rate limiter and retry loop."""
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline_seconds
+        request_deadline = _deadline.get()
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline)
+
+        attempt = 0
+        while True:
+            try:
+                self.breaker.allow()
+            except CircuitOpenError:
+                CALLS.inc(service=self.name, operation=operation, outcome='circuit_open')
+                raise
+            self.bucket.acquire(deadline)
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                kind = classify(e)
+                if kind == 'throttle':
+                    self.bucket.on_throttle()
+                if kind is None:
+                    # Caller errors (validation, missing keys) say nothing about service health
+                    self.breaker.record_success()
+                    CALLS.inc(service=self.name, operation=operation, outcome='error')
+                    raise
+
+                attempt += 1
+                delay = policy.backoff(attempt)
+                exhausted = (attempt >= policy.max_attempts or time.monotonic() + delay >= deadline
+                             or (kind == 'transient' and not is_idempotent(operation)))
+                # A failed half-open trial reopens the breaker instead of retrying
+                if exhausted or self.breaker.state == CircuitBreaker.HALF_OPEN:
+                    self.breaker.record_failure()
+                    CALLS.inc(service=self.name, operation=operation, outcome=kind)
+                    raise
+                RETRIES.inc(service=self.name, operation=operation, reason=kind)
+                time.sleep(delay)
+                continue
+
+            self.bucket.on_success()
+            self.breaker.record_success()
+            CALLS.inc(service=self.name, operation=operation, outcome='success')
+            return result
+
+
+class ResilientClient:
+    """Proxy around a boto3 (or emulated) client that routes method calls through a Dependency."""
+    def __init__(self, client, dependency):
+        self._client = client
+        self._dependency = dependency
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or name.startswith('_') or name in ('meta', 'exceptions'):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._dependency.call(name, attribute, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+
+def is_enabled():
+    return os.getenv('AWS_RESILIENCE', '1').lower() not in ('0', 'false', 'no')
+
+
+def _load_rate_limits():
+    limits = {name: dict(limit) for name, limit in DEFAULT_RATE_LIMITS.items()}
+    raw = os.getenv('AWS_RATE_LIMITS', '').strip()
+    if raw:
+        if raw.startswith('{'):
+            overrides = json.loads(raw)
+        else:
+            with open(raw, 'r', encoding='utf-8') as f:
+                overrides = json.load(f)
+        for name, limit in overrides.items():
+            limits.setdefault(name, {}).update(limit)
+    return limits
+
+
+_dependencies = {}
+_dependencies_lock = threading.Lock()
+
+
+def get_dependency(service_name):
+    """Returns the process-wide Dependency for an AWS service, creating it on first use."""
+    with _dependencies_lock:
+        dependency = _dependencies.get(service_name)
+        if dependency is None:
+            limit = _load_rate_limits().get(service_name, {'rate': 50.0, 'burst': 100.0})
+            dependency = Dependency(
+                service_name,
+                AdaptiveTokenBucket(service_name, float(limit['rate']), float(limit.get('burst', limit['rate']))),
+                CircuitBreaker(
+                    service_name,
+                    failure_threshold=int(os.getenv('AWS_BREAKER_FAILURE_THRESHOLD', '5')),
+                    reset_timeout=float(os.getenv('AWS_BREAKER_RESET_SECONDS', '30'))
+                ),
+                RetryPolicy(
+                    max_attempts=int(os.getenv('AWS_RETRY_MAX_ATTEMPTS', '5')),
+                    base_delay=float(os.getenv('AWS_RETRY_BASE_DELAY', '0.2')),
+                    max_delay=float(os.getenv('AWS_RETRY_MAX_DELAY', '5')),
+                    deadline_seconds=float(os.getenv('AWS_RETRY_DEADLINE_SECONDS', '30'))
+                )
+            )
+            _dependencies[service_name] = dependency
+        return dependency
+
+
+def reset_dependencies():
+    """Forgets all rate limiter and breaker state, e.g. between benchmark scenarios."""
+    with _dependencies_lock:
+        _dependencies.clear()
+
+
+def wrap_client(client, service_name):
+    return ResilientClient(client, get_dependency(service_name))
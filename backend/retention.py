@@ -0,0 +1,219 @@
+"""
+Retention and compaction for the S3 bucket
+Every /speech-to-text upload lands under videos/ and every transcript under
+transcripts/, and nothing else ever deletes them. A sweep:
+- deletes a video as soon as its transcript exists (the source media is no
+  longer needed once Transcribe has captured it)
+- deletes anything older than its prefix's retention period
+Deletes are sent in delete_objects batches of up to 1000 keys.
+
+Run it in the app with RETENTION_ENABLED=1 (on one instance is enough; sweeps
+are idempotent), or from cron: python retention.py --once [--dry-run]
+
+Configuration:
+- RETENTION_RULES: inline JSON or a path to a JSON file overriding DEFAULT_RULES, e.g.
+  {"videos/": {"max_age_seconds": 86400}, "transcripts/": {"max_age_seconds": 2592000}}
+  A max_age_seconds of null keeps objects under that prefix forever.
+- RETENTION_DELETE_TRANSCRIBED_SOURCES=0: keep videos until they expire
+- RETENTION_INTERVAL_SECONDS: time between sweeps in the app (default 3600)
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import metrics
+from aws_clients import get_client, load_environment
+
+VIDEO_PREFIX = 'videos/'
+TRANSCRIPT_PREFIX = 'transcripts/'
+TRANSCRIPT_SUFFIX = '_transcript.json'
+
+DEFAULT_RULES = {
+    VIDEO_PREFIX: {"max_age_seconds": 7 * 24 * 3600},
+    TRANSCRIPT_PREFIX: {"max_age_seconds": 30 * 24 * 3600},
+}
+
+# S3 limit per delete_objects request
+DELETE_BATCH_SIZE = 1000
+
+OBJECTS_DELETED = metrics.counter('retention_objects_deleted_total', 'Objects deleted by retention sweeps')
+BYTES_RECLAIMED = metrics.counter('retention_bytes_reclaimed_total', 'Bytes of storage freed by retention sweeps')
+DELETE_ERRORS = metrics.counter('retention_delete_errors_total', 'Keys that delete_objects failed to delete')
+SWEEP_FAILURES = metrics.counter('retention_sweep_failures_total', 'Retention sweeps that failed, by exception type')
+SWEEP_SECONDS = metrics.histogram('retention_sweep_seconds', 'Duration of retention sweeps')
+LAST_SWEEP = metrics.gauge('retention_last_sweep_timestamp', 'Unix time the last retention sweep finished')
+
+
+def load_rules():
+    """Returns the per-prefix retention rules: DEFAULT_RULES merged with RETENTION_RULES."""
+    rules = {prefix: dict(rule) for prefix, rule in DEFAULT_RULES.items()}
+    raw = os.getenv('RETENTION_RULES', '').strip()
+    if raw:
+        if raw.startswith('{'):
+            overrides = json.loads(raw)
+        else:
+            with open(raw, 'r', encoding='utf-8') as f:
+                overrides = json.load(f)
+        for prefix, rule in overrides.items():
+            rules.setdefault(prefix, {}).update(rule)
+    return rules
+
+
+def transcript_key_for(video_key):
+    """Transcript key that start_transcription writes for a video key."""
+    base_name = os.path.splitext(os.path.basename(video_key))[0]
+    return f"{TRANSCRIPT_PREFIX}{base_name}{TRANSCRIPT_SUFFIX}"
+
+
+def list_objects(s3, bucket, prefix):
+    """Yields every object under a prefix, following pagination."""
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for obj in response.get('Contents', []):
+            yield obj
+        if not response.get('IsTruncated'):
+            return
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+class BatchDeleter:
+    """Collects keys and deletes them in delete_objects batches, counting what was reclaimed."""
+    def __init__(self, s3, bucket, dry_run=False):
+        self.s3 = s3
+        self.bucket = bucket
+        self.dry_run = dry_run
+        self.pending = []
+        self.seen = set()
+        self.deleted = 0
+        self.reclaimed_bytes = 0
+        self.errors = 0
+
+    def add(self, obj, prefix, reason):
+        # Overlapping prefixes can list the same object twice
+        if obj['Key'] in self.seen:
+            return
+        self.seen.add(obj['Key'])
+        self.pending.append((obj['Key'], obj.get('Size', 0), prefix, reason))
+        if len(self.pending) >= DELETE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        failed = set()
+        if not self.dry_run:
+            response = self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key, _, _, _ in batch], 'Quiet': True}
+            )
+            failed = {error['Key'] for error in response.get('Errors', [])}
+        for key, size, prefix, reason in batch:
+            if key in failed:
+                self.errors += 1
+                DELETE_ERRORS.inc(prefix=prefix)
+                continue
+            self.deleted += 1
+            self.reclaimed_bytes += size
+            if not self.dry_run:
+                OBJECTS_DELETED.inc(prefix=prefix, reason=reason)
+                BYTES_RECLAIMED.inc(size, prefix=prefix, reason=reason)
+
+
+def sweep(s3=None, bucket=None, rules=None, delete_transcribed_sources=None, dry_run=False, now=None):
+    """
+    One retention pass over the bucket.
+    Returns: dict with deleted object count, reclaimed bytes, failed deletes and logs
+    """
+    started = time.monotonic()
+    s3 = s3 or get_client('s3')
+    bucket = bucket or os.getenv('S3_BUCKET_NAME', 'video-bucket-ken')
+    rules = rules if rules is not None else load_rules()
+    if delete_transcribed_sources is None:
+        delete_transcribed_sources = os.getenv('RETENTION_DELETE_TRANSCRIBED_SOURCES', '1').lower() not in ('0', 'false', 'no')
+    now = now or datetime.now(timezone.utc)
+    logs = []
+    deleter = BatchDeleter(s3, bucket, dry_run)
+
+    # Transcripts are listed first so videos can be matched against them
+    transcripts = set()
+    if delete_transcribed_sources:
+        for obj in list_objects(s3, bucket, TRANSCRIPT_PREFIX):
+            transcripts.add(obj['Key'])
+
+    for prefix, rule in rules.items():
+        max_age = rule.get('max_age_seconds')
+        for obj in list_objects(s3, bucket, prefix):
+            age = (now - obj['LastModified']).total_seconds()
+            if max_age is not None and age > max_age:
+                deleter.add(obj, prefix, 'expired')
+            elif prefix == VIDEO_PREFIX and transcript_key_for(obj['Key']) in transcripts:
+                deleter.add(obj, prefix, 'transcribed')
+    deleter.flush()
+
+    verb = "Would delete" if dry_run else "Deleted"
+    logs.append(f"{verb} {deleter.deleted} objects ({deleter.reclaimed_bytes} bytes) from s3://{bucket}")
+    if deleter.errors:
+        logs.append(f"Failed to delete {deleter.errors} objects")
+    SWEEP_SECONDS.observe(time.monotonic() - started)
+    LAST_SWEEP.set(time.time())
+    return {
+        "deleted": deleter.deleted,
+        "reclaimed_bytes": deleter.reclaimed_bytes,
+        "errors": deleter.errors,
+        "logs": logs
+    }
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def _run(interval):
+    while not _stop.wait(interval):
+        try:
+            sweep()
+        except Exception as e:
+            # Try again next interval; a failed sweep deletes nothing it should not
+            SWEEP_FAILURES.inc(error=type(e).__name__)
+
+
+def start():
+    """Starts periodic sweeps in a background thread if RETENTION_ENABLED=1."""
+    global _thread
+    if os.getenv('RETENTION_ENABLED', '').lower() not in ('1', 'true', 'yes') or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, args=(float(os.getenv('RETENTION_INTERVAL_SECONDS', '3600')),),
+                               name='retention', daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop.set()
+    _thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete expired and already-transcribed objects from the bucket")
+    parser.add_argument("--once", action="store_true", help="Run one sweep and exit (default: sweep every interval)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    load_environment()
+    while True:
+        result = sweep(dry_run=args.dry_run)
+        for line in result["logs"]:
+            print(line)
+        if args.once:
+            return
+        time.sleep(float(os.getenv('RETENTION_INTERVAL_SECONDS', '3600')))
+
+
+if __name__ == "__main__":
+    main()
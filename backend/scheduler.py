@@ -0,0 +1,348 @@
+"""
+Priority scheduling of upstream AWS calls
+Interactive checks from the UI share Bedrock and Transcribe capacity with
+bulk audits. Without scheduling, a large audit queues hundreds of calls in
+front of every live user. The scheduler gives each service a number of call
+slots and hands free slots out in order:
+
+- by priority class: interactive calls always go before bulk calls
+- within a class, by weighted fair queuing between tenants, so one tenant's
+  backlog does not hold up another's; a tenant with weight 2 gets twice the
+  share of one with weight 1 while both are waiting
+- some slots are reserved for the interactive class: bulk calls never hold
+  more than slots - reserved_interactive at once, so a live request finds a
+  free slot even while an audit saturates the service
+
+Scheduled calls are the ones that use model or transcription capacity:
+invoke_model (Nova), invoke_flow (Bedrock Flows; the slot is held until the
+response stream is consumed, closed or dropped) and start_transcription_job.
+The slot covers the resilience layer's rate limiting and retries too.
+Because bulk work never uses the reserved share, separate bulk processes
+(bulk_analyze.py) also leave that much of the account's quota to the API.
+
+Requests choose their class with X-Priority (interactive, the default, or
+bulk). Their tenant is X-Tenant-Id, else X-Api-Key, else "anonymous".
+bulk_analyze.py runs its work as bulk. Time spent waiting for a slot is
+reported per service and class in scheduler_queue_wait_seconds.
+
+Configuration:
+- SCHEDULER=0 disables scheduling
+- SCHEDULER_LIMITS: inline JSON or file path overriding the per-service limits, e.g.
+  {"bedrock-runtime": {"slots": 16, "reserved_interactive": 4, "queue_timeout": 120}}
+- SCHEDULER_TENANT_WEIGHTS: inline JSON or file path, e.g. {"marketing-team": 2}
+"""
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import cancellation
+import metrics
+import resilience
+
+# Highest priority first
+PRIORITIES = ('interactive', 'bulk')
+
+DEFAULT_LIMITS = {
+    'bedrock-runtime': {'slots': 8, 'reserved_interactive': 2, 'queue_timeout': 300.0},
+    'bedrock-agent-runtime': {'slots': 8, 'reserved_interactive': 2, 'queue_timeout': 300.0},
+    'transcribe': {'slots': 4, 'reserved_interactive': 1, 'queue_timeout': 300.0},
+}
+
+SCHEDULED_OPERATIONS = {
+    'bedrock-runtime': ('invoke_model',),
+    'bedrock-agent-runtime': ('invoke_flow',),
+    'transcribe': ('start_transcription_job',),
+}
+
+# How often a queued call checks for cancellation and its deadline
+POLL_SECONDS = 0.25
+
+# Finish tags of idle tenants are pruned once this many are tracked
+MAX_TRACKED_TENANTS = 1000
+
+QUEUE_WAIT = metrics.histogram('scheduler_queue_wait_seconds', 'Time calls waited for a slot, by service and priority')
+QUEUE_DEPTH = metrics.gauge('scheduler_queue_depth', 'Calls waiting for a slot, by service and priority')
+ACTIVE = metrics.gauge('scheduler_active_calls', 'Calls holding a slot, by service and priority')
+SLOTS = metrics.gauge('scheduler_slots', 'Configured slots per service')
+TIMEOUTS = metrics.counter('scheduler_queue_timeouts_total', 'Calls that gave up waiting for a slot')
+
+_priority = contextvars.ContextVar('scheduler_priority', default=None)
+_tenant = contextvars.ContextVar('scheduler_tenant', default=None)
+
+
+def is_enabled():
+    return os.getenv('SCHEDULER', '1').lower() not in ('0', 'false', 'no')
+
+
+def _load_json_setting(name):
+    raw = os.getenv(name, '').strip()
+    if not raw:
+        return {}
+    if raw.startswith('{'):
+        return json.loads(raw)
+    with open(raw, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def current_priority():
+    return _priority.get() or 'interactive'
+
+
+def current_tenant():
+    return _tenant.get() or 'anonymous'
+
+
+@contextmanager
+def scope(priority=None, tenant=None):
+    """Runs the block (and threads copying its context) as the given class and tenant."""
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'; expected one of {', '.join(PRIORITIES)}")
+    priority_token = _priority.set(priority or _priority.get())
+    tenant_token = _tenant.set(tenant or _tenant.get())
+    try:
+        yield
+    finally:
+        _tenant.reset(tenant_token)
+        _priority.reset(priority_token)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'tag', 'event', 'granted', 'abandoned')
+
+    def __init__(self, priority, tag):
+        self.priority = priority
+        self.tag = tag
+        self.event = threading.Event()
+        self.granted = False
+        self.abandoned = False
+
+
+class ServiceScheduler:
+    """Slots for one AWS service, handed out by priority class, then by weighted fair queuing."""
+    def __init__(self, service, slots, reserved_interactive, queue_timeout, weights=None):
+        self.service = service
+        self.slots = slots
+        self.reserved_interactive = min(reserved_interactive, slots - 1)
+        self.queue_timeout = queue_timeout
+        self.weights = weights or {}
+        self.lock = threading.Lock()
+        self.active = {priority: 0 for priority in PRIORITIES}
+        self.waiting = {priority: 0 for priority in PRIORITIES}
+        self.queues = {priority: [] for priority in PRIORITIES}
+        # Self-clocked fair queuing: each class's virtual time is the tag of its last started call
+        self.virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        self.finish_tags = {priority: {} for priority in PRIORITIES}
+        self.sequence = itertools.count()
+        SLOTS.set(slots, service=service)
+
+    def _update_gauges(self):
+        for priority in PRIORITIES:
+            ACTIVE.set(self.active[priority], service=self.service, priority=priority)
+            QUEUE_DEPTH.set(self.waiting[priority], service=self.service, priority=priority)
+
+    def _can_start(self, priority):
+        if sum(self.active.values()) >= self.slots:
+            return False
+        return priority != 'bulk' or self.active['bulk'] < self.slots - self.reserved_interactive
+
+    def _tag(self, priority, tenant):
+        tags = self.finish_tags[priority]
+        if len(tags) > MAX_TRACKED_TENANTS:
+            # Tenants at or behind the virtual time would start from it anyway
+            for name in [name for name, tag in tags.items() if tag <= self.virtual_time[priority]]:
+                del tags[name]
+        tag = max(self.virtual_time[priority], tags.get(tenant, 0.0)) + 1.0 / float(self.weights.get(tenant, 1.0))
+        tags[tenant] = tag
+        return tag
+
+    def _dispatch(self):
+        """Starts queued calls while slots are free, highest class first."""
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue and queue[0][2].abandoned:
+                heapq.heappop(queue)
+            while queue and self._can_start(priority):
+                tag, _, waiter = heapq.heappop(queue)
+                if waiter.abandoned:
+                    continue
+                waiter.granted = True
+                self.waiting[priority] -= 1
+                self.active[priority] += 1
+                self.virtual_time[priority] = tag
+                waiter.event.set()
+            if queue:
+                # Lower classes never overtake a higher class that is waiting
+                break
+
+    def acquire(self, priority, tenant):
+        """Blocks until the call may start. Raises Cancelled or DeadlineExceeded instead."""
+        started = time.monotonic()
+        with self.lock:
+            waiter = _Waiter(priority, self._tag(priority, tenant))
+            heapq.heappush(self.queues[priority], (waiter.tag, next(self.sequence), waiter))
+            self.waiting[priority] += 1
+            # Starts the call right away when nothing ahead of it is waiting and a slot is free
+            self._dispatch()
+            self._update_gauges()
+        if waiter.granted:
+            QUEUE_WAIT.observe(0.0, service=self.service, priority=priority)
+            return
+
+        give_up_at = started + self.queue_timeout
+        remaining = resilience.remaining_time()
+        if remaining is not None:
+            give_up_at = min(give_up_at, started + remaining)
+        try:
+            while not waiter.event.wait(max(0.0, min(POLL_SECONDS, give_up_at - time.monotonic()))):
+                cancellation.check()
+                if time.monotonic() >= give_up_at:
+                    TIMEOUTS.inc(service=self.service, priority=priority)
+                    raise resilience.DeadlineExceeded(
+                        f"Waited {time.monotonic() - started:.1f}s for a {priority} slot on {self.service}")
+        except BaseException:
+            with self.lock:
+                if waiter.granted:
+                    # Granted while giving up: pass the slot on
+                    self.active[priority] -= 1
+                    self._dispatch()
+                else:
+                    waiter.abandoned = True
+                    self.waiting[priority] -= 1
+                self._update_gauges()
+            raise
+        QUEUE_WAIT.observe(time.monotonic() - started, service=self.service, priority=priority)
+
+    def release(self, priority):
+        with self.lock:
+            self.active[priority] -= 1
+            self._dispatch()
+            self._update_gauges()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(service_name):
+    """Returns the process-wide scheduler for a service, or None for unscheduled services."""
+    if service_name not in SCHEDULED_OPERATIONS:
+        return None
+    with _schedulers_lock:
+        scheduler = _schedulers.get(service_name)
+        if scheduler is None:
+            limit = dict(DEFAULT_LIMITS[service_name])
+            limit.update(_load_json_setting('SCHEDULER_LIMITS').get(service_name, {}))
+            scheduler = ServiceScheduler(
+                service_name,
+                slots=max(1, int(limit['slots'])),
+                reserved_interactive=max(0, int(limit.get('reserved_interactive', 0))),
+                queue_timeout=float(limit.get('queue_timeout', 300.0)),
+                weights=_load_json_setting('SCHEDULER_TENANT_WEIGHTS')
+            )
+            _schedulers[service_name] = scheduler
+        return scheduler
+
+
+def reset_schedulers():
+    """Forgets all scheduler state, e.g. between benchmark scenarios."""
+    with _schedulers_lock:
+        _schedulers.clear()
+
+
+class _ReleasingStream:
+    """
+    A response stream that releases its slot once: when it is exhausted, fails,
+    is closed or is garbage collected. A generator would not do here; one that
+    was never started skips its finally block when it is collected.
+    """
+    def __init__(self, stream, release):
+        self._lock = threading.Lock()
+        self._released = False
+        self._release = release
+        self._stream = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._stream)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            close = getattr(self._stream, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+    def __del__(self):
+        self.close()
+
+
+class ScheduledClient:
+    """Proxy around a client that runs its scheduled operations in a slot."""
+    def __init__(self, client, scheduler):
+        self._client = client
+        self._scheduler = scheduler
+        self._operations = SCHEDULED_OPERATIONS[scheduler.service]
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name not in self._operations:
+            return attribute
+
+        def call(*args, **kwargs):
+            priority, tenant = current_priority(), current_tenant()
+            self._scheduler.acquire(priority, tenant)
+            try:
+                response = attribute(*args, **kwargs)
+            except BaseException:
+                self._scheduler.release(priority)
+                raise
+            if isinstance(response, dict) and 'responseStream' in response:
+                return dict(response, responseStream=_ReleasingStream(
+                    response['responseStream'], lambda: self._scheduler.release(priority)))
+            self._scheduler.release(priority)
+            return response
+
+        call.__name__ = name
+        return call
+
+
+def wrap_client(client, service_name):
+    scheduler = get_scheduler(service_name)
+    return ScheduledClient(client, scheduler) if scheduler is not None else client
+
+
+def install(app, paths):
+    """Sets each POST request's priority class (X-Priority) and tenant (X-Tenant-Id or X-Api-Key)."""
+    # Here rather than at the top: aws_clients imports this module, and the CLI tools have no need for fastapi
+    from fastapi.responses import JSONResponse
+
+    guarded_paths = set(paths)
+
+    @app.middleware("http")
+    async def schedule_request(request, call_next):
+        if request.method != 'POST' or request.url.path not in guarded_paths:
+            return await call_next(request)
+        priority = request.headers.get('x-priority', 'interactive').strip().lower()
+        if priority not in PRIORITIES:
+            return JSONResponse(status_code=400, content={
+                "detail": f"Unknown X-Priority '{priority}'; expected one of {', '.join(PRIORITIES)}"})
+        tenant = request.headers.get('x-tenant-id') or request.headers.get('x-api-key')
+        # call_next runs the route in a task copying this context
+        with scope(priority, tenant):
+            return await call_next(request)
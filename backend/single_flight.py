@@ -0,0 +1,77 @@
+"""
+Single-flight request coalescing
+Concurrent identical analyses (same endpoint, content hash and country) wait on
+one upstream call and share its result. Nothing is cached: once the call
+finishes, the next identical request starts a fresh one.
+"""
+import asyncio
+import hashlib
+
+from starlette.concurrency import run_in_threadpool
+
+import cancellation
+import metrics
+
+# Hash payloads larger than this off the event loop (hashlib releases the GIL)
+HASH_IN_THREAD_BYTES = 1024 * 1024
+
+CALLS = metrics.counter('singleflight_calls_total',
+                        'Analysis calls by endpoint and role (leader ran upstream, follower was coalesced)')
+IN_FLIGHT = metrics.gauge('singleflight_in_flight', 'Distinct upstream analyses currently in flight')
+
+
+def _digest(parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode('utf-8') if isinstance(part, str) else (part or b'')
+        # Length prefix so ('ab', 'c') and ('a', 'bc') hash differently
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+async def content_key(endpoint, country, *parts):
+    """Builds the coalescing key from the endpoint, country and request content."""
+    parts = (endpoint, country or '') + parts
+    if sum(len(part or '') for part in parts) >= HASH_IN_THREAD_BYTES:
+        return await run_in_threadpool(_digest, parts)
+    return _digest(parts)
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key."""
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+        # Cancel token of the request whose context runs each call
+        self.tokens = {}
+
+    async def do(self, key, func):
+        """
+        Runs func (a zero-argument coroutine function) once per key at a time.
+        Returns tuple: (result, shared) where shared is True for coalesced callers.
+        """
+        task = self.calls.get(key)
+        token = self.tokens.get(key)
+        # A call whose client has already gone is being cancelled; start a fresh one
+        if task is not None and not (token is not None and token.reason == 'client_disconnected'):
+            # Others now wait on the call, so its leader disconnecting must not cancel it
+            cancellation.keep_on_disconnect(token)
+            CALLS.inc(endpoint=self.name, role='follower')
+            # shield: a follower going away must not cancel the shared call
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(func())
+        self.calls[key] = task
+        self.tokens[key] = cancellation.current()
+        IN_FLIGHT.inc()
+        CALLS.inc(endpoint=self.name, role='leader')
+
+        def forget(finished):
+            if self.calls.get(key) is finished:
+                del self.calls[key]
+                del self.tokens[key]
+            IN_FLIGHT.dec()
+
+        task.add_done_callback(forget)
+        return await asyncio.shield(task), False
@@ -2,24 +2,32 @@
 Direct MP4 to Text Pipeline - No MediaConvert needed
 Uses Amazon Transcribe's native MP4 support
 """
-import boto3
 import json
 import time
 import os
 import requests
 from datetime import datetime
-from dotenv import load_dotenv
+from aws_clients import get_client, load_environment
+import transcript_parser
+import transcribe_events
+import progress
+import tiers
+import cancellation
+import usage
 
-load_dotenv()
+load_environment()
 
 class MP4ToTextPipeline:
-    def __init__(self):
+    def __init__(self, backend=None, tier=None):
         self.region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
         self.bucket = os.getenv('S3_BUCKET_NAME', 'video-bucket-ken')
         
-        self.s3 = boto3.client('s3')
-        self.transcribe = boto3.client('transcribe')
-        self.bedrock_agent = boto3.client("bedrock-agent-runtime")
+        # backend: 'aws' or 'emulator'; defaults to the AWS_BACKEND setting
+        self.s3 = get_client('s3', backend=backend)
+        self.transcribe = get_client('transcribe', backend=backend)
+        self.bedrock_agent = get_client("bedrock-agent-runtime", backend=backend)
+        # Latency tier (see tiers.py); its flow alias analyses the transcript
+        self.tier = tiers.get(tier)
     
     def process_text_with_bedrock(self, transcript_text, filename="video_file"):
         """
@@ -31,9 +39,8 @@ class MP4ToTextPipeline:
         try:
             logs.append("=== Processing with AWS Bedrock Flow ===")
             
-            # Flow + Alias IDs
+            # Flow ID; the alias comes from the latency tier
             flow_id = "CJB0RNM9XM"
-            flow_alias = "I4LBMMG8G8"
             
             # Build input document
             input_document = {
@@ -45,65 +52,79 @@ class MP4ToTextPipeline:
             logs.append(f"Sending transcript to Bedrock flow...")
             logs.append(f"Content preview: {transcript_text[:100]}...")
             
-            # Invoke the flow
-            response = self.bedrock_agent.invoke_flow(
-                flowIdentifier=flow_id,
-                flowAliasIdentifier=flow_alias,
-                enableTrace=True,
-                inputs=[
-                    {
-                        "content": {
-                            "document": input_document
-                        },
-                        "nodeName": "FlowInputNode",      
-                        "nodeOutputName": "document" 
-                    }
-                ]
-            )
-            
-            # Process the response stream
-            bedrock_results = []
-            flow_outputs = []
-            
-            logs.append("=== Bedrock Flow Response Stream ===")
-            for event in response["responseStream"]:
-                # Each event is a dict with exactly one key
-                for event_type, event_value in event.items():
-                    if event_type == "flowOutputEvent":
-                        logs.append(">>> Flow Output:")
-                        logs.append(json.dumps(event_value, indent=2))
-                        flow_outputs.append(event_value)
-                    elif event_type == "traceEvent":
-                        logs.append(">>> Trace Event:")
-                        # Store trace events for detailed analysis
-                        bedrock_results.append({
-                            "type": "trace",
-                            "data": event_value
-                        })
-                    elif event_type == "flowCompletionEvent":
-                        logs.append(">>> Flow completed")
-                        bedrock_results.append({
-                            "type": "completion",
-                            "data": event_value
-                        })
-                    elif event_type == "exception":
-                        logs.append(">>> Exception:")
-                        logs.append(json.dumps(event_value, indent=2))
-                        return {
-                            "success": False,
-                            "error": f"Bedrock flow exception: {event_value}",
-                            "flow_outputs": flow_outputs,
-                            "bedrock_results": bedrock_results,
-                            "logs": logs
+            def run(tier):
+                # Invoke the flow
+                response = self.bedrock_agent.invoke_flow(
+                    flowIdentifier=flow_id,
+                    flowAliasIdentifier=tier['flow_alias'],
+                    enableTrace=True,
+                    inputs=[
+                        {
+                            "content": {
+                                "document": input_document
+                            },
+                            "nodeName": "FlowInputNode",      
+                            "nodeOutputName": "document" 
                         }
+                    ]
+                )
             
-            return {
-                "success": True,
-                "flow_outputs": flow_outputs,
-                "bedrock_results": bedrock_results,
-                "input_document": input_document,
-                "logs": logs
-            }
+                # Process the response stream
+                bedrock_results = []
+                flow_outputs = []
+                node_transitions = 0
+            
+                logs.append("=== Bedrock Flow Response Stream ===")
+                for event in response["responseStream"]:
+                    cancellation.check()
+                    # Each event is a dict with exactly one key
+                    for event_type, event_value in event.items():
+                        progress.emit("flow_event", name=event_type, event=event_value)
+                        if event_type == "traceEvent" and "nodeInputTrace" in event_value.get("trace", {}):
+                            node_transitions += 1
+                        if event_type == "flowOutputEvent":
+                            logs.append(">>> Flow Output:")
+                            logs.append(json.dumps(event_value, indent=2))
+                            flow_outputs.append(event_value)
+                        elif event_type == "traceEvent":
+                            logs.append(">>> Trace Event:")
+                            # Store trace events for detailed analysis
+                            bedrock_results.append({
+                                "type": "trace",
+                                "data": event_value
+                            })
+                        elif event_type == "flowCompletionEvent":
+                            logs.append(">>> Flow completed")
+                            bedrock_results.append({
+                                "type": "completion",
+                                "data": event_value
+                            })
+                        elif event_type == "exception":
+                            logs.append(">>> Exception:")
+                            logs.append(json.dumps(event_value, indent=2))
+                            usage.record_flow(node_transitions)
+                            return {
+                                "success": False,
+                                "error": f"Bedrock flow exception: {event_value}",
+                                "flow_outputs": flow_outputs,
+                                "bedrock_results": bedrock_results,
+                                "logs": logs
+                            }
+            
+                usage.record_flow(node_transitions)
+                return {
+                    "success": True,
+                    "flow_outputs": flow_outputs,
+                    "bedrock_results": bedrock_results,
+                    "input_document": input_document,
+                    "logs": logs
+                }
+
+            with cancellation.stage('flow'):
+                result, tier = tiers.call('flow', self.tier, 'flow_alias', run)
+            if tier is not self.tier:
+                logs.append(f"Flow alias throttled; ran on the {tier['name']} tier's alias")
+            return result
             
         except Exception as e:
             logs.append(f"Error processing with Bedrock: {str(e)}")
@@ -120,7 +141,22 @@ class MP4ToTextPipeline:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         s3_key = f"videos/{timestamp}_{os.path.basename(video_file)}"
         
-        self.s3.upload_file(video_file, self.bucket, s3_key)
+        size = os.path.getsize(video_file)
+        with cancellation.stage('upload'):
+            try:
+                # The callback raises once the request is cancelled, which aborts a multipart upload
+                self.s3.upload_file(video_file, self.bucket, s3_key,
+                                    Callback=cancellation.checked_callback(progress.UploadProgress(size)))
+            except Exception:
+                token = cancellation.current()
+                if token is not None and token.cancelled():
+                    # A single-part upload may have landed before the transfer noticed
+                    cancellation.cleanup('delete_partial_upload', self.s3.delete_object,
+                                         Bucket=self.bucket, Key=s3_key)
+                    token.check()
+                raise
+        usage.record_s3('put', size)
+        progress.emit("upload_complete", video_key=s3_key)
         return s3_key, timestamp
     
     def start_transcription(self, video_s3_key, language_code=None):
@@ -154,22 +190,64 @@ class MP4ToTextPipeline:
                 'ms-MY', 'th-TH', 'vi-VN', 'id-ID', 'tl-PH'
             ]
         
+        cancellation.check()
         self.transcribe.start_transcription_job(**job_params)
+        progress.emit("transcription_started", job_name=job_name)
         return job_name
     
-    def wait_for_transcription(self, job_name):
-        """Wait for transcription to complete"""
+    def wait_for_transcription(self, job_name, on_poll=None):
+        """
+        Wait for transcription to complete
+        With a completion-event consumer running (transcribe_events), the wait
+        ends as soon as the job's state-change event arrives; polling remains
+        as a slower fallback.
+        on_poll: optional callable invoked after every status check (e.g. to renew a job lease)
+        If the request is cancelled while waiting, the Transcribe job is deleted.
+        """
+        events = transcribe_events.get_events()
+        interval = transcribe_events.poll_interval()
+        waiting_since = time.time()
+        if events:
+            events.register(job_name)
+        try:
+            with cancellation.stage('transcription'):
+                return self._wait_for_transcription(job_name, on_poll, events, interval, waiting_since)
+        except cancellation.Cancelled:
+            # Stop the job rather than leave it running for a result nobody will read
+            cancellation.cleanup('delete_transcription_job', self.transcribe.delete_transcription_job,
+                                 TranscriptionJobName=job_name)
+            raise
+        finally:
+            if events:
+                events.unregister(job_name)
+
+    def _wait_for_transcription(self, job_name, on_poll, events, interval, waiting_since):
+        source = 'poll'
+        last_status = None
         while True:
             response = self.transcribe.get_transcription_job(TranscriptionJobName=job_name)
+            transcribe_events.STATUS_POLLS.inc()
             job = response['TranscriptionJob']
             status = job['TranscriptionJobStatus']
+            if status != last_status:
+                progress.emit("transcription_status", job_name=job_name, status=status)
+                last_status = status
             
-            if status == 'COMPLETED':
-                return job
-            elif status == 'FAILED':
-                return None
+            if status in ('COMPLETED', 'FAILED'):
+                transcribe_events.record_completion(
+                    job, waiting_since, source, float(os.getenv('TRANSCRIBE_POLL_SECONDS', '10'))
+                )
+                return job if status == 'COMPLETED' else None
             else:
-                time.sleep(10)
+                if on_poll:
+                    on_poll()
+                if events and source != 'event':
+                    # Event arrived: confirm (and fetch the job) right away
+                    source = 'event' if events.wait(job_name, interval) else 'poll'
+                    cancellation.check()
+                else:
+                    # Also after an event: GetTranscriptionJob can lag it, and the waiter stays set
+                    cancellation.sleep(interval)
     
     def save_transcript_text(self, transcription_job, video_timestamp):
         """Get transcript JSON from S3 and extract text using video timestamp"""
@@ -215,18 +293,22 @@ class MP4ToTextPipeline:
                 else:
                     return None, ""
             
-            transcript_data = json.loads(response['Body'].read().decode('utf-8'))
-            
-            text = transcript_data['results']['transcripts'][0]['transcript']
+            # Streamed: only the text, language and duration are kept, not the per-word items
+            transcript = transcript_parser.parse(response['Body'])
+            usage.record_s3('get', transcript['bytes'])
+            if transcript['transcript'] is None:
+                return None, ""
+            text = transcript['transcript']
+            # Transcribe bills the media's duration; the last word's end time is the closest the transcript gives
+            usage.record_transcription(transcript['duration'])
             
             # Check for language identification results
             language_info = ""
-            if 'results' in transcript_data and 'language_identification' in transcript_data['results']:
-                lang_results = transcript_data['results']['language_identification']
-                if lang_results:
-                    detected_lang = lang_results[0]['code']  # Note: it's 'code' not 'language_code'
-                    confidence = lang_results[0]['score']
-                    language_info = f"🌍 Detected Language: {detected_lang} (confidence: {float(confidence):.2f})"
+            lang_results = transcript['language_identification']
+            if lang_results:
+                detected_lang = lang_results[0]['code']  # Note: it's 'code' not 'language_code'
+                confidence = lang_results[0]['score']
+                language_info = f"🌍 Detected Language: {detected_lang} (confidence: {float(confidence):.2f})"
             
             if not text.strip():
                 text = "[No speech detected in the audio]"
@@ -281,33 +363,51 @@ class MP4ToTextPipeline:
         except Exception as e:
             return None
 
+    def submit_video(self, video_file, language_code=None):
+        """
+        Submit half of the pipeline: upload the video and start transcription.
+        Everything needed to collect the result later is in the return value,
+        so collection can happen in another request or after a restart.
+        Returns tuple: (video_s3_key, video_timestamp, job_name)
+        """
+        # Step 1: Upload to S3
+        video_s3_key, video_timestamp = self.upload_video(video_file)
+        
+        # Step 2: MP4 directly to transcript
+        job_name = self.start_transcription(video_s3_key, language_code)
+        
+        return video_s3_key, video_timestamp, job_name
+
+    def collect_transcription(self, job_name, video_timestamp, on_poll=None):
+        """
+        Collect half of the pipeline: wait for the Transcribe job and read the transcript.
+        Returns tuple: (text, language_info, success)
+        """
+        # Step 3: Return JSON file (wait for completion)
+        transcription_result = self.wait_for_transcription(job_name, on_poll)
+        
+        if not transcription_result:
+            return None, None, False
+        
+        # Steps 4 & 5: Get JSON and extract text
+        result = self.save_transcript_text(transcription_result, video_timestamp)
+        
+        if not result or not result[0]:
+            return None, None, False
+        
+        text, language_info = result
+        progress.emit("transcript_ready", text=text, language_info=language_info)
+        
+        return text, language_info, True
+
     def process_video_detailed(self, video_file, language_code=None):
         """
         Enhanced version that returns detailed results for API usage
         Returns tuple: (text, language_info, success)
         """
         try:
-            # Step 1: Upload to S3
-            video_s3_key, video_timestamp = self.upload_video(video_file)
-            
-            # Step 2: MP4 directly to transcript
-            job_name = self.start_transcription(video_s3_key, language_code)
-            
-            # Step 3: Return JSON file (wait for completion)
-            transcription_result = self.wait_for_transcription(job_name)
-            
-            if not transcription_result:
-                return None, None, False
-            
-            # Steps 4 & 5: Get JSON and extract text
-            result = self.save_transcript_text(transcription_result, video_timestamp)
-            
-            if not result or not result[0]:
-                return None, None, False
-            
-            text, language_info = result
-            
-            return text, language_info, True
+            _, video_timestamp, job_name = self.submit_video(video_file, language_code)
+            return self.collect_transcription(job_name, video_timestamp)
             
         except Exception as e:
             # Return error info instead of printing
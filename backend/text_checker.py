@@ -2,25 +2,33 @@
 Text File to Cultural Analysis Pipeline
 Simple flow: Text File -> Bedrock Flow -> Analysis JSON
 """
-import boto3
 import json
 import os
-from dotenv import load_dotenv
+import cancellation
+import tiers
+import usage
+from aws_clients import get_client, load_environment
 
-load_dotenv()
+load_environment()
 
 class BedrockFlowInvoker:
     """
     Invokes a Bedrock Flow for cultural analysis.
     """
-    def __init__(self, flow_id="CJB0RNM9XM", flow_alias="I4LBMMG8G8"):
+    def __init__(self, flow_id="CJB0RNM9XM", flow_alias=None, backend=None, tier=None):
         """
         Initializes the invoker with a Bedrock Agent Runtime client.
+        backend: 'aws' or 'emulator'; defaults to the AWS_BACKEND setting.
+        tier: latency tier name (see tiers.py); defaults to LATENCY_TIER.
+        flow_alias: overrides the tier's flow alias.
         """
         self.region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
-        self.client = boto3.client("bedrock-agent-runtime", region_name=self.region)
+        self.client = get_client("bedrock-agent-runtime", region_name=self.region, backend=backend)
         self.flow_id = flow_id
-        self.flow_alias = flow_alias
+        self.tier = tiers.get(tier)
+        if flow_alias:
+            self.tier = dict(self.tier, flow_alias=flow_alias)
+        self.flow_alias = self.tier['flow_alias']
 
     def invoke_cultural_analysis_flow(self, text_content, country="Malaysia", file_type="text"):
         """
@@ -40,35 +48,51 @@ class BedrockFlowInvoker:
 
             log_messages.append(f"Invoking Bedrock flow with input: {input_document}")
 
-            # Invoke the flow
-            response = self.client.invoke_flow(
-                flowIdentifier=self.flow_id,
-                flowAliasIdentifier=self.flow_alias,
-                enableTrace=True,
-                inputs=[
-                    {
-                        "content": {
-                            "document": input_document
-                        },
-                        "nodeName": "FlowInputNode",
-                        "nodeOutputName": "document"
-                    }
-                ]
-            )
-
-            final_output = None
-            for event in response["responseStream"]:
-                # Each event is a dict with exactly one key
-                for event_type, event_value in event.items():
-                    if event_type == "flowOutputEvent":
-                        # The output is nested under 'content' and then 'document'
-                        output_value = event_value.get('content', {}).get('document')
-                        if output_value:
-                            final_output = output_value
-                            log_messages.append(f"Flow output received: {type(output_value)}")
-                    elif event_type == "exception":
-                        log_messages.append(f"Exception received from Bedrock Flow: {json.dumps(event_value)}")
-                        return None, log_messages, False
+            def run(tier):
+                # Invoke the flow
+                response = self.client.invoke_flow(
+                    flowIdentifier=self.flow_id,
+                    flowAliasIdentifier=tier['flow_alias'],
+                    enableTrace=True,
+                    inputs=[
+                        {
+                            "content": {
+                                "document": input_document
+                            },
+                            "nodeName": "FlowInputNode",
+                            "nodeOutputName": "document"
+                        }
+                    ]
+                )
+
+                final_output = None
+                node_transitions = 0
+                for event in response["responseStream"]:
+                    cancellation.check()
+                    # Each event is a dict with exactly one key
+                    for event_type, event_value in event.items():
+                        if event_type == "traceEvent" and "nodeInputTrace" in event_value.get("trace", {}):
+                            node_transitions += 1
+                        elif event_type == "flowOutputEvent":
+                            # The output is nested under 'content' and then 'document'
+                            output_value = event_value.get('content', {}).get('document')
+                            if output_value:
+                                final_output = output_value
+                                log_messages.append(f"Flow output received: {type(output_value)}")
+                        elif event_type == "exception":
+                            log_messages.append(f"Exception received from Bedrock Flow: {json.dumps(event_value)}")
+                            usage.record_flow(node_transitions)
+                            return None, False
+
+                usage.record_flow(node_transitions)
+                return final_output, True
+
+            with cancellation.stage('flow'):
+                (final_output, completed), tier = tiers.call('flow', self.tier, 'flow_alias', run)
+            if tier is not self.tier:
+                log_messages.append(f"Flow alias throttled; ran on the {tier['name']} tier's alias")
+            if not completed:
+                return None, log_messages, False
 
             if final_output:
                 log_messages.append("Bedrock flow completed successfully")
@@ -82,7 +106,7 @@ class BedrockFlowInvoker:
             return None, log_messages, False
 
 
-def process_text_content(text_content: str, country: str = "Malaysia") -> dict:
+def process_text_content(text_content: str, country: str = "Malaysia", tier: str = None) -> dict:
     """
     Processes text content and runs it through a cultural analysis
     Bedrock Flow. Designed for server use.
@@ -90,6 +114,7 @@ def process_text_content(text_content: str, country: str = "Malaysia") -> dict:
     Args:
         text_content (str): The text content to analyze.
         country (str): The country context for analysis.
+        tier (str): Latency tier (fast, balanced, thorough); defaults to LATENCY_TIER.
 
     Returns:
         dict: A dictionary containing the analysis result, logs, and status.
@@ -104,7 +129,8 @@ def process_text_content(text_content: str, country: str = "Malaysia") -> dict:
     result["logs"].append(f"Starting cultural analysis for {len(text_content)} characters of text")
     
     try:
-        flow_invoker = BedrockFlowInvoker()
+        cancellation.plan(['flow'])
+        flow_invoker = BedrockFlowInvoker(tier=tier)
         flow_result, log_messages, success = flow_invoker.invoke_cultural_analysis_flow(
             text_content, country=country, file_type="text"
         )
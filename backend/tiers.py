@@ -0,0 +1,135 @@
+"""
+Latency tiers
+A request picks how much depth it is willing to wait for. Each tier maps to
+the Nova model and token budget for image and keyframe descriptions, how
+compact the description prompts are, and the Bedrock Flow alias the
+analysis runs on:
+- fast: Nova Lite, short descriptions; for quick pre-publish checks
+- balanced: Nova Pro with a mid-sized budget and a focused prompt
+- thorough: Nova Pro, 10240 tokens and the open-ended prompts (the default,
+  and what every request got before tiers existed)
+
+When a tier's model or flow alias is throttled (after the resilience layer's
+retries), the call is repeated on the next faster tier, so a busy Pro quota
+degrades a request's depth instead of failing it.
+
+The tier is chosen per request (the "tier" field, or ?tier= on
+/image-analysis/binary) and passed to the pipelines and flow invokers the
+request creates. Speech-to-text jobs resumed after a restart run on the
+default tier.
+
+Configuration:
+- LATENCY_TIER: tier for requests that do not choose one (default thorough)
+- LATENCY_TIERS: inline JSON or file path overriding tier settings, e.g.
+  {"fast": {"flow_alias": "ABCDEFGHIJ"}, "balanced": {"max_tokens": 4096}}
+"""
+import json
+import os
+import time
+
+import metrics
+import resilience
+
+# Fastest first; a throttled tier falls back along this order
+TIER_ORDER = ('fast', 'balanced', 'thorough')
+
+# None for a prompt means the caller's own (full) prompt
+DEFAULT_TIERS = {
+    'fast': {
+        'model_id': 'us.amazon.nova-lite-v1:0',
+        'max_tokens': 512,
+        'system_prompt': "You are an image analyst. Describe images briefly and factually.",
+        'prompt': "In two or three sentences, describe the people, symbols, visible text and setting in this image.",
+        'frame_prompt': "In one or two sentences, describe the people, symbols and visible text in this video frame.",
+        'flow_alias': 'I4LBMMG8G8',
+    },
+    'balanced': {
+        'model_id': 'us.amazon.nova-pro-v1:0',
+        'max_tokens': 2048,
+        'system_prompt': None,
+        'prompt': "Describe this image, focusing on people, gestures, clothing, symbols, visible text and setting.",
+        'frame_prompt': None,
+        'flow_alias': 'I4LBMMG8G8',
+    },
+    'thorough': {
+        'model_id': 'us.amazon.nova-pro-v1:0',
+        'max_tokens': 10240,
+        'system_prompt': None,
+        'prompt': None,
+        'frame_prompt': None,
+        'flow_alias': 'I4LBMMG8G8',
+    },
+}
+
+LATENCY = metrics.histogram('tier_call_seconds', 'Upstream call latency by tier, stage and outcome')
+FALLBACKS = metrics.counter('tier_fallbacks_total', 'Calls repeated on a faster tier after throttling')
+
+_tiers = None
+
+
+def tiers():
+    """Returns DEFAULT_TIERS merged with LATENCY_TIERS, loaded once; each tier carries its name."""
+    global _tiers
+    if _tiers is None:
+        merged = {name: dict(settings, name=name) for name, settings in DEFAULT_TIERS.items()}
+        raw = os.getenv('LATENCY_TIERS', '').strip()
+        if raw:
+            if raw.startswith('{'):
+                overrides = json.loads(raw)
+            else:
+                with open(raw, 'r', encoding='utf-8') as f:
+                    overrides = json.load(f)
+            for name, settings in overrides.items():
+                if name not in merged:
+                    raise ValueError(f"Unknown latency tier in LATENCY_TIERS: {name}")
+                merged[name].update(settings)
+        _tiers = merged
+    return _tiers
+
+
+def get(name=None):
+    """
+    Returns the settings of the named tier, or of LATENCY_TIER when name is None.
+    Raises ValueError for an unknown name.
+    """
+    name = name or os.getenv('LATENCY_TIER', 'thorough')
+    try:
+        return tiers()[name]
+    except KeyError:
+        raise ValueError(f"Unknown tier '{name}'; expected one of {', '.join(TIER_ORDER)}") from None
+
+
+def fallback_chain(tier, setting):
+    """
+    The tier followed by each faster tier that differs in `setting`; falling
+    back to a tier with the same model or alias would hit the same throttle.
+    """
+    chain = [tier]
+    for name in reversed(TIER_ORDER[:TIER_ORDER.index(tier['name'])]):
+        candidate = tiers()[name]
+        if all(candidate[setting] != tried[setting] for tried in chain):
+            chain.append(candidate)
+    return chain
+
+
+def call(stage, tier, setting, func):
+    """
+    Calls func(tier), falling back to faster tiers while it is throttled.
+    setting: the tier setting func depends on ('model_id' or 'flow_alias')
+    Returns tuple: (result, tier that answered)
+    """
+    chain = fallback_chain(tier, setting)
+    for index, candidate in enumerate(chain):
+        started = time.monotonic()
+        try:
+            result = func(candidate)
+        except Exception as e:
+            throttled = resilience.classify(e) == 'throttle'
+            LATENCY.observe(time.monotonic() - started, tier=candidate['name'], stage=stage,
+                            outcome='throttled' if throttled else 'error')
+            if not throttled or index == len(chain) - 1:
+                raise
+            FALLBACKS.inc(stage=stage, from_tier=candidate['name'], to_tier=chain[index + 1]['name'])
+            continue
+        LATENCY.observe(time.monotonic() - started, tier=candidate['name'], stage=stage, outcome='success')
+        return result, candidate
@@ -0,0 +1,203 @@
+"""
+Event-driven Transcribe completion
+Instead of finding out that a job finished on the next get_transcription_job
+poll, a background consumer reads EventBridge "Transcribe Job State Change"
+events from an SQS queue and wakes the waiting request immediately. Polling
+stays as the fallback (at a much lower rate) in case an event is lost.
+
+AWS setup: an EventBridge rule on source "aws.transcribe", detail-type
+"Transcribe Job State Change", targeting the SQS queue (directly or via SNS).
+
+Configuration:
+- TRANSCRIBE_EVENTS_QUEUE_URL: queue URL or name; unset = polling only
+- TRANSCRIBE_POLL_SECONDS: status poll interval without events (default 10)
+- TRANSCRIBE_EVENTS_FALLBACK_POLL_SECONDS: poll interval while events are enabled (default 60)
+- TRANSCRIBE_EVENTS_MAX_RECEIVES: an event for a job no request in this worker
+  waits on is released for other workers this many times, then deleted (default 5)
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+from aws_clients import get_client
+
+EVENT_DETAIL_TYPE = 'Transcribe Job State Change'
+FINAL_STATES = ('COMPLETED', 'FAILED')
+
+EVENTS = metrics.counter('transcribe_events_total', 'Transcribe state-change events read from the queue')
+STATUS_POLLS = metrics.counter('transcribe_status_polls_total', 'get_transcription_job calls made while waiting')
+DETECTED = metrics.counter('transcribe_completions_detected_total', 'Finished Transcribe jobs by how the finish was noticed')
+DETECTION_LAG = metrics.histogram('transcribe_completion_lag_seconds',
+                                  'Time from Transcribe finishing a job to the waiting request noticing')
+LATENCY_SAVED = metrics.histogram('transcribe_event_latency_saved_seconds',
+                                  'Per job: how much later polling alone would have noticed the finish')
+
+
+def poll_interval():
+    """Seconds between get_transcription_job calls for the running configuration."""
+    if get_events() is not None:
+        return float(os.getenv('TRANSCRIBE_EVENTS_FALLBACK_POLL_SECONDS', '60'))
+    return float(os.getenv('TRANSCRIBE_POLL_SECONDS', '10'))
+
+
+def parse_event(body):
+    """
+    Extracts the job state change from an SQS message body (raw EventBridge
+    event or an SNS notification wrapping one).
+    Returns tuple: (job_name, status), or (None, None) for unrelated messages
+    """
+    try:
+        event = json.loads(body)
+        if event.get('Type') == 'Notification' and 'Message' in event:
+            event = json.loads(event['Message'])
+        if event.get('detail-type') != EVENT_DETAIL_TYPE:
+            return None, None
+        detail = event['detail']
+        return detail['TranscriptionJobName'], detail['TranscriptionJobStatus']
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None, None
+
+
+class CompletionEvents:
+    """Consumes state-change events and wakes threads waiting on those jobs."""
+    def __init__(self, queue_url, max_receives=5, requeue_seconds=2):
+        self.queue_url = queue_url
+        self.max_receives = max_receives
+        self.requeue_seconds = requeue_seconds
+        self._waiters = {}
+        # Final states already seen, for a waiter that registers after its event arrived
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, job_name):
+        with self._lock:
+            waiter = self._waiters.setdefault(job_name, threading.Event())
+            if job_name in self._recent:
+                waiter.set()
+        return waiter
+
+    def unregister(self, job_name):
+        with self._lock:
+            self._waiters.pop(job_name, None)
+            self._recent.pop(job_name, None)
+
+    def wait(self, job_name, timeout):
+        """
+        Blocks until an event for the job arrives or the timeout passes.
+        Returns: the job's final status from the event, or None on timeout
+        """
+        if not self.register(job_name).wait(timeout):
+            return None
+        with self._lock:
+            return self._recent.get(job_name)
+
+    def resolve(self, job_name, status):
+        """Records a final state. Returns True if a request in this worker is waiting on the job."""
+        with self._lock:
+            self._recent[job_name] = status
+            while len(self._recent) > 1024:
+                self._recent.popitem(last=False)
+            waiter = self._waiters.get(job_name)
+        if waiter is None:
+            return False
+        waiter.set()
+        return True
+
+    def handle(self, sqs, message):
+        job_name, status = parse_event(message.get('Body', ''))
+        receipt = message['ReceiptHandle']
+        if job_name is None or status not in FINAL_STATES:
+            EVENTS.inc(outcome='ignored')
+            sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+            return
+
+        if self.resolve(job_name, status):
+            EVENTS.inc(outcome='resolved')
+            sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+            return
+
+        # Probably waited on by another worker sharing the queue: give it a chance
+        receives = int(message.get('Attributes', {}).get('ApproximateReceiveCount', '1'))
+        if receives < self.max_receives:
+            EVENTS.inc(outcome='released')
+            sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=receipt,
+                                          VisibilityTimeout=self.requeue_seconds)
+        else:
+            EVENTS.inc(outcome='dropped')
+            sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    def _consume(self):
+        sqs = get_client('sqs')
+        if '://' not in self.queue_url:
+            self.queue_url = sqs.get_queue_url(QueueName=self.queue_url)['QueueUrl']
+
+        while not self._stop.is_set():
+            try:
+                response = sqs.receive_message(
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=10,
+                    WaitTimeSeconds=20,
+                    AttributeNames=['ApproximateReceiveCount']
+                )
+                for message in response.get('Messages', []):
+                    self.handle(sqs, message)
+            except Exception:
+                # Polling keeps jobs moving while the queue is unavailable
+                EVENTS.inc(outcome='receive_error')
+                self._stop.wait(5)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._consume, name='transcribe-events', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_events = None
+
+
+def get_events():
+    """Returns the running consumer, or None when events are not enabled."""
+    return _events
+
+
+def start():
+    """Starts the queue consumer if TRANSCRIBE_EVENTS_QUEUE_URL is set. Returns it, or None."""
+    global _events
+    queue_url = os.getenv('TRANSCRIBE_EVENTS_QUEUE_URL', '').strip()
+    if not queue_url or _events is not None:
+        return _events
+    _events = CompletionEvents(queue_url, max_receives=int(os.getenv('TRANSCRIBE_EVENTS_MAX_RECEIVES', '5')))
+    _events.start()
+    return _events
+
+
+def stop():
+    global _events
+    if _events is not None:
+        _events.stop()
+        _events = None
+
+
+def record_completion(job, waiting_since, source, interval):
+    """
+    Records how quickly a finished job was noticed, and for event-driven
+    detection how much sooner that was than the next poll would have been.
+    """
+    now = time.time()
+    completed_at = job.get('CompletionTime')
+    completed_at = completed_at.timestamp() if isinstance(completed_at, datetime) else now
+    DETECTED.inc(source=source)
+    DETECTION_LAG.observe(max(0.0, now - completed_at), source=source)
+    if source == 'event':
+        # Polling alone checks at waiting_since + k * interval (plain poll interval)
+        polls = max(1, math.ceil((completed_at - waiting_since) / interval))
+        LATENCY_SAVED.observe(max(0.0, waiting_since + polls * interval - now))
@@ -0,0 +1,270 @@
+"""
+Streaming transcript parser
+A Transcribe output document carries the full transcript once and then one
+entry per word in results.items. For hour-long media that makes the JSON tens
+of megabytes, and loading it whole builds a dict per word. The pipelines only
+need the transcript text, the language identification and the media duration
+(the last word's end time, for usage), so parse() reads the S3 body in chunks
+and keeps only those. Each item is decoded, read and dropped, so memory stays
+at about one chunk plus the transcript text however long the media is.
+
+With word_timings=True it also returns compact per-word arrays (the word
+list and two array('d') of start and end seconds) instead of the item dicts.
+
+Uses ijson when it is installed and a built-in scanner over json's C decoder
+otherwise. Set TRANSCRIPT_PARSER=builtin to force the built-in one.
+"""
+import codecs
+import json
+import os
+import re
+from array import array
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+BACKEND = 'ijson' if ijson is not None and os.getenv('TRANSCRIPT_PARSER', 'ijson').lower() == 'ijson' else 'builtin'
+
+CHUNK_SIZE = 256 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class WordTimings:
+    """Per-word timings as parallel arrays; punctuation items carry no times and are left out."""
+    __slots__ = ('words', 'starts', 'ends')
+
+    def __init__(self):
+        self.words = []
+        self.starts = array('d')
+        self.ends = array('d')
+
+    def append(self, word, start, end):
+        self.words.append(word)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self):
+        return len(self.words)
+
+    def to_dict(self):
+        """Returns the timings as a JSON-ready dict of lists."""
+        return {"words": self.words, "starts": self.starts.tolist(), "ends": self.ends.tolist()}
+
+
+class _Reader:
+    """Decodes JSON values one at a time from a stream of byte chunks."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes = 0
+
+    def _fill(self):
+        """Appends the next chunk to the buffer; returns False at the end of the stream."""
+        if self.eof:
+            return False
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.buffer += self.utf8.decode(b'', final=True)
+            return False
+        self.bytes += len(chunk)
+        self.buffer += self.utf8.decode(chunk)
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character, or '' at the end."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill() and self.pos >= len(self.buffer):
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed transcript JSON: expected {char!r}, found {found or 'end of data'!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete value, reading more chunks until it is whole."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number ending the buffer may continue in the next chunk
+            if end >= len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Yields the keys of the object at the reader; the caller reads each value."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def elements(self):
+        """Yields once per element of the array at the reader; the caller reads each element."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+    def skip(self):
+        """Reads past the next value, decoding large containers piece by piece."""
+        char = self.peek()
+        if char == '{':
+            for _ in self.members():
+                self.skip()
+        elif char == '[':
+            for _ in self.elements():
+                self.value()
+        else:
+            self.value()
+
+
+def _iter_chunks(body, chunk_size):
+    if hasattr(body, 'iter_chunks'):
+        return body.iter_chunks(chunk_size)
+    return iter(lambda: body.read(chunk_size), b'')
+
+
+def _new_result(word_timings):
+    return {
+        "transcript": None,
+        "language_code": None,
+        "language_identification": None,
+        "duration": 0.0,
+        "bytes": 0,
+        "words": WordTimings() if word_timings else None,
+    }
+
+
+def _add_item(result, item):
+    end = item.get('end_time')
+    if end is None:
+        return
+    end = float(end)
+    if end > result["duration"]:
+        result["duration"] = end
+    words = result["words"]
+    if words is not None and item.get('type', 'pronunciation') == 'pronunciation':
+        alternatives = item.get('alternatives') or [{}]
+        words.append(alternatives[0].get('content', ''), float(item.get('start_time', end)), end)
+
+
+def _parse_builtin(chunks, word_timings):
+    result = _new_result(word_timings)
+    reader = _Reader(chunks)
+    for key in reader.members():
+        if key != 'results':
+            reader.skip()
+            continue
+        for field in reader.members():
+            if field == 'transcripts':
+                for _ in reader.elements():
+                    entry = reader.value()
+                    if result["transcript"] is None:
+                        result["transcript"] = entry.get('transcript', '')
+            elif field == 'items':
+                for _ in reader.elements():
+                    _add_item(result, reader.value())
+            elif field == 'language_identification':
+                result["language_identification"] = reader.value()
+            elif field == 'language_code':
+                result["language_code"] = reader.value()
+            else:
+                reader.skip()
+    result["bytes"] = reader.bytes
+    return result
+
+
+class _CountingFile:
+    """File-like view of the chunks for ijson, counting the bytes read."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.bytes = 0
+
+    def read(self, size=-1):
+        chunk = next(self.chunks, b'')
+        self.bytes += len(chunk)
+        return chunk
+
+
+def _parse_ijson(chunks, word_timings):
+    result = _new_result(word_timings)
+    source = _CountingFile(chunks)
+    item = None
+    language = None
+    for prefix, event, value in ijson.parse(source, use_float=True):
+        if prefix == 'results.transcripts.item.transcript':
+            if result["transcript"] is None:
+                result["transcript"] = value
+        elif prefix == 'results.items.item':
+            if event == 'start_map':
+                item = {}
+            elif event == 'end_map':
+                _add_item(result, item)
+                item = None
+        elif item is not None and prefix in ('results.items.item.start_time', 'results.items.item.end_time',
+                                             'results.items.item.type'):
+            item[prefix.rsplit('.', 1)[1]] = value
+        elif item is not None and prefix == 'results.items.item.alternatives.item.content':
+            item.setdefault('alternatives', [{'content': value}])
+        elif prefix == 'results.language_code':
+            result["language_code"] = value
+        elif prefix.startswith('results.language_identification'):
+            if language is None:
+                language = ijson.ObjectBuilder()
+            language.event(event, value)
+            if prefix == 'results.language_identification' and event in ('end_array', 'null'):
+                result["language_identification"] = language.value
+                language = None
+    result["bytes"] = source.bytes
+    return result
+
+
+def parse(body, word_timings=False, chunk_size=CHUNK_SIZE):
+    """
+    Extracts what the pipelines use from a Transcribe output document.
+    body: a botocore StreamingBody (or any object with read()), or an iterable of byte chunks
+    Returns: dict with transcript (None when the document has none), language_code,
+    language_identification, duration (last end_time in seconds), bytes read and
+    words (a WordTimings when word_timings is set, else None)
+    """
+    chunks = _iter_chunks(body, chunk_size) if hasattr(body, 'read') or hasattr(body, 'iter_chunks') else body
+    if BACKEND == 'ijson':
+        return _parse_ijson(chunks, word_timings)
+    return _parse_builtin(chunks, word_timings)
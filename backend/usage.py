@@ -0,0 +1,202 @@
+"""
+Usage and cost accounting
+The pipelines report what each call consumed: Nova tokens (from the usage
+block of every response), Bedrock Flow node transitions, Transcribe audio
+seconds and S3 request bytes. Each record is added to the request's
+UsageRecorder (set per request by install(), and inherited by the threads
+the request's work runs on) and to the usage_* metrics, labelled by endpoint
+and stage, so cost can be compared across routes, models and caching changes.
+
+Costs are estimates from PRICES (on-demand list prices in USD, us-east-1);
+override them with USAGE_PRICES (inline JSON or a file path), e.g.
+{"models": {"amazon.nova-lite-v1:0": [0.00006, 0.00024]}, "transcribe_per_minute": 0.024}
+
+Responses of the analysis routes carry a "usage" summary when the request
+sets include_usage (or ?include_usage=true), and speech-to-text jobs keep
+theirs in the stored result.
+"""
+import contextvars
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+PRICES = {
+    # USD per 1,000 tokens: [input, output]
+    "models": {
+        "amazon.nova-pro-v1:0": [0.0008, 0.0032],
+        "amazon.nova-lite-v1:0": [0.00006, 0.00024],
+        "amazon.nova-micro-v1:0": [0.000035, 0.00014],
+    },
+    # Batch inference is billed at a discount to on-demand
+    "batch_discount": 0.5,
+    "transcribe_per_minute": 0.024,
+    # Transcribe bills each job for at least this much audio
+    "transcribe_minimum_seconds": 15,
+    "flow_per_1000_transitions": 0.035,
+    "s3_put_per_1000": 0.005,
+    "s3_get_per_1000": 0.0004,
+}
+
+TOKENS = metrics.counter('usage_tokens_total', 'Model tokens by endpoint, stage, model and direction')
+MODEL_CALLS = metrics.counter('usage_model_calls_total', 'Model invocations by endpoint, stage and model')
+TRANSCRIBE_SECONDS = metrics.counter('usage_transcribe_seconds_total', 'Billed Transcribe audio seconds by endpoint')
+FLOW_TRANSITIONS = metrics.counter('usage_flow_node_transitions_total', 'Bedrock Flow node transitions by endpoint')
+S3_BYTES = metrics.counter('usage_s3_bytes_total', 'S3 object bytes transferred by endpoint and operation')
+COST = metrics.counter('usage_estimated_cost_usd_total', 'Estimated cost in USD by endpoint and stage')
+
+_current = contextvars.ContextVar('usage_recorder', default=None)
+_prices = None
+
+
+def prices():
+    """Returns PRICES merged with USAGE_PRICES, loaded once."""
+    global _prices
+    if _prices is None:
+        merged = json.loads(json.dumps(PRICES))
+        raw = os.getenv('USAGE_PRICES', '').strip()
+        if raw:
+            if raw.startswith('{'):
+                overrides = json.loads(raw)
+            else:
+                with open(raw, 'r', encoding='utf-8') as f:
+                    overrides = json.load(f)
+            merged["models"].update(overrides.pop("models", {}))
+            merged.update(overrides)
+        _prices = merged
+    return _prices
+
+
+def base_model_id(model_id):
+    """'us.amazon.nova-pro-v1:0' (an inference profile) -> 'amazon.nova-pro-v1:0'"""
+    parts = model_id.split('.')
+    if len(parts) > 2 and parts[0] in ('us', 'eu', 'apac', 'global'):
+        return '.'.join(parts[1:])
+    return model_id
+
+
+class UsageRecorder:
+    """Usage of one request or job. Shared by every thread working on it, hence the lock."""
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.lock = threading.Lock()
+        self.models = {}
+        self.transcribe_seconds = 0.0
+        self.flow = {"invocations": 0, "node_transitions": 0, "cost_usd": 0.0}
+        self.s3 = {}
+        self.cost = 0.0
+
+    def summary(self):
+        """Returns the usage as a JSON-ready dict."""
+        with self.lock:
+            return {
+                "models": [dict(entry, stage=stage, model_id=model_id)
+                           for (stage, model_id), entry in self.models.items()],
+                "transcribe_seconds": round(self.transcribe_seconds, 3),
+                "flow": dict(self.flow),
+                "s3": {operation: dict(entry) for operation, entry in self.s3.items()},
+                "estimated_cost_usd": round(self.cost, 6),
+            }
+
+
+def current():
+    """The recorder of the current request or job, or None."""
+    return _current.get()
+
+
+@contextmanager
+def scope(endpoint, recorder=None):
+    """Records usage in this context (and threads copying it) under an endpoint."""
+    recorder = recorder or UsageRecorder(endpoint)
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+
+def _add_cost(stage, cost):
+    recorder = current()
+    COST.inc(cost, endpoint=recorder.endpoint if recorder else 'none', stage=stage)
+    if recorder:
+        with recorder.lock:
+            recorder.cost += cost
+
+
+def record_model(stage, model_id, usage_block, batch=False):
+    """Records one model call from the response's usage block (inputTokens / outputTokens)."""
+    usage_block = usage_block or {}
+    input_tokens = int(usage_block.get('inputTokens', 0))
+    output_tokens = int(usage_block.get('outputTokens', 0))
+    model_id = base_model_id(model_id)
+    input_price, output_price = prices()["models"].get(model_id, (0.0, 0.0))
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1000
+    if batch:
+        cost *= prices()["batch_discount"]
+
+    recorder = current()
+    endpoint = recorder.endpoint if recorder else 'none'
+    MODEL_CALLS.inc(endpoint=endpoint, stage=stage, model=model_id)
+    TOKENS.inc(input_tokens, endpoint=endpoint, stage=stage, model=model_id, direction='input')
+    TOKENS.inc(output_tokens, endpoint=endpoint, stage=stage, model=model_id, direction='output')
+    if recorder:
+        with recorder.lock:
+            entry = recorder.models.setdefault((stage, model_id), {
+                "calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0
+            })
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] = round(entry["cost_usd"] + cost, 6)
+    _add_cost(stage, cost)
+
+
+def record_flow(node_transitions):
+    """Records one flow invocation and its node transitions (counted from the trace events)."""
+    cost = node_transitions * prices()["flow_per_1000_transitions"] / 1000
+    recorder = current()
+    FLOW_TRANSITIONS.inc(node_transitions, endpoint=recorder.endpoint if recorder else 'none')
+    if recorder:
+        with recorder.lock:
+            recorder.flow["invocations"] += 1
+            recorder.flow["node_transitions"] += node_transitions
+            recorder.flow["cost_usd"] = round(recorder.flow["cost_usd"] + cost, 6)
+    _add_cost('flow', cost)
+
+
+def record_transcription(audio_seconds):
+    """Records one Transcribe job's audio duration, applying the per-job minimum."""
+    billed = max(float(audio_seconds), float(prices()["transcribe_minimum_seconds"]))
+    recorder = current()
+    TRANSCRIBE_SECONDS.inc(billed, endpoint=recorder.endpoint if recorder else 'none')
+    if recorder:
+        with recorder.lock:
+            recorder.transcribe_seconds += billed
+    _add_cost('transcribe', billed / 60 * prices()["transcribe_per_minute"])
+
+
+def record_s3(operation, size):
+    """Records one S3 request ('put' or 'get') and the object bytes it moved."""
+    recorder = current()
+    S3_BYTES.inc(size, endpoint=recorder.endpoint if recorder else 'none', operation=operation)
+    if recorder:
+        with recorder.lock:
+            entry = recorder.s3.setdefault(operation, {"requests": 0, "bytes": 0})
+            entry["requests"] += 1
+            entry["bytes"] += size
+    _add_cost('s3', prices().get(f"s3_{operation}_per_1000", 0.0) / 1000)
+
+
+def install(app, paths):
+    """Gives each POST request to the given paths its own UsageRecorder."""
+    guarded_paths = set(paths)
+
+    @app.middleware("http")
+    async def record_usage(request, call_next):
+        if request.method != 'POST' or request.url.path not in guarded_paths:
+            return await call_next(request)
+        # call_next runs the route in a task copying this context, so it shares the recorder
+        with scope(request.url.path):
+            return await call_next(request)
@@ -0,0 +1,192 @@
+"""
+Multimodal video analysis
+Samples keyframes from a video with ffmpeg and describes each one with Nova
+(ImageToTextPipeline.describe_image) while the Transcribe job is running, so
+the visual analysis overlaps the transcription wait instead of adding to it.
+The frame descriptions and the transcript are then merged into the content
+of a single Bedrock flow invocation.
+
+Requires ffmpeg and ffprobe on PATH (or FFMPEG_PATH / FFPROBE_PATH). Without
+them the video is analysed from its transcript alone.
+
+Configuration:
+- KEYFRAME_COUNT: frames sampled per video, evenly spaced (default 6)
+- KEYFRAME_MAX_WIDTH: frames are scaled down to this width (default 768)
+- KEYFRAME_WORKERS: frames described concurrently across all requests (default 4)
+"""
+import contextvars
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import progress
+
+FRAME_PROMPT = (
+    "Describe this frame from a video in detail, including people, gestures, clothing, "
+    "symbols, visible text, setting and activities."
+)
+
+VISUAL_SECONDS = metrics.histogram('video_visual_analysis_seconds',
+                                   'Time from submitting a video\'s keyframes to the last description')
+VISUAL_WAIT = metrics.histogram('video_visual_wait_seconds',
+                                'Time a multimodal job waited for frame analysis after its transcript was ready')
+FRAMES_DESCRIBED = metrics.counter('video_frames_described_total', 'Keyframes sent to Nova for description')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv('KEYFRAME_WORKERS', '4')),
+                                           thread_name_prefix='keyframes')
+        return _executor
+
+
+def submit(func, *args):
+    """Runs func on the keyframe executor with the caller's context variables."""
+    context = contextvars.copy_context()
+    return get_executor().submit(context.run, func, *args)
+
+
+def probe_duration(video_file):
+    """Returns the video duration in seconds, using ffprobe."""
+    output = subprocess.run(
+        [os.getenv('FFPROBE_PATH', 'ffprobe'), '-v', 'error', '-show_entries', 'format=duration',
+         '-of', 'default=noprint_wrappers=1:nokey=1', video_file],
+        capture_output=True, text=True, check=True, timeout=30
+    ).stdout
+    return float(output.strip())
+
+
+def extract_keyframes(video_file, count=None, max_width=None):
+    """
+    Samples `count` evenly spaced frames from the video as JPEG files.
+    Returns tuple: (frames, logs, success) where frames is a list of
+    (timestamp_seconds, frame_path); the caller removes the frames' directory
+    """
+    logs = []
+    count = count or int(os.getenv('KEYFRAME_COUNT', '6'))
+    max_width = max_width or int(os.getenv('KEYFRAME_MAX_WIDTH', '768'))
+    frames_dir = tempfile.mkdtemp(prefix='keyframes_')
+    try:
+        duration = probe_duration(video_file)
+        logs.append(f"Video duration: {duration:.1f}s, sampling {count} frames")
+
+        frames = []
+        for index in range(count):
+            # Centre of each of `count` equal segments, so the first and last frames are not black
+            timestamp = duration * (index + 0.5) / count
+            frame_path = os.path.join(frames_dir, f"frame_{index:03d}.jpg")
+            # -ss before -i seeks in the input instead of decoding everything up to the timestamp
+            subprocess.run(
+                [os.getenv('FFMPEG_PATH', 'ffmpeg'), '-v', 'error', '-y', '-ss', f"{timestamp:.3f}",
+                 '-i', video_file, '-frames:v', '1', '-vf', f"scale='min({max_width},iw)':-2",
+                 '-q:v', '3', frame_path],
+                capture_output=True, check=True, timeout=60
+            )
+            if os.path.exists(frame_path):
+                frames.append((timestamp, frame_path))
+
+        logs.append(f"Extracted {len(frames)} keyframes")
+        return frames, logs, bool(frames)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        shutil.rmtree(frames_dir, ignore_errors=True)
+        logs.append(f"Keyframe extraction unavailable: {str(e)}")
+        return [], logs, False
+
+
+def discard_frames(frames):
+    """Removes extracted frames that will not be described."""
+    if frames:
+        shutil.rmtree(os.path.dirname(frames[0][1]), ignore_errors=True)
+
+
+def _describe(pipeline, timestamp, path):
+    description, logs, success = pipeline.describe_image(path, pipeline.tier['frame_prompt'] or FRAME_PROMPT)
+    if success:
+        progress.emit("keyframe_described", time=round(timestamp, 2), description=description)
+    return description, logs, success, time.monotonic()
+
+
+class VisualAnalysis:
+    """
+    Keyframe descriptions for one video, running in the background from the
+    moment it is created; result() collects them.
+    """
+    def __init__(self, frames, logs=None, image_pipeline=None, tier=None):
+        from image_checker import ImageToTextPipeline
+
+        self.frames = frames
+        self.logs = list(logs or [])
+        self.started = time.monotonic()
+        pipeline = image_pipeline or ImageToTextPipeline(tier=tier)
+        self.pending = [(timestamp, submit(_describe, pipeline, timestamp, path)) for timestamp, path in frames]
+
+    def result(self):
+        """
+        Waits for every frame, then removes the frame files.
+        Returns tuple: (findings, logs, success) where findings is a list of
+        {"time": seconds, "description": text} for the frames that succeeded
+        """
+        findings = []
+        finished = self.started
+        try:
+            for timestamp, future in self.pending:
+                description, frame_logs, success, finished_at = future.result()
+                finished = max(finished, finished_at)
+                FRAMES_DESCRIBED.inc(outcome='success' if success else 'failed')
+                if success:
+                    findings.append({"time": round(timestamp, 2), "description": description})
+                else:
+                    self.logs.append(f"Frame at {timestamp:.1f}s not described: "
+                                     f"{frame_logs[-1] if frame_logs else 'unknown error'}")
+        finally:
+            discard_frames(self.frames)
+        if self.pending:
+            VISUAL_SECONDS.observe(finished - self.started)
+        self.logs.append(f"Described {len(findings)} of {len(self.frames)} keyframes")
+        return findings, self.logs, bool(findings)
+
+    def cancel(self):
+        """
+        Drops the frames not yet sent to Nova, e.g. when the job failed first.
+        The frame files are removed once the descriptions already running finish.
+        No effect after result().
+        """
+        running = []
+        for _, future in self.pending:
+            if future.cancel():
+                FRAMES_DESCRIBED.inc(outcome='cancelled')
+            elif not future.done():
+                running.append(future)
+        if not running:
+            discard_frames(self.frames)
+            return
+        lock = threading.Lock()
+        left = [len(running)]
+
+        def finished(_):
+            with lock:
+                left[0] -= 1
+                last = left[0] == 0
+            if last:
+                discard_frames(self.frames)
+
+        for future in running:
+            future.add_done_callback(finished)
+
+
+def merge_findings(transcript_text, findings):
+    """Builds the flow input content from the transcript and the keyframe descriptions."""
+    if not findings:
+        return transcript_text
+    lines = [f"[{int(item['time'] // 60):02d}:{int(item['time'] % 60):02d}] {item['description']}" for item in findings]
+    return f"Transcript:\n{transcript_text}\n\nVisual content (keyframes):\n" + "\n".join(lines)